@@ -43,11 +43,14 @@ export default function Admin() {
 
   const fetchData = async (authToken) => {
     try {
-      const res = await axios.get('/api/admin/data', {
-        headers: { 'X-Admin-Token': authToken }
-      });
+      const [res, statsRes] = await Promise.all([
+        axios.get('/api/admin/data', {
+          headers: { 'X-Admin-Token': authToken }
+        }),
+        axios.get('/api/stats').catch(() => null),
+      ]);
       if (res.data.status === 'success') {
-        processData(res.data.data);
+        processData(res.data.data, statsRes ? statsRes.data : null);
       }
     } catch (err) {
       console.error(err);
@@ -92,75 +95,21 @@ export default function Admin() {
     }
   };
 
-  const processData = (rawData) => {
-    // Calculate stats
-    const scores = rawData.map(d => d.avg_gpa).filter(s => s !== null);
-    
-    if (scores.length === 0) {
-        setData(rawData);
-        return;
-    }
-
-    const mean = scores.reduce((a, b) => a + b, 0) / scores.length;
-    const variance = scores.reduce((a, b) => a + Math.pow(b - mean, 2), 0) / scores.length;
-    const stdev = Math.sqrt(variance);
-
-    // Calculate Rank and Deviation for each student
-    const processed = rawData.map(d => {
-        const score = d.avg_gpa;
-        let deviation = 50;
-        if (stdev > 0 && score !== null) {
-            deviation = 50 + 10 * (score - mean) / stdev;
-        }
-        return { ...d, deviation, score };
-    });
-
-    // Calculate Rank
-    // Sort by score desc
-    const sorted = [...processed].sort((a, b) => (b.score || 0) - (a.score || 0));
-    
-    // Assign rank
-    sorted.forEach((d, i) => {
-        // Handle ties? Simple rank for now
-        d.rank = i + 1;
-    });
-
-    // Re-sort by original order or ID? Let's keep sorted by rank for table
+  const processData = (rawData, serverStats) => {
+    // Mean, stdev, histogram, rank and deviation are computed by the backend (/stats)
+    const sorted = [...rawData].sort((a, b) => (b.avg_gpa || 0) - (a.avg_gpa || 0));
     setData(sorted);
 
-    // Calculate Distribution for Graph (Histogram)
-    const distData = [];
-    const minScore = 0;
-    const maxScore = 9.0;
-    const step = 0.2;
-
-    // Initialize bins
-    const bins = {};
-    // Create keys like "0.0", "0.2", ... "8.8", "9.0"
-    for (let x = minScore; x < maxScore + step/2; x += step) {
-        bins[x.toFixed(1)] = 0;
+    if (serverStats && serverStats.status === 'success' && serverStats.total > 0) {
+        setStats({
+            mean: serverStats.mean,
+            stdev: serverStats.stdev,
+            total: serverStats.total,
+            distribution: serverStats.distribution,
+        });
+    } else {
+        setStats(null);
     }
-
-    // Fill bins
-    scores.forEach(s => {
-        // Find closest lower bin
-        // e.g. 2.35 -> 2.2
-        const binVal = Math.floor(s / step) * step;
-        // Clamp to maxScore just in case
-        const clamped = Math.min(binVal, maxScore);
-        const key = clamped.toFixed(1);
-        if (bins[key] !== undefined) {
-            bins[key]++;
-        }
-    });
-
-    // Convert to array
-    for (let x = minScore; x < maxScore + step/2; x += step) {
-        const key = x.toFixed(1);
-        distData.push({ score: key, count: bins[key] || 0 });
-    }
-
-    setStats({ mean, stdev, total: scores.length, distribution: distData });
   };
 
   if (!isLoggedIn) {
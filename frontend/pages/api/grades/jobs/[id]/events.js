@@ -0,0 +1,50 @@
+import http from 'http';
+
+export const config = {
+  api: {
+    responseLimit: false,
+  },
+};
+
+// Relay the backend's Server-Sent Events stream for a grade job
+export default function handler(req, res) {
+  if (req.method !== 'GET') {
+    return res.status(405).json({ message: 'Method not allowed' });
+  }
+
+  const { id } = req.query;
+  const backendUrl = new URL(
+    `/grades/jobs/${encodeURIComponent(id)}/events`,
+    process.env.BACKEND_URL || 'http://127.0.0.1:8001',
+  );
+
+  const backendReq = http.get(backendUrl, (backendRes) => {
+    if (backendRes.statusCode !== 200) {
+      res.status(backendRes.statusCode);
+      res.setHeader('Content-Type', 'application/json');
+      backendRes.pipe(res);
+      return;
+    }
+    res.writeHead(200, {
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache, no-transform',
+      Connection: 'keep-alive',
+      'X-Accel-Buffering': 'no',
+    });
+    res.flushHeaders();
+    backendRes.on('data', (chunk) => res.write(chunk));
+    backendRes.on('end', () => res.end());
+  });
+
+  backendReq.on('error', (error) => {
+    console.error('SSE proxy error:', error.message);
+    if (!res.headersSent) {
+      res.status(500).json({ message: 'Internal Server Error', error: error.message });
+    } else {
+      res.end();
+    }
+  });
+
+  // Stop relaying when the browser goes away
+  req.on('close', () => backendReq.destroy());
+}
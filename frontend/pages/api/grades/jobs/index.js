@@ -0,0 +1,42 @@
+import http from 'http';
+
+export const config = {
+  api: {
+    bodyParser: false,
+  },
+};
+
+// Forward the login form to the backend as-is; the backend answers right away with a job id
+export default function handler(req, res) {
+  if (req.method !== 'POST') {
+    return res.status(405).json({ message: 'Method not allowed' });
+  }
+
+  const backendUrl = new URL('/grades/jobs', process.env.BACKEND_URL || 'http://127.0.0.1:8001');
+
+  const backendReq = http.request(backendUrl, {
+    method: 'POST',
+    headers: {
+      'content-type': req.headers['content-type'],
+      ...(req.headers['content-length'] && { 'content-length': req.headers['content-length'] }),
+    },
+    timeout: 30000,
+  }, (backendRes) => {
+    res.status(backendRes.statusCode);
+    if (backendRes.headers['retry-after']) {
+      res.setHeader('Retry-After', backendRes.headers['retry-after']);
+    }
+    res.setHeader('Content-Type', backendRes.headers['content-type'] || 'application/json');
+    backendRes.pipe(res);
+  });
+
+  backendReq.on('timeout', () => backendReq.destroy(new Error('Backend timeout')));
+  backendReq.on('error', (error) => {
+    console.error('Proxy error:', error.message);
+    if (!res.headersSent) {
+      res.status(500).json({ message: 'Internal Server Error', error: error.message });
+    }
+  });
+
+  req.pipe(backendReq);
+}
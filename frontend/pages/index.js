@@ -2,6 +2,25 @@ import { useState, useEffect } from 'react';
 import Head from 'next/head';
 import axios from 'axios';
 
+// Progress (%) and message shown for each phase reported by the backend job
+const PHASE_PROGRESS = {
+  queued: 5,
+  login: 15,
+  portal: 40,
+  grade_page: 55,
+  parse: 75,
+  db_write: 90,
+};
+
+const PHASE_LABELS = {
+  queued: '順番待ちしてます',
+  login: 'ログインしてます',
+  portal: 'MyWasedaに接続してます',
+  grade_page: '成績ページを開いてます',
+  parse: '成績を読み取ってます',
+  db_write: '集計してます',
+};
+
 export default function Home() {
   const [username, setUsername] = useState('');
   const [password, setPassword] = useState('');
@@ -9,6 +28,7 @@ export default function Home() {
   const [result, setResult] = useState(null);
   const [errorMsg, setErrorMsg] = useState('');
   const [progress, setProgress] = useState(0);
+  const [phase, setPhase] = useState('queued');
 
   const pageTitle = stage === 'result'
     ? '計算結果'
@@ -16,42 +36,67 @@ export default function Home() {
       ? 'ログイン失敗'
       : '総機GPA計算機';
 
+  // Wait for the grade job to finish, following its progress over Server-Sent Events
+  const waitForJob = (jobId) => new Promise((resolve, reject) => {
+    const source = new EventSource(`/api/grades/jobs/${jobId}/events`);
+    source.addEventListener('phase', (event) => {
+      const { phase: current } = JSON.parse(event.data);
+      if (PHASE_PROGRESS[current] !== undefined) {
+        setPhase(current);
+        setProgress(PHASE_PROGRESS[current]);
+      }
+    });
+    source.addEventListener('result', (event) => {
+      source.close();
+      const { status_code: statusCode, result: jobResult } = JSON.parse(event.data);
+      resolve({ statusCode, jobResult });
+    });
+    source.onerror = () => {
+      source.close();
+      // The stream dropped: fall back to polling the job state
+      pollJob(jobId).then(resolve, reject);
+    };
+  });
+
+  const pollJob = async (jobId) => {
+    for (;;) {
+      const response = await axios.get(`/api/grades/jobs/${jobId}`);
+      const job = response.data;
+      if (PHASE_PROGRESS[job.phase] !== undefined) {
+        setPhase(job.phase);
+        setProgress(PHASE_PROGRESS[job.phase]);
+      }
+      if (job.result) {
+        return { statusCode: job.status_code, jobResult: job.result };
+      }
+      await new Promise((r) => setTimeout(r, 2000));
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     setStage('loading');
     setErrorMsg('');
+    setPhase('queued');
     setProgress(0);
 
-    // Simulate progress
-    const interval = setInterval(() => {
-      setProgress((prev) => {
-        if (prev >= 95) return prev;
-        // Slow down as we get closer to 95
-        // 0-30: Fast (Connection)
-        // 30-80: Medium (Login & Navigation)
-        // 80-95: Slow (Waiting for response)
-        const increment = prev < 30 ? 2 : prev < 80 ? 0.5 : 0.1;
-        return Math.min(prev + increment, 95);
-      });
-    }, 100);
-
     const formData = new FormData();
     formData.append('username', username);
     formData.append('password', password);
 
     try {
-      // Use relative path /api/grades which is proxied to backend by Next.js
-      const response = await axios.post('/api/grades', formData, {
+      // Register a grade job; the backend answers immediately with its id
+      const response = await axios.post('/api/grades/jobs', formData, {
         headers: {
           'Content-Type': 'multipart/form-data',
         },
       });
 
-      clearInterval(interval);
+      const { statusCode, jobResult } = await waitForJob(response.data.job_id);
       setProgress(100);
 
-      if (response.data.status === 'success') {
-        setResult(response.data);
+      if (statusCode < 400 && jobResult.status === 'success') {
+        setResult(jobResult);
         setStage('auth_success');
         
         // Show "Auth Success" for 2 seconds, then show result
@@ -59,11 +104,10 @@ export default function Home() {
           setStage('result');
         }, 2000);
       } else {
-        setErrorMsg(response.data.message || 'Unknown error occurred');
+        setErrorMsg(jobResult.message || 'Unknown error occurred');
         setStage('error');
       }
     } catch (err) {
-      clearInterval(interval);
       console.error(err);
       setErrorMsg(err.response?.data?.message || 'Connection failed');
       setStage('error');
@@ -107,7 +151,7 @@ export default function Home() {
       {stage === 'loading' && (
         <div className="loading">
           <h1>処理中...</h1>
-          <p>ログインしてます</p>
+          <p>{PHASE_LABELS[phase]}</p>
           <div className="progress-text">{Math.round(progress)}%</div>
           <div className="progress-container">
             <div className="progress-bar" style={{ width: `${progress}%` }}></div>
@@ -126,6 +170,9 @@ export default function Home() {
         <div className="result-container">
           <div className="label">必修科目平均点</div>
           <div className="result">{result.average_score}</div>
+          {result.rank && (
+            <p>順位: {result.rank} / {result.total_students}人　偏差値: {result.deviation_score}</p>
+          )}
           
           <p>Student ID: {result.student_id}</p>
           <button onClick={handleRetry}>もう見ました、満足！
@@ -5,6 +5,9 @@ import sys
 import os
 import threading
 import datetime
+import json
+import urllib.error
+import urllib.request
 
 # Force unbuffered output
 sys.stdout.reconfigure(line_buffering=True)
@@ -61,6 +64,25 @@ def start_stream_forwarder(stream, target):
     t.start()
     return t
 
+BACKEND_READY_URL = "http://127.0.0.1:8001/readyz"
+# The backend retries the database for up to 50 seconds, so allow a bit more than that
+BACKEND_READY_TIMEOUT = float(os.environ.get("BACKEND_READY_TIMEOUT", "90"))
+
+def check_backend_ready():
+    """/readyz を1回問い合わせる。(準備完了か, 状態の説明) を返す"""
+    try:
+        with urllib.request.urlopen(BACKEND_READY_URL, timeout=2):
+            return True, "ready"
+    except urllib.error.HTTPError as e:
+        # 503 while starting up: report which components are still pending or failed
+        try:
+            checks = json.loads(e.read().decode("utf-8")).get("checks", {})
+            return False, ", ".join(f"{name}={c.get('status')}" for name, c in checks.items())
+        except Exception:
+            return False, f"HTTP {e.code}"
+    except (OSError, ValueError):
+        return False, "not listening"
+
 def cleanup_stale_processes():
     print("Cleaning up stale Chrome/Driver processes...")
     try:
@@ -139,7 +161,10 @@ def run_server():
              
         backend_env = os.environ.copy()
         backend_env["PYTHONUNBUFFERED"] = "1"
-        backend_cmd = [backend_python, "-u", "main.py"]
+        # Through uvicorn rather than "python main.py": cpu_pool's spawned workers re-import the
+        # parent's __main__ script, and main.py would pull FastAPI, selenium and every pool into each
+        backend_cmd = [backend_python, "-u", "-m", "uvicorn", "main:app",
+                       "--host", "0.0.0.0", "--port", "8001", "--timeout-keep-alive", "300"]
         backend_proc = subprocess.Popen(
             backend_cmd,
             cwd=backend_dir,
@@ -153,24 +178,28 @@ def run_server():
         stream_threads.append(start_stream_forwarder(backend_proc.stdout, sys.stdout))
         stream_threads.append(start_stream_forwarder(backend_proc.stderr, sys.stderr))
         
-        # Wait for backend to be ready
-        print("Waiting for backend to start on port 8001...")
+        # Wait until the backend reports its database, chromedriver and hisshu list as ready
+        print(f"Waiting for backend readiness ({BACKEND_READY_URL})...")
         backend_ready = False
-        for _ in range(30):  # Wait up to 30 seconds
+        deadline = time.monotonic() + BACKEND_READY_TIMEOUT
+        last_status = None
+        while time.monotonic() < deadline:
             if backend_proc.poll() is not None:
                 print(f"Backend process exited unexpectedly with code {backend_proc.returncode}")
                 break
-            
-            try:
-                with socket.create_connection(("127.0.0.1", 8001), timeout=1):
-                    backend_ready = True
-                    print("Backend is ready!")
-                    break
-            except (OSError, ConnectionRefusedError):
-                time.sleep(1)
-        
+
+            ready, status = check_backend_ready()
+            if ready:
+                backend_ready = True
+                print("Backend is ready!")
+                break
+            if status != last_status:
+                print(f"Backend not ready yet: {status}")
+                last_status = status
+            time.sleep(1)
+
         if not backend_ready and backend_proc.poll() is None:
-             print("Warning: Backend did not respond on port 8001 within 30 seconds.")
+             print(f"Warning: Backend was not ready within {BACKEND_READY_TIMEOUT:g} seconds. Starting frontend anyway.")
         
         # Start Frontend
         print("Starting Frontend (Next.js)...")
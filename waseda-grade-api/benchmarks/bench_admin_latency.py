@@ -0,0 +1,102 @@
+"""管理APIの遅いクエリが他のリクエストを止めないことを確認する
+
+MySQLの代わりにsleepする接続で、/admin/data を並列に呼びながら /metrics の応答時間を測る。
+
+    python benchmarks/bench_admin_latency.py [--query-seconds 0.5] [--admin-calls 5] [--inline]
+
+--inline を付けると、DB処理をイベントループ上で直接実行した場合（変更前の動作）を測る。
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+
+class SlowCursor:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def execute(self, *args):
+        time.sleep(self.seconds)
+
+    def fetchall(self):
+        return [{"student_id": "x", "avg_gpa": 7.0, "timestamp": datetime.datetime.now()}]
+
+    def close(self):
+        pass
+
+
+class SlowConnection:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def cursor(self, **kwargs):
+        return SlowCursor(self.seconds)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+async def run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+async def measure(query_seconds, admin_calls, probes):
+    main.get_db_connection = lambda: SlowConnection(query_seconds)
+    main.verify_token = lambda token: True
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def probe():
+            # Latency is measured from when each probe was due, so time spent
+            # waiting for a blocked event loop counts against it.
+            interval = query_seconds / probes
+            first = time.perf_counter()
+            latencies = []
+            for i in range(probes):
+                due = first + i * interval
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                response = await client.get("/metrics")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - due)
+            return latencies
+
+        started = time.perf_counter()
+        admin = [client.get("/admin/data", headers={"X-Admin-Token": "bench"}) for _ in range(admin_calls)]
+        results = await asyncio.gather(probe(), *admin)
+        elapsed = time.perf_counter() - started
+    latencies = results[0]
+    assert all(r.status_code == 200 for r in results[1:])
+    return latencies, elapsed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--query-seconds", type=float, default=0.5)
+    parser.add_argument("--admin-calls", type=int, default=5)
+    parser.add_argument("--probes", type=int, default=10)
+    parser.add_argument("--inline", action="store_true", help="run DB calls on the event loop (old behaviour)")
+    args = parser.parse_args()
+
+    if args.inline:
+        main.run_db = run_inline
+    latencies, elapsed = asyncio.run(measure(args.query_seconds, args.admin_calls, args.probes))
+    latencies.sort()
+    mode = "inline" if args.inline else "executor"
+    print(f"[BENCH] mode={mode} admin_calls={args.admin_calls} query={args.query_seconds}s total={elapsed:.2f}s")
+    print(f"[BENCH] /metrics latency: p50={latencies[len(latencies) // 2] * 1000:.1f}ms "
+          f"max={latencies[-1] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main_cli()
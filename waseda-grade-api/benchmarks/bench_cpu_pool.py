@@ -0,0 +1,84 @@
+"""CPUを使う処理（成績ページの解析 + GPA計算）を、複数のリクエストスレッドから同時に実行した場合の比較
+
+    python benchmarks/bench_cpu_pool.py [--threads 8] [--tasks 200] [--workers 4]
+
+同じ仕事を「スレッド内でそのまま実行（CPU_POOL_WORKERS=0 と同じ）」と「cpu_poolのワーカープロセス」で実行し、
+スループットと1件あたりの時間（p50/p95）、プールの待ち時間・計算時間を表示する。
+ワーカーを使って速くなるのはCPUが2つ以上ある場合だけ（1つなら inline の方が速い）。
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from cpu_pool import CpuPool  # noqa: E402
+from extraction import extract_from_html, grades_from_rows  # noqa: E402
+from gpa import calculate_gpa_for_text  # noqa: E402
+from bench_extraction import synthetic_page  # noqa: E402
+from bench_gpa_engine import HISSHU_CSV  # noqa: E402
+
+
+def run(pool, pages, hisshu_text, threads, tasks):
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(tasks))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            page = pool.run(extract_from_html, pages[i % len(pages)], "http")
+            pool.run(calculate_gpa_for_text, grades_from_rows(page.rows), hisshu_text)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    ths = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in ths:
+        t.start()
+    for t in ths:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return tasks / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8, help="concurrent request threads")
+    parser.add_argument("--tasks", type=int, default=200, help="students to process")
+    parser.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument("--rows", type=int, default=80)
+    args = parser.parse_args()
+
+    with open(HISSHU_CSV, encoding="utf-8") as f:
+        hisshu_text = f.read()
+    rng = random.Random(0)
+    pages = [synthetic_page(f"1X24B{i:03d}", args.rows, rng) for i in range(20)]
+    print(f"[BENCH] cpus={os.cpu_count()} threads={args.threads} tasks={args.tasks} workers={args.workers}")
+
+    for label, pool in [("inline", CpuPool(workers=0)), (f"pool({args.workers})", CpuPool(workers=args.workers))]:
+        started = time.perf_counter()
+        pool.start()
+        warm = time.perf_counter() - started
+        try:
+            throughput, p50, p95 = run(pool, pages, hisshu_text, args.threads, args.tasks)
+        finally:
+            pool.shutdown()
+        tasks = pool.stats()["tasks"]["extract_from_html"]
+        print(f"[BENCH] {label:<9} {throughput:7.1f} students/s  p50 {p50 * 1000:6.1f} ms  p95 {p95 * 1000:6.1f} ms  "
+              f"parse queue {tasks['queue_seconds_avg'] * 1000:.1f} ms / compute {tasks['compute_seconds_avg'] * 1000:.1f} ms  "
+              f"(warm-up {warm:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
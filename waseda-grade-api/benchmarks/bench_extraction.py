@@ -0,0 +1,163 @@
+"""成績ページの取り出し方法の比較（1人あたりの転送バイト数と解析時間）
+
+    python benchmarks/bench_extraction.py [--students 200] [--rows 80] [--browser]
+
+架空の成績ページ（成績の行・見出し行・メニューやスクリプトなど）を学生毎に作り、
+- bs4:    driver.page_source でHTML全体を受け取り、BeautifulSoupで解析して正規表現で学籍番号を探す
+- script: ページ内のスクリプトが返す成績の行と学籍番号だけのJSONを読む
+を比べる。--browser を付けるとヘッドレスChromeでページを開き、実際の execute_script / page_source の
+時間も測って、両方の結果（成績・学籍番号）が一致することを確認する（一致しなければ終了コード1）。
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import extract_from_driver, extract_from_html, grades_from_rows, rows_from_html  # noqa: E402
+
+SUBJECTS = ["機械力学", "材料力学", "熱力学", "流体力学", "線形代数", "微分積分", "確率統計",
+            "機械設計製図", "制御工学", "英語", "プログラミング演習", "物理実験"]
+GRADES = ["A+", "A", "B", "C", "F", "P", "＊"]
+
+
+def synthetic_page(student_id, n_rows, rng):
+    """成績照会ページに似せたHTML（成績の行以外のマークアップも含む）"""
+    rows = []
+    for i in range(n_rows):
+        if i % 15 == 0:
+            # Section header rows have an empty year column
+            rows.append('<tr class="operationboxf"><td colspan="1"><b>&nbsp;専門科目</b></td>'
+                        '<td></td><td></td><td></td><td></td><td></td></tr>')
+            continue
+        subject = f"{rng.choice(SUBJECTS)} {rng.choice('ABCD')}{i}"
+        rows.append(
+            '<tr class="operationboxf">'
+            f'<td class="subject"><font size="2">&nbsp;{subject}</font></td>'
+            f'<td align="center">{rng.choice(["2023", "2024"])}</td>'
+            f'<td align="center">{rng.choice(["春学期", "秋学期", "通年"])}</td>'
+            f'<td align="right"> {rng.choice([1, 2, 4])} </td>'
+            f'<td align="center"><b>{rng.choice(GRADES)}</b></td>'
+            f'<td align="right">{rng.choice(["4", "3", "2", "1", "0", ""])}</td>'
+            '</tr>'
+        )
+    menu = "".join(f'<li><a href="/kyomu/menu{i}.htm" onclick="return go({i})">メニュー項目{i}</a></li>'
+                   for i in range(40))
+    script = "<script>function go(i){ window.open('/kyomu/epb' + i + '.htm'); return false; }" + " " * 2000 + "</script>"
+    style = "<style>" + "".join(f".c{i}{{color:#{i:03d};padding:{i}px}}" for i in range(200)) + "</style>"
+    return (
+        f"<html><head><title>成績照会</title>{style}{script}</head><body>"
+        f'<div id="header"><ul>{menu}</ul></div>'
+        f'<table class="info"><tr><th>学籍番号</th><td>{student_id}</td><th>氏名</th><td>早稲田 太郎</td></tr></table>'
+        '<table class="operationbox"><tr class="operationboxh"><th>科目名</th><th>年度</th><th>学期</th>'
+        '<th>単位</th><th>評価</th><th>GP</th></tr>'
+        + "".join(rows)
+        + "</table></body></html>"
+    )
+
+
+def script_payload(html):
+    """EXTRACT_SCRIPT がこのページで返すJSON（ブラウザ無しの場合の見積もり）"""
+    return json.dumps({
+        "title": "成績照会" in html,
+        "list": "科目名" in html,
+        "student_id": extract_from_html(html).student_id,
+        "rows": rows_from_html(html),
+    }, ensure_ascii=False, separators=(",", ":"))
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - started)
+    return result, statistics.median(samples)
+
+
+def offline(pages, repeat):
+    html_bytes, json_bytes, bs4_times, json_times = [], [], [], []
+    for html in pages:
+        payload = script_payload(html)
+        html_bytes.append(len(html.encode("utf-8")))
+        json_bytes.append(len(payload.encode("utf-8")))
+        _, seconds = timed(lambda: grades_from_rows(extract_from_html(html).rows), repeat)
+        bs4_times.append(seconds)
+        _, seconds = timed(lambda: grades_from_rows(json.loads(payload)["rows"]), repeat)
+        json_times.append(seconds)
+    print(f"[BENCH] bytes per student:  bs4 {statistics.mean(html_bytes):,.0f}  script {statistics.mean(json_bytes):,.0f} "
+          f"({statistics.mean(html_bytes) / statistics.mean(json_bytes):.1f}x less)")
+    print(f"[BENCH] parse per student:  bs4 {statistics.mean(bs4_times) * 1000:.2f} ms  "
+          f"script {statistics.mean(json_times) * 1000:.3f} ms")
+
+
+def in_browser(pages):
+    from browser_pool import create_driver
+
+    driver = create_driver()
+    failures = 0
+    bs4_times, script_times, bs4_bytes, script_bytes = [], [], [], []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, html in enumerate(pages):
+                path = os.path.join(tmp, f"grades{i}.html")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(html)
+                driver.get(f"file://{path}")
+
+                started = time.perf_counter()
+                bs4_page = extract_from_html(driver.page_source)
+                bs4_times.append(time.perf_counter() - started)
+                bs4_bytes.append(bs4_page.payload_bytes)
+
+                started = time.perf_counter()
+                script_page = extract_from_driver(driver)
+                script_times.append(time.perf_counter() - started)
+                script_bytes.append(script_page.payload_bytes)
+
+                expected = (grades_from_rows(bs4_page.rows), bs4_page.student_id, bs4_page.on_search_page)
+                actual = (grades_from_rows(script_page.rows), script_page.student_id, script_page.on_search_page)
+                if expected != actual:
+                    failures += 1
+                    if failures <= 3:
+                        print(f"[PARITY] page {i}: bs4={expected} script={actual}")
+    finally:
+        driver.quit()
+
+    print(f"[BROWSER] bytes per student: page_source {statistics.mean(bs4_bytes):,.0f}  "
+          f"script {statistics.mean(script_bytes):,.0f}")
+    print(f"[BROWSER] time per student:  page_source + bs4 {statistics.mean(bs4_times) * 1000:.1f} ms  "
+          f"script {statistics.mean(script_times) * 1000:.1f} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=80, help="grade rows per page")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--browser", action="store_true", help="also measure in headless Chrome and check parity")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = [synthetic_page(f"1X{rng.choice(['23', '24'])}B{rng.randint(0, 999):03d}", args.rows, rng)
+             for _ in range(args.students)]
+    print(f"[BENCH] students={args.students} rows={args.rows}")
+    offline(pages, args.repeat)
+
+    if args.browser:
+        failures = in_browser(pages)
+        if failures:
+            print(f"[PARITY] {failures} mismatches")
+            sys.exit(1)
+        print("[PARITY] ok")
+
+
+if __name__ == "__main__":
+    main()
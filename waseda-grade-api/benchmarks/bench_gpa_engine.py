@@ -0,0 +1,119 @@
+"""GPA計算の一致確認とベンチマーク（架空の学生データ）
+
+    python benchmarks/bench_gpa_engine.py [--students 10000] [--seed 0]
+
+1. 以前の入れ子ループの実装（reference_gpa）と gpa.calculate_gpa の結果が完全に一致すること
+2. gpa.calculate_gpa と gpa.batch_gpa の結果が誤差1e-9以内で一致すること
+を確認してから、両方の所要時間を比べる。一致しなければ終了コード1で終わる。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gpa import batch_gpa, calculate_gpa, grade_matrix, weight_vector  # noqa: E402
+from hisshu import HisshuCatalog  # noqa: E402
+
+HISSHU_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                          "list", "hisshu.csv")
+GRADES = ["A+", "A", "B", "C", "F", "S", "P", "＊", "*A"]
+
+
+def reference_gpa(grades, hisshu_subjects):
+    """変更前の main.get_grades / recalc_gpa.calculate_gpa と同じ計算"""
+    point_map = {"A+": 9, "A": 8, "B": 7, "C": 6, "F": 0, "S": 0}
+    hisshu_best_matches = {}
+    total_weighted_points = 0
+    total_weighted_credits = 0
+    for g in grades:
+        subject = g["subject"]
+        grade = g["grade"]
+        if "＊" in grade or "*" in grade or "P" in grade:
+            continue
+        try:
+            credit = float(g["credit"])
+        except (TypeError, ValueError):
+            continue
+        matched_hisshu = None
+        for h in hisshu_subjects:
+            if h["name"] in subject:
+                matched_hisshu = h
+                break
+        if matched_hisshu:
+            h_name = matched_hisshu["name"]
+            p = point_map.get(grade, 0)
+            entry = {"points": p * credit * matched_hisshu["weight"],
+                     "w_credits": credit * matched_hisshu["weight"], "grade_val": p}
+            if h_name not in hisshu_best_matches or p > hisshu_best_matches[h_name]["grade_val"]:
+                hisshu_best_matches[h_name] = entry
+    for data in hisshu_best_matches.values():
+        total_weighted_points += data["points"]
+        total_weighted_credits += data["w_credits"]
+    if total_weighted_credits > 0:
+        return total_weighted_points / total_weighted_credits
+    return 0
+
+
+def synthetic_cohort(n, hisshu_subjects, rng):
+    """必修科目（再履修を含む）と一般科目を混ぜた成績リストをn人分作る"""
+    names = [h["name"] for h in hisshu_subjects]
+    students = []
+    for _ in range(n):
+        grades = []
+        for name in rng.sample(names, rng.randint(0, len(names))):
+            for _ in range(rng.choice([1, 1, 1, 2])):  # occasional retake
+                grades.append({"subject": f"{name}　{rng.choice(['', '01', '春'])}",
+                               "grade": rng.choice(GRADES), "credit": rng.choice(["1", "2", "2.0", "-"])})
+        for k in range(rng.randint(5, 40)):
+            grades.append({"subject": f"一般教養科目{k}", "grade": rng.choice(GRADES), "credit": "2"})
+        rng.shuffle(grades)
+        students.append(grades)
+    return students
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    hisshu = HisshuCatalog(paths=[HISSHU_CSV]).current()
+    matcher = hisshu.matcher
+    rng = random.Random(args.seed)
+    students = synthetic_cohort(args.students, hisshu.subjects, rng)
+
+    reference, reference_seconds = timed(lambda: [reference_gpa(g, hisshu.subjects) for g in students])
+    scalar, scalar_seconds = timed(lambda: [calculate_gpa(g, matcher)[0] for g in students])
+    (points, credits), matrix_seconds = timed(lambda: grade_matrix(students, matcher))
+    weights = weight_vector(matcher)
+    batch, batch_seconds = timed(lambda: batch_gpa(points, credits, weights))
+
+    failures = 0
+    for i, (ref, sca, bat) in enumerate(zip(reference, scalar, batch.tolist())):
+        if ref != sca or abs(sca - bat) > 1e-9:
+            failures += 1
+            if failures <= 5:
+                print(f"[PARITY] student {i}: reference={ref} scalar={sca} batch={bat}")
+
+    print(f"[BENCH] students={args.students} hisshu={len(hisshu.subjects)} version={hisshu.version}")
+    print(f"[BENCH] reference loop: {reference_seconds * 1000:.1f} ms")
+    print(f"[BENCH] scalar engine:  {scalar_seconds * 1000:.1f} ms")
+    print(f"[BENCH] batch engine:   {(matrix_seconds + batch_seconds) * 1000:.1f} ms "
+          f"(matrix {matrix_seconds * 1000:.1f} ms + vectorized {batch_seconds * 1000:.2f} ms)")
+    if failures:
+        print(f"[PARITY] {failures} mismatches")
+        sys.exit(1)
+    print("[PARITY] ok")
+
+
+if __name__ == "__main__":
+    main()
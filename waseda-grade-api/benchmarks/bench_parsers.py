@@ -0,0 +1,137 @@
+"""HTMLパーサーのベンチマーク
+
+    python benchmarks/bench_parsers.py [--repeat 20] [--rows 80]
+    python benchmarks/bench_parsers.py --update-golden
+
+変更前の実装（html.parserでページ全体を解析する）と parsers.py の各バックエンドの解析時間を、
+benchmarks/fixtures/ のページと大きめの架空の成績ページで比べる。
+結果が fixtures/golden.json と一致することは tests/test_parsers.py で確認する。
+--update-golden は変更前の実装で golden.json を作り直す（フィクスチャを追加した時）。
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from extraction import grades_from_rows  # noqa: E402
+from parsers import PARSERS  # noqa: E402
+from bench_extraction import synthetic_page  # noqa: E402
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+GOLDEN_PATH = os.path.join(FIXTURES_DIR, "golden.json")
+
+
+def reference_parse_grades(html_content):
+    """変更前の main.parse_grades"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    grades = []
+    for row in soup.find_all('tr', class_='operationboxf'):
+        cols = row.find_all('td')
+        if not cols:
+            continue
+        col_texts = [col.get_text(strip=True).replace('\xa0', ' ') for col in cols]
+        if len(col_texts) >= 6:
+            if not col_texts[1]:
+                continue
+            grades.append(dict(zip(["subject", "year", "semester", "credit", "grade", "gp"], col_texts[:6])))
+    return grades
+
+
+def reference_lab_preferences(html_content):
+    """変更前の main.parse_lab_preferences"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    preferences = {}
+    target_qtext = None
+    for q in soup.find_all('div', class_='que'):
+        qtext_div = q.find('div', class_='qtext')
+        if qtext_div:
+            text_content = qtext_div.get_text()
+            if '希望研究室' in text_content or '第1希望' in text_content:
+                target_qtext = qtext_div
+                break
+    if not target_qtext:
+        return None
+    for i in range(1, 7):
+        placed_span = target_qtext.select_one(f'span.placed.inplace{i}')
+        if placed_span:
+            preferences[f'第{i}希望'] = placed_span.get_text(strip=True)
+    recommendation_span = target_qtext.select_one('span.placed.inplace7.group2')
+    if recommendation_span:
+        recommendation_text = recommendation_span.get_text(strip=True)
+        preferences['自己推薦'] = recommendation_text == '希望する'
+        preferences['自己推薦_raw'] = recommendation_text
+    return preferences if preferences else None
+
+
+def load_fixtures():
+    fixtures = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+def reference_outputs(html):
+    return {"grades": reference_parse_grades(html), "lab_preferences": reference_lab_preferences(html)}
+
+
+def backend_outputs(parser, html):
+    return {"grades": grades_from_rows(parser.grade_rows(html)), "lab_preferences": parser.lab_preferences(html)}
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def benchmark(pages, repeat):
+    parsers = {name: cls() for name, cls in PARSERS.items()}
+    header = f"{'page':<24}{'bytes':>9}{'reference':>12}" + "".join(f"{name:>12}" for name in parsers)
+    print(header)
+    for name, (html, kind) in pages.items():
+        if kind == "grades":
+            reference = timed(lambda: reference_parse_grades(html), repeat)
+            times = {n: timed(lambda: grades_from_rows(p.grade_rows(html)), repeat) for n, p in parsers.items()}
+        else:
+            reference = timed(lambda: reference_lab_preferences(html), repeat)
+            times = {n: timed(lambda: p.lab_preferences(html), repeat) for n, p in parsers.items()}
+        print(f"{name:<24}{len(html.encode('utf-8')):>9,}{reference * 1000:>10.2f}ms"
+              + "".join(f"{t * 1000:>10.2f}ms" for t in times.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=80, help="grade rows in the synthetic page")
+    parser.add_argument("--update-golden", action="store_true", help="regenerate golden.json from the reference parsers")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    if args.update_golden:
+        golden = {name: reference_outputs(html) for name, html in fixtures.items()}
+        with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+            json.dump(golden, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"[GOLDEN] wrote {len(golden)} fixtures to {GOLDEN_PATH}")
+        return
+
+    pages = {name: (html, "grades" if name.startswith("grades") else "review") for name, html in fixtures.items()}
+    pages["synthetic_grades"] = (synthetic_page("1X24B001", args.rows, random.Random(0)), "grades")
+    benchmark(pages, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
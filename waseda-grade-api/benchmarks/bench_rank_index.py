@@ -0,0 +1,71 @@
+"""順位インデックスのベンチマーク（架空の学生データ）
+
+    python benchmarks/bench_rank_index.py [--students 100000] [--queries 10000]
+
+比較用に、毎回全件を並べ替えて順位を求める方法（ORDER BY相当）も測る。
+"""
+import argparse
+import bisect
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rank_index import RankIndex  # noqa: E402
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = [(f"{i:064x}", round(min(9.0, max(0.0, rng.gauss(6.5, 1.0))), 4)) for i in range(args.students)]
+    ids = [student_id for student_id, _ in rows]
+    probes = [rng.uniform(0, 9) for _ in range(args.queries)]
+
+    index = RankIndex()
+    _, load_seconds = timed(lambda: index.load(rows))
+
+    _, rank_seconds = timed(lambda: [index.rank(score) for score in probes])
+    _, pct_seconds = timed(lambda: [index.percentile(score) for score in probes])
+    updates = [(rng.choice(ids), round(rng.uniform(0, 9), 4)) for _ in range(args.queries)]
+    _, upsert_seconds = timed(lambda: [index.upsert(student_id, score) for student_id, score in updates])
+
+    # Baseline: sort every score per request, as an ORDER BY on each /grades call would
+    baseline_queries = max(1, min(20, args.queries))
+    scores = [score for _, score in rows]
+
+    def sort_per_request():
+        for score in probes[:baseline_queries]:
+            ordered = sorted(scores)
+            len(ordered) - bisect.bisect_right(ordered, score) + 1
+
+    _, baseline_seconds = timed(sort_per_request)
+
+    # Spot-check ranks against a full recount
+    current = list(index._scores.values())
+    for score in probes[:100]:
+        assert index.rank(score) == sum(1 for s in current if s > score) + 1
+
+    per = lambda seconds, n: seconds / n * 1e6  # noqa: E731
+    print(f"[BENCH] students={args.students} queries={args.queries}")
+    print(f"[BENCH] load:       {load_seconds * 1000:.1f} ms")
+    print(f"[BENCH] rank:       {per(rank_seconds, args.queries):.2f} us/query")
+    print(f"[BENCH] percentile: {per(pct_seconds, args.queries):.2f} us/query")
+    print(f"[BENCH] upsert:     {per(upsert_seconds, args.queries):.2f} us/update")
+    print(f"[BENCH] sort per request (baseline): {per(baseline_seconds, baseline_queries):.0f} us/query")
+
+
+if __name__ == "__main__":
+    main()
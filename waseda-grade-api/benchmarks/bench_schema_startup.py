@@ -0,0 +1,77 @@
+"""起動時のスキーマ処理の所要時間を、以前のinit_db（CREATE TABLE + 毎回失敗するALTER 8回）とマイグレーションで比べる
+
+    MYSQL_HOST=127.0.0.1 python benchmarks/bench_schema_startup.py [--runs 20]
+
+実際のMySQLが必要。スキーマが最新になった状態（2回目以降の起動）を測る。
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+from db import get_db_connection  # noqa: E402
+
+
+def legacy_init_db():
+    """変更前のinit_dbのスキーマ処理"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS gpadata (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            student_id VARCHAR(64) UNIQUE,
+            avg_gpa FLOAT,
+            timestamp DATETIME,
+            lab_choice_1 VARCHAR(50),
+            lab_choice_2 VARCHAR(50),
+            lab_choice_3 VARCHAR(50),
+            lab_choice_4 VARCHAR(50),
+            lab_choice_5 VARCHAR(50),
+            lab_choice_6 VARCHAR(50),
+            uses_recommendation BOOLEAN,
+            lab_updated_at DATETIME
+        )
+    """)
+    failures = 0
+    for column, definition in [(c, "VARCHAR(50)") for c in migrations.LAB_CHOICE_COLUMNS] + [
+            ("uses_recommendation", "BOOLEAN"), ("lab_updated_at", "DATETIME")]:
+        try:
+            cursor.execute(f"ALTER TABLE gpadata ADD COLUMN {column} {definition}")
+        except Exception:
+            failures += 1
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return failures
+
+
+def measure(func, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, max(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    migrations.migrate()  # bring the schema up to date first
+    failures = legacy_init_db()
+    legacy_median, legacy_max = measure(legacy_init_db, args.runs)
+    migrate_median, migrate_max = measure(lambda: migrations.migrate(), args.runs)
+
+    print(f"[BENCH] legacy init_db: median {legacy_median:.1f} ms, max {legacy_max:.1f} ms "
+          f"({failures} failing ALTERs per boot)")
+    print(f"[BENCH] migrations:     median {migrate_median:.1f} ms, max {migrate_max:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
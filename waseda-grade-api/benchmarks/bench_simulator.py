@@ -0,0 +1,62 @@
+"""重みの試算（/admin/simulate）のベンチマーク（架空の学生データ）
+
+    python benchmarks/bench_simulator.py [--students 10000] [--profiles 3]
+
+行列の作成（gradedataの読み込み後に一度だけ）と、試算1回の所要時間を分けて測る。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from gpa import batch_gpa, weight_vector  # noqa: E402
+from bench_gpa_engine import HISSHU_CSV, synthetic_cohort  # noqa: E402
+from hisshu import HisshuCatalog  # noqa: E402
+from simulator import Cohort, simulate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--profiles", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    hisshu = HisshuCatalog(paths=[HISSHU_CSV]).current()
+    rng = random.Random(args.seed)
+    students = {f"{i:08d}": grades for i, grades in enumerate(synthetic_cohort(args.students, hisshu.subjects, rng))}
+
+    started = time.perf_counter()
+    cohort = Cohort.from_grades(students, hisshu)
+    build_seconds = time.perf_counter() - started
+
+    names = [h["name"] for h in hisshu.subjects]
+    profiles = [
+        {"name": f"profile {k}", "weights": {name: rng.choice([0, 0.5, 1, 2, 3]) for name in rng.sample(names, 8)}}
+        for k in range(args.profiles)
+    ]
+    started = time.perf_counter()
+    result = simulate(cohort, profiles)
+    simulate_seconds = time.perf_counter() - started
+
+    # The baseline must match the batch GPA engine under the current weights
+    expected = batch_gpa(cohort.points, cohort.credits, weight_vector(hisshu.matcher))
+    assert abs(result["baseline"]["mean"] - float(expected.mean())) < 1e-9
+    assert sum(b["count"] for b in result["baseline"]["distribution"]) == args.students
+    assert np.isfinite([p["mean"] for p in result["profiles"]]).all()
+
+    print(f"[BENCH] students={args.students} profiles={args.profiles} hisshu={len(hisshu.subjects)}")
+    print(f"[BENCH] build matrix: {build_seconds * 1000:.1f} ms (cached between simulations)")
+    print(f"[BENCH] simulate:     {simulate_seconds * 1000:.1f} ms")
+    for p in result["profiles"]:
+        print(f"[BENCH]   {p['name']}: mean={p['mean']:.3f} stdev={p['stdev']:.3f} "
+              f"moved={p['rank_shift']['students_moved']} max_up={p['rank_shift']['max_up']}")
+
+
+if __name__ == "__main__":
+    main()
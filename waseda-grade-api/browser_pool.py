@@ -0,0 +1,335 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from resource_blocking import apply_policy, configure_options
+
+# Pool configuration (override with environment variables)
+POOL_SIZE = max(1, int(os.environ.get("CHROME_POOL_SIZE", "2")))
+POOL_MAX_USES = max(1, int(os.environ.get("CHROME_POOL_MAX_USES", "20")))
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("CHROME_POOL_CHECKOUT_TIMEOUT", "120"))
+
+# Origins whose storage is wiped when a session is returned to the pool
+RESET_ORIGINS = [
+    "https://my.waseda.jp",
+    "https://login.microsoftonline.com",
+    "https://coursereg.waseda.jp",
+    "https://gradereport-ty.waseda.jp",
+    "https://wsdmoodle.waseda.jp",
+]
+
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+
+def build_chrome_options():
+    """スクレイピング用のChromeオプションを作成する"""
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")  # Use new headless mode for better stability
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    # options.add_argument("--remote-debugging-port=9222") # Removed to avoid port conflicts
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-setuid-sandbox")
+    options.add_argument("--disable-application-cache")
+    options.add_argument("--disable-infobars")
+    options.add_argument("--disable-notifications")
+    options.add_argument("--disable-popup-blocking")
+    options.add_argument("--mute-audio")
+    options.add_argument("--disable-software-rasterizer")
+    options.add_argument("--disable-features=VizDisplayCompositor")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument(f"--user-agent={USER_AGENT}")
+    configure_options(options)
+    return options
+
+
+_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+
+
+def resolve_chromedriver():
+    """chromedriverの場所を一度だけ解決し、実行できるか確認する（結果はキャッシュ）"""
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path:
+            return _chromedriver_path
+        # Check if running in Docker (CHROMEDRIVER_PATH set)
+        path = os.environ.get("CHROMEDRIVER_PATH")
+        if not path:
+            # Try to find system installed chromedriver
+            path = shutil.which("chromedriver") or ChromeDriverManager().install()
+        version = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=15, check=True).stdout.strip()
+        print(f"Using chromedriver: {path} ({version})")
+        _chromedriver_path = path
+        return path
+
+
+def create_chrome_service():
+    """chromedriverのServiceを作成する"""
+    return Service(executable_path=resolve_chromedriver())
+
+
+def warm_up_chrome():
+    """使い捨てのChromeを1回起動して、バイナリをOSのページキャッシュに載せる"""
+    driver = create_driver()
+    try:
+        driver.get("about:blank")
+    finally:
+        driver.quit()
+
+
+def create_driver():
+    """新しいChromeセッションを起動する"""
+    driver = webdriver.Chrome(service=create_chrome_service(), options=build_chrome_options())
+    apply_policy(driver)
+    return driver
+
+
+class PooledSession:
+    """プールから貸し出されるChromeセッション"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.time()
+
+
+class ChromePool:
+    """事前起動したヘッドレスChromeセッションのプール"""
+
+    def __init__(self, size=POOL_SIZE, max_uses=POOL_MAX_USES, checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+                 driver_factory=create_driver):
+        self.size = size
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+        self.driver_factory = driver_factory
+        self._idle = []
+        self._total = 0  # idle + checked out + starting
+        self._waiting = 0
+        self._checked_out = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._counters = {
+            "created": 0,
+            "recycled": 0,
+            "discarded": 0,
+            "checkouts": 0,
+            "checkout_timeouts": 0,
+        }
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+
+    # --- lifecycle ---
+
+    def start(self):
+        """プールを埋めるChromeをバックグラウンドで起動する"""
+        with self._cond:
+            missing = self.size - self._total
+            self._total += max(0, missing)
+        for _ in range(max(0, missing)):
+            threading.Thread(target=self._spawn, daemon=True).start()
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for session in idle:
+            self._quit(session)
+
+    def _spawn(self):
+        """Chromeを1つ起動してidleリストに追加する（_totalは呼び出し側で確保済み）"""
+        try:
+            session = PooledSession(self.driver_factory())
+        except Exception as e:
+            print(f"[CHROME POOL] Failed to launch Chrome: {e}")
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            return None
+        with self._cond:
+            self._counters["created"] += 1
+            if self._closed:
+                self._total -= 1
+                closed = True
+            else:
+                self._idle.append(session)
+                closed = False
+            self._cond.notify()
+        if closed:
+            self._quit(session)
+        return session
+
+    # --- checkout / return ---
+
+    def acquire(self, timeout=None):
+        """セッションを借りる。空きが無ければ返却されるまで待つ"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            launch = False
+            with self._cond:
+                self._waiting += 1
+                try:
+                    while not self._idle and self._total >= self.size and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._counters["checkout_timeouts"] += 1
+                            raise TimeoutError(f"No Chrome session available within {timeout:g}s")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                if self._closed:
+                    raise RuntimeError("Chrome pool is shut down")
+                if self._idle:
+                    session = self._idle.pop()
+                else:
+                    self._total += 1
+                    launch = True
+            if launch:
+                try:
+                    session = PooledSession(self.driver_factory())
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._counters["created"] += 1
+            elif not self._is_healthy(session):
+                print("[CHROME POOL] Idle session failed health check, replacing")
+                self._discard(session)
+                continue
+            break
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._checked_out += 1
+            self._counters["checkouts"] += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._wait_last = waited
+        return session
+
+    def release(self, session, discard=False):
+        """セッションを返却する。リセットとヘルスチェックに失敗したら作り直す"""
+        session.uses += 1
+        with self._cond:
+            self._checked_out -= 1
+        if discard or session.uses >= self.max_uses:
+            with self._cond:
+                self._counters["recycled" if not discard else "discarded"] += 1
+            self._replace(session)
+            return
+        if not self._reset(session) or not self._is_healthy(session):
+            print("[CHROME POOL] Session reset failed, replacing")
+            with self._cond:
+                self._counters["discarded"] += 1
+            self._replace(session)
+            return
+        with self._cond:
+            if self._closed:
+                self._total -= 1
+                closed = True
+            else:
+                self._idle.append(session)
+                closed = False
+            self._cond.notify()
+        if closed:
+            self._quit(session)
+
+    @contextmanager
+    def session(self, timeout=None):
+        session = self.acquire(timeout)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    # --- maintenance ---
+
+    def _replace(self, session):
+        """セッションを終了し、代わりのChromeをバックグラウンドで起動する"""
+        self._quit(session)
+        with self._cond:
+            if self._closed:
+                self._total -= 1
+                self._cond.notify()
+                return
+        # _total stays reserved for the replacement
+        threading.Thread(target=self._spawn, daemon=True).start()
+
+    def _discard(self, session):
+        self._quit(session)
+        with self._cond:
+            self._counters["discarded"] += 1
+            self._total -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _quit(session):
+        try:
+            session.driver.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_healthy(session):
+        try:
+            return session.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(session):
+        """Cookie・ストレージ・余分なウィンドウを消して初期状態に戻す"""
+        driver = session.driver
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.get("about:blank")
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            for origin in RESET_ORIGINS:
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            return True
+        except Exception as e:
+            print(f"[CHROME POOL] Reset error: {e}")
+            return False
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._counters["checkouts"]
+            return {
+                "size": self.size,
+                "max_uses": self.max_uses,
+                "total": self._total,
+                "idle": len(self._idle),
+                "in_use": self._checked_out,
+                "starting": self._total - len(self._idle) - self._checked_out,
+                "waiting": self._waiting,
+                **self._counters,
+                "wait_seconds_avg": round(self._wait_total / checkouts, 3) if checkouts else 0.0,
+                "wait_seconds_max": round(self._wait_max, 3),
+                "wait_seconds_last": round(self._wait_last, 3),
+            }
+
+
+chrome_pool = ChromePool()
@@ -0,0 +1,182 @@
+import importlib
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker processes for CPU-bound work (HTML parsing, GPA math). 0 runs everything inline in the
+# calling thread. Default leaves one core for the event loop, Chrome and request threads; on a
+# single-vCPU box that means inline, since a worker process would only add IPC overhead.
+CPU_POOL_WORKERS = int(os.environ.get("CPU_POOL_WORKERS", str(max(0, min(4, (os.cpu_count() or 1) - 1)))))
+# Tasks submitted but not yet finished; further callers wait (and that wait counts as queue time)
+CPU_POOL_MAX_PENDING = int(os.environ.get("CPU_POOL_MAX_PENDING", str(max(1, CPU_POOL_WORKERS * 2))))
+
+
+def _init_worker():
+    # Import the task modules (lxml, numpy) and exercise the parser once so the first real task does not pay for it
+    importlib.import_module("gpa")
+    parsers = importlib.import_module("parsers")
+    parsers.html_parser.grade_rows("<table><tr class='operationboxf'><td>warm</td></tr></table>")
+
+
+def _warm():
+    # Hold the worker briefly so the warm-up tasks spread over every process
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def _main_is_app_script():
+    # spawn re-runs the parent's __main__ in each worker when it was started as a script path
+    # (`python -m ...` entry points are skipped), which for main.py means the whole backend
+    main_module = sys.modules.get("__main__")
+    return (getattr(main_module, "__spec__", None) is None
+            and os.path.basename(getattr(main_module, "__file__", None) or "") == "main.py")
+
+
+def _timed_call(func, args, kwargs):
+    """ワーカー内で実行し、(結果, 計算時間) を返す"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+class CpuPool:
+    """CPUを使う処理（HTML解析・GPA計算）を別プロセスで実行する。待ち時間と計算時間を記録する"""
+
+    def __init__(self, workers=CPU_POOL_WORKERS, max_pending=CPU_POOL_MAX_PENDING):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.max_pending = max_pending
+        self._stats_lock = threading.Lock()
+        self._tasks = {}
+        self._pending = 0
+        self.restarts = 0
+
+    def _create_executor(self):
+        # spawn, not fork: the server process has Chrome, DB and startup threads running
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def start(self):
+        """ワーカーを起動して、全員が準備できるまで待つ（workers=0なら何もしない）"""
+        if self.workers <= 0:
+            print("[CPU POOL] Running CPU-bound work inline")
+            return
+        if _main_is_app_script():
+            print("[CPU POOL] Started as 'python main.py': every worker re-imports main.py (FastAPI, selenium, pools). "
+                  "Start the backend with 'python -m uvicorn main:app' instead")
+        executor = self._create_executor()
+        # Non-fork pools start every worker on the first submit; wait until each has run its initializer
+        pids = set()
+        for _ in range(20):
+            pids |= {f.result() for f in [executor.submit(_warm) for _ in range(self.workers)]}
+            if len(pids) >= self.workers:
+                break
+        with self._lock:
+            self._executor = executor
+        print(f"[CPU POOL] {self.workers} workers ready (pids {sorted(pids)})")
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, name, inline, total, compute, error=False):
+        with self._stats_lock:
+            t = self._tasks.setdefault(name, {
+                "tasks": 0, "inline": 0, "errors": 0,
+                "queue_seconds": 0.0, "queue_seconds_max": 0.0,
+                "compute_seconds": 0.0, "compute_seconds_max": 0.0,
+            })
+            t["tasks"] += 1
+            t["inline"] += inline
+            t["errors"] += error
+            queued = max(0.0, total - compute)
+            t["queue_seconds"] += queued
+            t["queue_seconds_max"] = max(t["queue_seconds_max"], queued)
+            t["compute_seconds"] += compute
+            t["compute_seconds_max"] = max(t["compute_seconds_max"], compute)
+
+    def run(self, func, *args, **kwargs):
+        """funcをワーカーで実行して結果を返す（プールが無ければこのスレッドで実行）
+
+        funcと引数・戻り値はpickleできること（モジュールのトップレベルの関数）
+        """
+        name = func.__name__
+        executor = self._executor
+        if executor is None:
+            started = time.perf_counter()
+            error = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                self._record(name, True, elapsed, elapsed, error)
+
+        started = time.perf_counter()
+        self._slots.acquire()
+        with self._stats_lock:
+            self._pending += 1
+        try:
+            result, compute = executor.submit(_timed_call, func, args, kwargs).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM killed): replace the pool and run this task inline
+            print("[CPU POOL] Worker pool broke, restarting it")
+            self._restart(executor)
+            self._record(name, True, 0.0, 0.0, error=True)
+            return func(*args, **kwargs)
+        except Exception:
+            elapsed = time.perf_counter() - started
+            self._record(name, False, elapsed, 0.0, error=True)
+            raise
+        finally:
+            with self._stats_lock:
+                self._pending -= 1
+            self._slots.release()
+        self._record(name, False, time.perf_counter() - started, compute)
+        return result
+
+    def _restart(self, broken):
+        with self._lock:
+            if self._executor is not broken:
+                return  # another thread already replaced it
+            self._executor = self._create_executor()
+            self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._stats_lock:
+            tasks = {}
+            for name, t in self._tasks.items():
+                n = t["tasks"]
+                tasks[name] = {
+                    "tasks": n,
+                    "inline": t["inline"],
+                    "errors": t["errors"],
+                    "queue_seconds_avg": round(t["queue_seconds"] / n, 4) if n else 0.0,
+                    "queue_seconds_max": round(t["queue_seconds_max"], 4),
+                    "compute_seconds_avg": round(t["compute_seconds"] / n, 4) if n else 0.0,
+                    "compute_seconds_max": round(t["compute_seconds_max"], 4),
+                }
+            return {
+                "workers": self.workers if self._executor is not None else 0,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "restarts": self.restarts,
+                "tasks": tasks,
+            }
+
+
+cpu_pool = CpuPool()
@@ -0,0 +1,182 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+from mysql.connector import pooling
+
+DB_CONFIG = {
+    "user": os.environ.get("MYSQL_USER", "seiseki"),
+    "password": os.environ.get("MYSQL_PASSWORD", "seiseki-mitai"),
+    "database": os.environ.get("MYSQL_DATABASE", "seiseki"),
+    "connection_timeout": 3,
+}
+# Hosts tried in order ('mysql' under Docker, then localhost). The first one that works is remembered.
+DB_HOSTS = [h.strip() for h in os.environ.get("MYSQL_HOST", "mysql,127.0.0.1").split(",") if h.strip()]
+DB_POOL_SIZE = max(1, int(os.environ.get("DB_POOL_SIZE", "5")))
+DB_CHECKOUT_TIMEOUT = float(os.environ.get("DB_CHECKOUT_TIMEOUT", "10"))
+
+
+class PooledConnection:
+    """プールから借りた接続。close()（またはwith文の終わり）でプールに返却する"""
+
+    def __init__(self, pool, cnx):
+        self._pool = pool
+        self._cnx = cnx
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def close(self):
+        if self._cnx is None:
+            return
+        cnx, self._cnx = self._cnx, None
+        try:
+            cnx.close()
+        finally:
+            self._pool._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DatabasePool:
+    """接続できたホストを覚えておくMySQLコネクションプール"""
+
+    def __init__(self, size=DB_POOL_SIZE, hosts=DB_HOSTS, checkout_timeout=DB_CHECKOUT_TIMEOUT):
+        self.size = size
+        self.hosts = hosts
+        self.checkout_timeout = checkout_timeout
+        self.host = None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._counters = {"checkouts": 0, "checkout_timeouts": 0, "reconnects": 0, "host_resolutions": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _resolve_host(self):
+        """接続できるホストを探す（前回成功したホストを最初に試す）"""
+        candidates = ([self.host] if self.host else []) + [h for h in self.hosts if h != self.host]
+        last_error = None
+        for host in candidates:
+            try:
+                conn = mysql.connector.connect(host=host, **DB_CONFIG)
+                conn.close()
+                print(f"Connected to MySQL ({host})")
+                return host
+            except Exception as e:
+                print(f"MySQL connection to {host} failed: {e}")
+                last_error = e
+        raise last_error or RuntimeError("No MySQL host configured")
+
+    def open(self):
+        """プールを作成する（作成済みなら何もしない）"""
+        with self._lock:
+            if self._pool is not None:
+                return self._pool
+            host = self._resolve_host()
+            self._pool = pooling.MySQLConnectionPool(
+                pool_name=f"seiseki-{os.getpid()}-{id(self)}",
+                pool_size=self.size,
+                pool_reset_session=True,
+                host=host,
+                **DB_CONFIG,
+            )
+            self.host = host
+            with self._stats_lock:
+                self._counters["host_resolutions"] += 1
+            return self._pool
+
+    def _invalidate(self):
+        """接続先が落ちた場合に、次回ホストを解決し直してプールを作り直す"""
+        with self._lock:
+            self._pool = None
+
+    def get_connection(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._stats_lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=timeout)
+        waited = time.monotonic() - started
+        with self._stats_lock:
+            self._waiting -= 1
+            if not acquired:
+                self._counters["checkout_timeouts"] += 1
+        if not acquired:
+            raise TimeoutError(f"No database connection available within {timeout:g}s")
+        try:
+            cnx = self.open().get_connection()
+            # Health check: reconnect stale connections (e.g. after wait_timeout)
+            if not cnx.is_connected():
+                with self._stats_lock:
+                    self._counters["reconnects"] += 1
+                cnx.reconnect(attempts=2, delay=0)
+        except Exception:
+            self._slots.release()
+            self._invalidate()
+            raise
+        with self._stats_lock:
+            self._in_use += 1
+            self._counters["checkouts"] += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return PooledConnection(self, cnx)
+
+    def _release(self):
+        with self._stats_lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._stats_lock:
+            checkouts = self._counters["checkouts"]
+            return {
+                "size": self.size,
+                "host": self.host,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                **self._counters,
+                "wait_seconds_avg": round(self._wait_total / checkouts, 4) if checkouts else 0.0,
+                "wait_seconds_max": round(self._wait_max, 4),
+            }
+
+
+db_pool = DatabasePool()
+
+
+def get_db_connection():
+    """プールから接続を借りる（with文で使えば例外が起きても返却される）"""
+    return db_pool.get_connection()
+
+
+def ping(timeout=None):
+    """プールから接続を借りてSELECT 1を実行する（/readyzの確認用）"""
+    with db_pool.get_connection(timeout=timeout) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+# Blocking DB calls from async endpoints run here instead of on the event loop.
+# Sized to the pool so queries queue in the executor rather than for a connection.
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+
+async def run_db(func, *args, **kwargs):
+    """ブロッキングなDB処理をDB専用スレッドで実行して結果を待つ"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
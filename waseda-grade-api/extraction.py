@@ -0,0 +1,199 @@
+import json
+import os
+import re
+import threading
+import time
+
+from cpu_pool import cpu_pool
+from parsers import html_parser
+
+# "script": one in-page script returns only the grade rows and the student ID as JSON
+# "bs4": serialize the whole page with driver.page_source and parse it with parsers.html_parser
+GRADE_EXTRACTION = os.environ.get("GRADE_EXTRACTION", "script").lower()
+
+# e.g. 1X24B044
+STUDENT_ID_PATTERN = re.compile(r"(1[A-Z])(\d{2})([A-Z])\d+")
+
+# Mirrors the BeautifulSoup path: cell text is every text node (outside script/style) stripped
+# and concatenated, as get_text(strip=True) does. The student ID is looked up in the page text
+# first and in the serialized markup only if that fails; either way only the match leaves the browser.
+EXTRACT_SCRIPT = r"""
+const text = document.documentElement.textContent;
+const cellText = (cell) => {
+    const walker = document.createTreeWalker(cell, NodeFilter.SHOW_TEXT);
+    const parts = [];
+    for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+        const parent = node.parentNode && node.parentNode.nodeName;
+        if (parent === 'SCRIPT' || parent === 'STYLE') continue;
+        const part = node.nodeValue.trim();
+        if (part) parts.push(part);
+    }
+    return parts.join('');
+};
+const rows = Array.from(document.querySelectorAll('tr.operationboxf'), (row) =>
+    Array.from(row.querySelectorAll('td'), cellText));
+const pattern = /(1[A-Z])(\d{2})([A-Z])\d+/;
+let id = text.match(pattern);
+if (!id) id = document.documentElement.outerHTML.match(pattern);
+return JSON.stringify({
+    title: text.includes('成績照会'),
+    list: text.includes('科目名'),
+    student_id: id ? id[0] : null,
+    rows: rows,
+});
+"""
+
+
+class ExtractionError(Exception):
+    pass
+
+
+class GradePage:
+    """成績ページから取り出した内容（成績の行・学籍番号）と、取り出しにかかったコスト"""
+
+    def __init__(self, rows, student_id, title_found, list_found, method, payload_bytes, seconds):
+        self.rows = rows
+        self.student_id = student_id
+        self.title_found = title_found
+        self.list_found = list_found
+        self.method = method
+        self.payload_bytes = payload_bytes
+        self.seconds = seconds
+
+    @property
+    def on_search_page(self):
+        """成績一覧ではなく検索条件のページか"""
+        return self.title_found and not self.list_found
+
+
+def grades_from_rows(rows):
+    """tr.operationboxf の各行のセルの文字列から成績リストを作る"""
+    grades = []
+    for cells in rows:
+        col_texts = [text.replace('\xa0', ' ') for text in cells]
+        if len(col_texts) < 6:
+            continue
+        subject, year, semester, credit, grade, gp = col_texts[:6]
+        # If year is empty, it's likely a section header
+        if not year:
+            continue
+        grades.append({
+            "subject": subject,
+            "year": year,
+            "semester": semester,
+            "credit": credit,
+            "grade": grade,
+            "gp": gp
+        })
+    return grades
+
+
+def rows_from_html(html_content):
+    # The grades are in rows with class 'operationboxf'
+    return html_parser.grade_rows(html_content)
+
+
+def parse_grades(html_content):
+    return grades_from_rows(rows_from_html(html_content))
+
+
+def find_student_id(text):
+    match = STUDENT_ID_PATTERN.search(text)
+    return match.group(0) if match else None
+
+
+def extract_from_html(html_content, method="bs4"):
+    """HTML全体を解析する（HTTPモードと、スクリプトが使えない場合の経路）"""
+    started = time.perf_counter()
+    page = GradePage(
+        rows=rows_from_html(html_content),
+        student_id=find_student_id(html_content),
+        title_found="成績照会" in html_content,
+        list_found="科目名" in html_content,
+        method=method,
+        payload_bytes=len(html_content.encode("utf-8")),
+        seconds=0.0,
+    )
+    page.seconds = time.perf_counter() - started
+    return page
+
+
+def extract_from_driver(driver):
+    """ページ内のスクリプトで必要な部分だけをJSONで受け取る"""
+    started = time.perf_counter()
+    payload = driver.execute_script(EXTRACT_SCRIPT)
+    if not isinstance(payload, str):
+        raise ExtractionError(f"Unexpected extraction result: {type(payload).__name__}")
+    try:
+        data = json.loads(payload)
+        rows = [[str(cell) for cell in row] for row in data["rows"]]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ExtractionError(f"Malformed extraction result: {e}")
+    return GradePage(
+        rows=rows,
+        student_id=data.get("student_id"),
+        title_found=bool(data.get("title")),
+        list_found=bool(data.get("list")),
+        method="script",
+        payload_bytes=len(payload.encode("utf-8")),
+        seconds=time.perf_counter() - started,
+    )
+
+
+class ExtractionStats:
+    """取り出し方法毎の回数・転送バイト数・時間と、BS4へのフォールバック回数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+        self.fallbacks = 0
+
+    def record(self, page):
+        with self._lock:
+            m = self._methods.setdefault(page.method, {"pages": 0, "bytes": 0, "seconds": 0.0})
+            m["pages"] += 1
+            m["bytes"] += page.payload_bytes
+            m["seconds"] += page.seconds
+
+    def record_fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "mode": GRADE_EXTRACTION,
+                "html_parser": html_parser.name,
+                "fallbacks": self.fallbacks,
+                "methods": {
+                    name: {
+                        "pages": m["pages"],
+                        "bytes_avg": round(m["bytes"] / m["pages"]) if m["pages"] else 0,
+                        "seconds_avg": round(m["seconds"] / m["pages"], 4) if m["pages"] else 0.0,
+                    }
+                    for name, m in self._methods.items()
+                },
+            }
+
+
+extraction_stats = ExtractionStats()
+
+
+def extract_grade_page(driver, mode=None):
+    """成績ページの内容を取り出す。スクリプトが失敗したらpage_source + BS4に戻す"""
+    mode = mode or GRADE_EXTRACTION
+    page = None
+    if mode == "script":
+        try:
+            page = extract_from_driver(driver)
+        except Exception as e:
+            print(f"[EXTRACT] In-page extraction failed, falling back to page_source: {e}")
+            extraction_stats.record_fallback()
+    if page is None:
+        started = time.perf_counter()
+        html_content = driver.page_source
+        page = cpu_pool.run(extract_from_html, html_content, "bs4" if mode != "script" else "bs4_fallback")
+        # Count the page_source transfer too, which is what the script path avoids
+        page.seconds = time.perf_counter() - started
+    extraction_stats.record(page)
+    return page
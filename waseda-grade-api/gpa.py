@@ -0,0 +1,100 @@
+import functools
+
+import numpy as np
+
+from hisshu import HisshuSnapshot
+
+# Point mapping: A+=9, A=8, B=7, C=6, F=0, S=0
+POINT_MAP = {"A+": 9, "A": 8, "B": 7, "C": 6, "F": 0, "S": 0}
+
+
+def is_excluded(grade):
+    """＊（認定）やP（合格）は平均に含めない"""
+    return "＊" in grade or "*" in grade or "P" in grade
+
+
+def parse_credit(credit_str):
+    try:
+        return float(credit_str)
+    except (TypeError, ValueError):
+        return None
+
+
+def best_matches(grades, matcher):
+    """必修科目毎に最も点数の高い成績を選ぶ
+
+    {必修科目の位置: {name, points, w_credits, grade_val, credit, subject, grade}} を返す（同点なら先に出た方）
+    """
+    best = {}
+    for g in grades:
+        grade = g["grade"]
+        if is_excluded(grade):
+            continue
+        credit = parse_credit(g["credit"])
+        if credit is None:
+            continue
+        index = matcher.match_index(g["subject"])
+        if index < 0:
+            continue
+        p = POINT_MAP.get(grade, 0)
+        if index in best and p <= best[index]["grade_val"]:
+            continue
+        h = matcher.subjects[index]
+        best[index] = {
+            "name": h["name"],
+            "points": p * credit * h["weight"],
+            "w_credits": credit * h["weight"],
+            "grade_val": p,
+            "credit": credit,
+            "subject": g["subject"],
+            "grade": grade,
+        }
+    return best
+
+
+def calculate_gpa(grades, matcher):
+    """1人分の必修科目の重み付き平均点。(平均点, best_matchesの結果) を返す"""
+    matches = best_matches(grades, matcher)
+    total_weighted_points = 0
+    total_weighted_credits = 0
+    for data in matches.values():
+        total_weighted_points += data["points"]
+        total_weighted_credits += data["w_credits"]
+    average_score = 0
+    if total_weighted_credits > 0:
+        average_score = total_weighted_points / total_weighted_credits
+    return average_score, matches
+
+
+@functools.lru_cache(maxsize=4)
+def _snapshot_for(hisshu_text):
+    return HisshuSnapshot.from_text(hisshu_text)
+
+
+def calculate_gpa_for_text(grades, hisshu_text):
+    """hisshu.csvの内容を渡して calculate_gpa する（ワーカープロセス用。照合器は内容毎に一度だけ作る）"""
+    return calculate_gpa(grades, _snapshot_for(hisshu_text).matcher)
+
+
+def weight_vector(matcher):
+    return np.array([h["weight"] for h in matcher.subjects], dtype=np.float64)
+
+
+def grade_matrix(students, matcher):
+    """学生毎の成績リストから (点数, 単位数) の行列（学生数 × 必修科目数）を作る。未履修は単位数0"""
+    shape = (len(students), len(matcher.subjects))
+    points = np.zeros(shape, dtype=np.float64)
+    credits = np.zeros(shape, dtype=np.float64)
+    for i, grades in enumerate(students):
+        for j, data in best_matches(grades, matcher).items():
+            points[i, j] = data["grade_val"]
+            credits[i, j] = data["credit"]
+    return points, credits
+
+
+def batch_gpa(points, credits, weights):
+    """全員の重み付き平均点を行列演算でまとめて求める（履修した必修科目が無い人は0）"""
+    weighted_credits = credits * weights
+    totals = weighted_credits.sum(axis=1)
+    sums = (points * weighted_credits).sum(axis=1)
+    return np.divide(sums, totals, out=np.zeros_like(sums), where=totals > 0)
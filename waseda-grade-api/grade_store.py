@@ -0,0 +1,95 @@
+import json
+import zlib
+
+from hisshu import HisshuSnapshot
+
+# Per-student raw grades, compressed, plus what they matched under which hisshu list
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS gradedata (
+        student_id VARCHAR(64) PRIMARY KEY,
+        grades MEDIUMBLOB NOT NULL,
+        matched TEXT,
+        hisshu_version VARCHAR(16),
+        updated_at DATETIME
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hisshu_versions (
+        version VARCHAR(16) PRIMARY KEY,
+        content MEDIUMTEXT NOT NULL,
+        created_at DATETIME
+    )
+    """,
+]
+
+
+def encode_grades(grades):
+    """成績リストを [[科目名, 成績, 単位数], ...] のJSONにしてzlib圧縮する"""
+    rows = [[g["subject"], g["grade"], g["credit"]] for g in grades]
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_grades(blob):
+    return [{"subject": s, "grade": g, "credit": c} for s, g, c in json.loads(zlib.decompress(blob))]
+
+
+def encode_matched(matches):
+    """calculate_gpaで選ばれた必修科目名（改行区切り）"""
+    return "\n".join(data["name"] for data in matches.values())
+
+
+def decode_matched(text):
+    return set(text.split("\n")) if text else set()
+
+
+def save_grades(cursor, student_id, grades, matches, hisshu, timestamp_str):
+    """成績と、計算に使ったhisshu.csvの版を保存する（commitは呼び出し側）"""
+    if hisshu.text is not None:
+        cursor.execute(
+            "INSERT IGNORE INTO hisshu_versions (version, content, created_at) VALUES (%s, %s, %s)",
+            (hisshu.version, hisshu.text, timestamp_str),
+        )
+    cursor.execute("""
+        INSERT INTO gradedata (student_id, grades, matched, hisshu_version, updated_at)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE grades = VALUES(grades), matched = VALUES(matched),
+            hisshu_version = VALUES(hisshu_version), updated_at = VALUES(updated_at)
+    """, (student_id, encode_grades(grades), encode_matched(matches), hisshu.version, timestamp_str))
+
+
+def load_hisshu_version(cursor, version):
+    """保存されている過去のhisshu.csv（無ければNone）"""
+    cursor.execute("SELECT content FROM hisshu_versions WHERE version = %s", (version,))
+    row = cursor.fetchone()
+    return HisshuSnapshot.from_text(row[0]) if row else None
+
+
+class HisshuChange:
+    """2つの版のhisshu.csvの違い。どの学生の再計算が必要かを判定する"""
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        old_weights, new_weights = old.weights(), new.weights()
+        # Names whose weight changed, or that were added or removed
+        self.reweighted = {
+            name for name in set(old_weights) | set(new_weights)
+            if old_weights.get(name) != new_weights.get(name)
+        }
+        # Same names in the same order: every subject still matches the same entry,
+        # so only students who matched a reweighted name can change
+        self.same_names = [h["name"] for h in old.subjects] == [h["name"] for h in new.subjects]
+
+    def _name(self, snapshot, subject):
+        index = snapshot.matcher.match_index(subject)
+        return snapshot.subjects[index]["name"] if index >= 0 else None
+
+    def affects(self, matched, grades_blob):
+        """matched（前回選ばれた科目名）と成績から、結果が変わりうるか"""
+        if decode_matched(matched) & self.reweighted:
+            return True
+        if self.same_names:
+            return False
+        return any(self._name(self.old, g["subject"]) != self._name(self.new, g["subject"])
+                   for g in decode_grades(grades_blob))
@@ -0,0 +1,209 @@
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
+import unicodedata
+from collections import deque
+
+# Subject names repeat across students, so match results are memoized up to this many names
+MATCH_CACHE_SIZE = 4096
+
+# Where hisshu.csv is looked for (HISSHU_CSV takes precedence)
+HISSHU_PATHS = [p for p in [os.environ.get("HISSHU_CSV")] if p] + [
+    "list/hisshu.csv", "../list/hisshu.csv", "/app/list/hisshu.csv",
+]
+# How often (seconds) the file's mtime is checked for changes
+HISSHU_CHECK_INTERVAL = float(os.environ.get("HISSHU_CHECK_INTERVAL", "5"))
+
+
+def normalize(text):
+    """全角・半角の違いを吸収する（数学Ａ１ → 数学A1）"""
+    return unicodedata.normalize("NFKC", text)
+
+
+class HisshuMatcher:
+    """必修科目名のAho-Corasickオートマトン
+
+    科目名を1回なぞるだけで、含まれている必修科目のうちhisshu.csvで最も上にあるものを返す
+    （各必修科目名について `name in subject` を順に試していた結果と同じ）
+    """
+
+    def __init__(self, hisshu_subjects):
+        self.subjects = list(hisshu_subjects)
+        none = len(self.subjects)
+        self._goto = [{}]
+        self._fail = [0]
+        # Smallest list index of any pattern ending at this state (following fail links)
+        self._best = [none]
+        self._cache = {}
+        for i, h in enumerate(self.subjects):
+            state = 0
+            for ch in normalize(h["name"]):
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(none)
+                    self._goto[state][ch] = nxt
+                state = nxt
+            self._best[state] = min(self._best[state], i)
+        self._build_fail_links()
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._best[nxt] = min(self._best[nxt], self._best[self._fail[nxt]])
+
+    def match(self, subject):
+        """subjectに含まれる必修科目（無ければNone）"""
+        index = self.match_index(subject)
+        return self.subjects[index] if index >= 0 else None
+
+    def match_index(self, subject):
+        """subjectに含まれる必修科目のリスト上の位置（無ければ-1）"""
+        try:
+            return self._cache[subject]
+        except KeyError:
+            pass
+        index = self._scan(subject)
+        if len(self._cache) >= MATCH_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[subject] = index
+        return index
+
+    def _scan(self, subject):
+        goto, fail, best_of = self._goto, self._fail, self._best
+        best = best_of[0]  # an empty name matches everything
+        state = 0
+        for ch in normalize(subject):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if best_of[state] < best:
+                best = best_of[state]
+                if best == 0:
+                    break
+        return best if best < len(self.subjects) else -1
+
+
+def parse_hisshu_csv(text):
+    """hisshu.csv（name, 重み）を [{"name", "weight"}] にする"""
+    hisshu_subjects = []
+    for row in csv.DictReader(io.StringIO(text)):
+        if "name" in row:
+            w = row.get("重み", "1")
+            try:
+                w = float(w)
+            except (TypeError, ValueError):
+                w = 1.0
+            hisshu_subjects.append({"name": row["name"], "weight": w})
+    return hisshu_subjects
+
+
+class HisshuSnapshot:
+    """ある時点のhisshu.csvの内容と照合器（作成後は変更しない）"""
+
+    def __init__(self, subjects, path=None, mtime=None, version=None, text=None):
+        self.subjects = subjects
+        self.matcher = HisshuMatcher(subjects)
+        self.path = path
+        self.mtime = mtime
+        # Content hash, so GPA results computed under other weights can be told apart
+        self.version = version
+        self.text = text
+        self.loaded_at = time.time()
+
+    @classmethod
+    def from_text(cls, text, path=None, mtime=None):
+        version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        return cls(parse_hisshu_csv(text), path, mtime, version, text)
+
+    def weights(self):
+        """必修科目名→重み（同じ名前が複数あれば先の行）"""
+        result = {}
+        for h in self.subjects:
+            result.setdefault(h["name"], h["weight"])
+        return result
+
+
+class HisshuCatalog:
+    """hisshu.csvを一度だけ読み、ファイルが更新されたら読み直して丸ごと差し替える"""
+
+    def __init__(self, paths=HISSHU_PATHS, check_interval=HISSHU_CHECK_INTERVAL):
+        self.paths = paths
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def _find_path(self):
+        for p in self.paths:
+            if os.path.exists(p):
+                return p
+        raise FileNotFoundError("hisshu.csv not found in any expected location.")
+
+    @staticmethod
+    def _stamp(path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self, path):
+        stamp = self._stamp(path)
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            snapshot = HisshuSnapshot.from_text(f.read(), path, stamp)
+        print(f"[HISSHU] Loaded {len(snapshot.subjects)} hisshu subjects from {path} (version {snapshot.version})")
+        return snapshot
+
+    def current(self):
+        """最新のスナップショット。ファイルが変わっていれば読み直す"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            self._checked_at = time.monotonic()
+            if snapshot is None:
+                self._snapshot = self._load(self._find_path())
+                return self._snapshot
+            try:
+                if self._stamp(snapshot.path) == snapshot.mtime:
+                    return snapshot
+                fresh = self._load(snapshot.path)
+            except Exception as e:
+                # Keep serving the last good list (e.g. the file is being rewritten)
+                self.reload_errors += 1
+                print(f"[HISSHU] Reload failed, keeping version {snapshot.version}: {e}")
+                return snapshot
+            self.reloads += 1
+            self._snapshot = fresh
+            return fresh
+
+    @property
+    def version(self):
+        return self.current().version
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "path": snapshot.path if snapshot else None,
+            "subjects": len(snapshot.subjects) if snapshot else 0,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
+
+
+hisshu_catalog = HisshuCatalog()
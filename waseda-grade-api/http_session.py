@@ -0,0 +1,170 @@
+import os
+import queue
+import threading
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from browser_pool import USER_AGENT
+
+HTTP_POOL_SIZE = max(1, int(os.environ.get("HTTP_POOL_SIZE", "8")))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "20"))
+
+# Hidden fields that mark an auto-submitting SAML / WS-Fed hand-off form
+AUTO_POST_FIELDS = ("SAMLResponse", "SAMLRequest", "wresult", "code", "id_token")
+
+
+def cookies_from_driver(driver):
+    """Seleniumセッションの全ドメインのCookieを取得する"""
+    try:
+        return driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+    except Exception as e:
+        print(f"[HTTP] CDP cookie export failed, falling back to current domain only: {e}")
+        return driver.get_cookies()
+
+
+def cookies_from_session(session):
+    """requests.SessionのCookieを、cookies_from_driverと同じ形のリストで取り出す"""
+    return [
+        {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path,
+         "secure": c.secure, "expires": c.expires, "httpOnly": c.has_nonstandard_attr("HttpOnly")}
+        for c in session.cookies
+    ]
+
+
+def cookies_to_driver(driver, cookies):
+    """cookies_from_driver / cookies_from_session の形のCookieを、ドメインを問わずSeleniumセッションに入れる"""
+    params = []
+    for c in cookies:
+        cookie = {
+            "name": c["name"],
+            "value": c["value"],
+            "domain": c.get("domain", ""),
+            "path": c.get("path", "/"),
+            "secure": bool(c.get("secure", False)),
+            "httpOnly": bool(c.get("httpOnly", False)),
+        }
+        expires = c.get("expires", c.get("expiry"))
+        if expires and expires > 0:
+            cookie["expires"] = expires
+        if c.get("sameSite"):
+            cookie["sameSite"] = c["sameSite"]
+        params.append(cookie)
+    # CDP sets cookies for any domain without first navigating there (add_cookie only covers the current one)
+    driver.execute_cdp_cmd("Network.setCookies", {"cookies": params})
+
+
+def load_cookies(session, cookies):
+    """ブラウザのCookieをrequests.Sessionに移す"""
+    for c in cookies:
+        expires = c.get("expires", c.get("expiry"))
+        session.cookies.set(
+            c["name"],
+            c["value"],
+            domain=c.get("domain", ""),
+            path=c.get("path", "/"),
+            secure=c.get("secure", False),
+            expires=int(expires) if expires and expires > 0 else None,
+            rest={"HttpOnly": None} if c.get("httpOnly") else {},
+        )
+
+
+def decode_response(response):
+    """Content-Typeに文字コードが無い場合は本文から推定する"""
+    if "charset" not in response.headers.get("Content-Type", "").lower():
+        response.encoding = response.apparent_encoding
+    return response.text
+
+
+def form_payload(form):
+    """フォーム内のinputから送信データを組み立てる"""
+    data = {}
+    for field in form.find_all(["input", "select", "textarea"]):
+        name = field.get("name")
+        if not name:
+            continue
+        if field.name == "input" and field.get("type", "").lower() in ("checkbox", "radio") and not field.has_attr("checked"):
+            continue
+        if field.name == "input" and field.get("type", "").lower() in ("submit", "button", "image"):
+            continue
+        if field.name == "select":
+            option = field.find("option", selected=True) or field.find("option")
+            data[name] = option.get("value", option.get_text()) if option else ""
+        else:
+            data[name] = field.get("value", field.get_text() if field.name == "textarea" else "")
+    return data
+
+
+def submit_form(session, response_url, form, extra=None, timeout=HTTP_TIMEOUT):
+    data = form_payload(form)
+    data.update(extra or {})
+    action = urljoin(response_url, form.get("action") or response_url)
+    if form.get("method", "get").lower() == "post":
+        return session.post(action, data=data, timeout=timeout)
+    return session.get(action, params=data, timeout=timeout)
+
+
+def follow_auto_post_forms(session, response, max_hops=5, timeout=HTTP_TIMEOUT):
+    """ブラウザならJavaScriptで自動送信されるSAML等のフォームを辿る
+
+    timeout: 1回の送信のタイムアウト（秒）。呼ばれる毎に秒数を返す関数も渡せる
+    """
+    for _ in range(max_hops):
+        soup = BeautifulSoup(decode_response(response), "html.parser")
+        form = None
+        for f in soup.find_all("form"):
+            if any(f.find("input", attrs={"name": n}) for n in AUTO_POST_FIELDS):
+                form = f
+                break
+        if form is None:
+            return response
+        response = submit_form(session, response.url, form, timeout=timeout() if callable(timeout) else timeout)
+    return response
+
+
+class HttpSessionPool:
+    """接続を使い回すrequests.Sessionのプール（返却時にCookieを消去）"""
+
+    def __init__(self, size=HTTP_POOL_SIZE):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._checkouts = 0
+
+    def _create(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["User-Agent"] = USER_AGENT
+        with self._lock:
+            self._created += 1
+        return session
+
+    def acquire(self, cookies=None):
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            session = self._create()
+        with self._lock:
+            self._checkouts += 1
+        if cookies:
+            load_cookies(session, cookies)
+        return session
+
+    def release(self, session):
+        session.cookies.clear()
+        if self._idle.qsize() < self.size:
+            self._idle.put(session)
+        else:
+            session.close()
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "idle": self._idle.qsize(), "created": self._created, "checkouts": self._checkouts}
+
+
+http_pool = HttpSessionPool()
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from scheduler import MAX_CONCURRENCY, QUEUE_SIZE
+
+# Finished jobs are kept this long (seconds) so the client can fetch the result
+JOB_TTL = float(os.environ.get("GRADE_JOB_TTL", "600"))
+
+# Phases reported while a grade job runs, in order
+# (lab_fetch comes after the result: the grades are already returned while lab_pipeline fetches the lab preferences)
+PHASES = ["queued", "login", "portal", "grade_page", "parse", "db_write", "lab_fetch", "finished"]
+
+# Every admitted job gets a worker thread; the scheduler decides when it actually runs
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY + QUEUE_SIZE, thread_name_prefix="grade-job")
+
+
+class DeferredTasks:
+    """BackgroundTasksの代わりに、結果を返した後で実行する処理を貯めておく"""
+
+    def __init__(self):
+        self.tasks = []
+
+    def add_task(self, func, *args, **kwargs):
+        self.tasks.append((func, args, kwargs))
+
+
+class GradeJob:
+    def __init__(self, estimated_wait=None):
+        self.id = uuid.uuid4().hex
+        self.state = "queued"  # queued -> running -> succeeded / failed
+        self.phase = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.estimated_wait = estimated_wait
+        self.result = None
+        self.status_code = None
+        self.lab_fetch = None  # pending -> succeeded / failed / expired / rejected / cancelled
+        self.events = []
+        self._settled = False
+        self._lock = threading.Lock()
+        self._add_event("queued")
+
+    def _add_event(self, event, **data):
+        self.events.append({"event": event, "at": round(time.time() - self.created_at, 3), **data})
+
+    def set_phase(self, phase):
+        if phase not in PHASES:
+            raise ValueError(f"Unknown job phase: {phase}")
+        with self._lock:
+            if self.state == "queued":
+                self.state = "running"
+            self.phase = phase
+            self._add_event("phase", phase=phase)
+
+    def set_result(self, payload, status_code):
+        with self._lock:
+            self.result = payload
+            self.status_code = status_code
+            self.state = "succeeded" if status_code < 400 else "failed"
+            self._add_event("result", state=self.state, status_code=status_code)
+
+    def start_lab_fetch(self):
+        with self._lock:
+            self.lab_fetch = "pending"
+            self.phase = "lab_fetch"
+            self._add_event("phase", phase="lab_fetch")
+
+    def set_lab_fetch(self, status):
+        """lab_pipelineから研究室志望の取得結果を受け取る。ジョブの処理が済んでいればここで終わる"""
+        with self._lock:
+            self.lab_fetch = status
+            self._add_event("lab_fetch", status=status)
+            if self._settled:
+                self._finish()
+
+    def finish(self):
+        """ジョブの処理が済んだ。研究室志望の取得を待っている間は、その結果が届いた時に終わる"""
+        with self._lock:
+            self._settled = True
+            if self.lab_fetch != "pending":
+                self._finish()
+
+    def _finish(self):
+        self.phase = "finished"
+        self.finished_at = time.time()
+        self._add_event("finished", state=self.state)
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def events_since(self, index):
+        with self._lock:
+            return self.events[index:]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "state": self.state,
+                "phase": self.phase,
+                "estimated_wait": self.estimated_wait,
+                "elapsed": round((self.finished_at or time.time()) - self.created_at, 3),
+                "events": list(self.events),
+                "status_code": self.status_code,
+                "result": self.result,
+                "lab_fetch": self.lab_fetch,
+            }
+
+
+class JobStore:
+    """成績取得ジョブの管理（メモリ上）"""
+
+    def __init__(self, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.done and now - job.finished_at > self.ttl:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def submit(self, run, estimated_wait=None):
+        """run(job, deferred) を別スレッドで実行するジョブを作る
+
+        runは (レスポンスのdict, ステータスコード) を返す。deferredに積まれた処理は結果を記録した後に実行する
+        """
+        job = GradeJob(estimated_wait)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        _executor.submit(self._run, job, run)
+        return job
+
+    @staticmethod
+    def _run(job, run):
+        deferred = DeferredTasks()
+        try:
+            payload, status_code = run(job, deferred)
+        except Exception as e:
+            traceback.print_exc()
+            payload, status_code = {"status": "error", "message": str(e)}, 500
+        job.set_result(payload, status_code)
+        # Deferred tasks only hand work to lab_pipeline, which reports the outcome through job.set_lab_fetch
+        if deferred.tasks:
+            job.start_lab_fetch()
+        for func, args, kwargs in deferred.tasks:
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f"[JOB] Deferred task error: {e}")
+                job.set_lab_fetch("failed")
+        job.finish()
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {"jobs": len(self._jobs), **states}
+
+
+job_store = JobStore()
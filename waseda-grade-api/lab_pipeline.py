@@ -0,0 +1,206 @@
+import os
+import queue
+import threading
+import time
+import traceback
+
+import requests
+
+# Lab-preference fetches run on their own workers, separate from grade requests
+LAB_FETCH_CONCURRENCY = max(1, int(os.environ.get("LAB_FETCH_CONCURRENCY", "2")))
+# Jobs waiting for a worker; beyond this new jobs are dropped (the grades are already saved)
+LAB_FETCH_QUEUE_SIZE = max(1, int(os.environ.get("LAB_FETCH_QUEUE_SIZE", "100")))
+# Seconds from submission after which a job is given up (checked before each attempt; also caps the
+# pool waits and request timeouts inside an attempt through time_left)
+LAB_FETCH_DEADLINE = float(os.environ.get("LAB_FETCH_DEADLINE", "180"))
+# Extra attempts after a network error, with a linearly growing pause between them
+LAB_FETCH_RETRIES = max(0, int(os.environ.get("LAB_FETCH_RETRIES", "2")))
+LAB_FETCH_RETRY_DELAY = float(os.environ.get("LAB_FETCH_RETRY_DELAY", "5"))
+
+# Errors worth another attempt; anything else (parse errors, missing links) fails the job at once.
+# TimeoutError is not one of them: it means a pool had nothing free, and waiting again only holds the queue
+RETRYABLE_ERRORS = (requests.RequestException, ConnectionError)
+
+
+class DeadlineExceeded(TimeoutError):
+    """取得の期限を過ぎた（再試行しない）"""
+
+
+def time_left(deadline, limit):
+    """期限（time.monotonic()の値）までの残り秒数をlimitで抑えたもの。期限が無ければlimit
+
+    残りが無ければDeadlineExceededを投げる
+    """
+    if deadline is None:
+        return limit
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Lab fetch deadline passed")
+    return min(limit, remaining)
+
+
+class LabFetchJob:
+    def __init__(self, label, func, args, deadline, on_done=None):
+        self.label = label
+        self.func = func
+        self.args = args
+        self.on_done = on_done
+        self.submitted_at = time.monotonic()
+        self.deadline = self.submitted_at + deadline
+        self.attempts = 0
+
+
+class LabPipeline:
+    """研究室志望の取得を専用のワーカーで順に実行するキュー（同時実行数・期限・再試行付き）"""
+
+    def __init__(self, concurrency=LAB_FETCH_CONCURRENCY, queue_size=LAB_FETCH_QUEUE_SIZE,
+                 deadline=LAB_FETCH_DEADLINE, retries=LAB_FETCH_RETRIES, retry_delay=LAB_FETCH_RETRY_DELAY):
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._workers = []
+        self._closed = threading.Event()
+        self._running = 0
+        self._counters = {
+            "submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0,
+            "retries": 0, "expired": 0, "cancelled": 0,
+        }
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._finished = 0
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._workers or self._closed.is_set():
+                return
+            for i in range(self.concurrency):
+                thread = threading.Thread(target=self._worker, name=f"lab-fetch-{i}", daemon=True)
+                self._workers.append(thread)
+                thread.start()
+
+    def submit(self, label, func, *args, on_done=None):
+        """func(*args, deadline=期限) をキューに積む。キューが一杯なら積まずにFalseを返す
+
+        期限はtime.monotonic()の値。funcは待ち時間や通信のタイムアウトをtime_left()で抑える
+
+        on_done: 結果（succeeded, failed, expired, rejected, cancelled）を受け取るコールバック
+        """
+        self._ensure_workers()
+        job = LabFetchJob(label, func, args, self.deadline, on_done)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            print(f"[LAB PIPELINE] Queue full ({self._queue.maxsize}), dropping lab fetch for {label}")
+            self._done(job, "rejected")
+            return False
+        with self._lock:
+            self._counters["submitted"] += 1
+        print(f"[LAB PIPELINE] Queued lab fetch for {label} (backlog {self._queue.qsize()})")
+        return True
+
+    def shutdown(self):
+        self._closed.set()
+        with self._lock:
+            workers = list(self._workers)
+        for _ in workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _done(self, job, outcome):
+        self._count(outcome)
+        if job.on_done is None:
+            return
+        try:
+            job.on_done(outcome)
+        except Exception as e:
+            print(f"[LAB PIPELINE] Completion callback for {job.label} failed: {e}")
+
+    def _worker(self):
+        while not self._closed.is_set():
+            job = self._queue.get()
+            if job is None:
+                return
+            waited = time.monotonic() - job.submitted_at
+            with self._lock:
+                self._running += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            started = time.monotonic()
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._run_total += time.monotonic() - started
+                    self._finished += 1
+
+    def _run(self, job):
+        while True:
+            if time.monotonic() >= job.deadline:
+                print(f"[LAB PIPELINE] Deadline passed for {job.label} after {job.attempts} attempt(s), giving up")
+                self._done(job, "expired")
+                return
+            job.attempts += 1
+            try:
+                job.func(*job.args, deadline=job.deadline)
+                self._done(job, "succeeded")
+                return
+            except DeadlineExceeded:
+                print(f"[LAB PIPELINE] Deadline passed for {job.label} during attempt {job.attempts}, giving up")
+                self._done(job, "expired")
+                return
+            except RETRYABLE_ERRORS as e:
+                if job.attempts > self.retries:
+                    print(f"[LAB PIPELINE] Lab fetch for {job.label} failed after {job.attempts} attempt(s): {e}")
+                    self._done(job, "failed")
+                    return
+                delay = self.retry_delay * job.attempts
+                print(f"[LAB PIPELINE] Lab fetch for {job.label} failed ({e}), retrying in {delay:g}s")
+                self._count("retries")
+                # Do not sleep past the deadline; the loop then gives the job up
+                if self._closed.wait(min(delay, max(0.0, job.deadline - time.monotonic()))):
+                    self._done(job, "cancelled")
+                    return
+            except TimeoutError as e:
+                print(f"[LAB PIPELINE] Lab fetch for {job.label} gave up waiting: {e}")
+                self._done(job, "failed")
+                return
+            except Exception as e:
+                print(f"[LAB PIPELINE] Lab fetch for {job.label} failed: {e}")
+                traceback.print_exc()
+                self._done(job, "failed")
+                return
+
+    def _oldest_queued(self):
+        with self._queue.mutex:
+            jobs = [job for job in self._queue.queue if job is not None]
+        return round(time.monotonic() - jobs[0].submitted_at, 3) if jobs else 0.0
+
+    def stats(self):
+        with self._lock:
+            finished = self._finished
+            started = finished + self._running
+            return {
+                "concurrency": self.concurrency,
+                "queue_size": self._queue.maxsize,
+                "backlog": self._queue.qsize(),
+                "oldest_queued_seconds": self._oldest_queued(),
+                "running": self._running,
+                **self._counters,
+                "wait_seconds_avg": round(self._wait_total / started, 3) if started else 0.0,
+                "wait_seconds_max": round(self._wait_max, 3),
+                "run_seconds_avg": round(self._run_total / finished, 3) if finished else 0.0,
+            }
+
+
+lab_pipeline = LabPipeline()
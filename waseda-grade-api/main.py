@@ -1,39 +1,88 @@
 from fastapi import FastAPI, Form, Request, Response, BackgroundTasks
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from bs4 import BeautifulSoup
 import uvicorn
 import requests
 import json
-import csv
+import asyncio
 import os
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+import threading
 import time
 import traceback
 import re
 import datetime
 import math
-import mysql.connector
 import hashlib
 from pydantic import BaseModel
+from typing import Dict, List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from pathlib import Path
+from urllib.parse import parse_qs, urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
+from db import db_pool, get_db_connection, ping as ping_db, run_db
+from stats import gpa_aggregate
+from rank_index import rank_index
+from hisshu import HisshuMatcher, hisshu_catalog
+from gpa import calculate_gpa, calculate_gpa_for_text
+from simulator import simulator
+import grade_store
+import migrations
+from browser_pool import POOL_SIZE, chrome_pool, resolve_chromedriver, warm_up_chrome
+from startup import startup_report, WARMUP_CHROME
+import parsers
+from cpu_pool import cpu_pool
+from lab_pipeline import lab_pipeline, time_left
+from extraction import (
+    STUDENT_ID_PATTERN, extract_from_html, extract_grade_page, extraction_stats, grades_from_rows,
+)
+from waits import (
+    WaitEngine, wait_stats, all_of, any_of, document_ready,
+    element_present, text_present, url_contains, url_excludes,
+)
+from scheduler import scrape_scheduler, QueueFullError, QueueTimeoutError
+from jobs import job_store
+from resource_blocking import ResourceMeter, apply_policy, resource_stats
+from http_session import (
+    http_pool, cookies_from_driver, cookies_from_session, cookies_to_driver, decode_response, follow_auto_post_forms, submit_form,
+    HTTP_POOL_SIZE, HTTP_TIMEOUT,
+)
+
+# Scrape targets (override to run the post-login flow against a local fixture server)
+LOGIN_ENTRY_URL = os.environ.get("WASEDA_LOGIN_URL", "https://my.waseda.jp/login/login")
+MENU_URL = os.environ.get("WASEDA_MENU_URL", "https://coursereg.waseda.jp/portal/simpleportal.php?HID_P14=JA")
+GRADE_URL = os.environ.get("WASEDA_GRADE_URL", "https://gradereport-ty.waseda.jp/kyomu/epb2051.htm")
+
+# "browser": Chrome for the whole flow
+# "http": Chrome only for the Microsoft login, then plain HTTP with the handed-off cookies
+SCRAPE_MODE = os.environ.get("SCRAPE_MODE", "browser").lower()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup logic
-    try:
-        init_db()
-    except Exception as e:
-        print(f"WARNING: Database initialization failed: {e}")
-        print("The application will start, but database features may not work.")
+    # Startup logic: the server binds right away and the stages run in the background.
+    # The database chain (which may retry for a while), the browser chain and the CPU worker pool run side by side;
+    # each stage is timed so we can see where boot time goes. /readyz reports when they are done.
+    stages = [
+        ("db_pool", db_pool.open),
+        ("database", init_db),
+        ("stats", gpa_aggregate.load_from_db),
+    ], [
+        ("chromedriver", resolve_chromedriver),
+        ("hisshu", hisshu_catalog.current),
+        *([("chrome_warmup", warm_up_chrome)] if WARMUP_CHROME else []),
+        # Launch the Chrome pool so the first request starts warm
+        ("chrome_pool", chrome_pool.start),
+    ], [
+        ("cpu_pool", cpu_pool.start),
+    ]
+    startup_report.run_in_background(stages, on_done=lambda: print(startup_report.summary()))
     yield
-    # Shutdown logic (if any)
+    # Shutdown logic
+    chrome_pool.shutdown()
+    cpu_pool.shutdown()
+    lab_pipeline.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -45,36 +94,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database Connection
-def get_db_connection():
-    # Try connecting to 'mysql' host (docker) first, then localhost
-    try:
-        conn = mysql.connector.connect(
-            host="mysql",
-            user="seiseki",
-            password="seiseki-mitai",
-            database="seiseki",
-            connection_timeout=3
-        )
-        print("Connected to MySQL (Docker)")
-        return conn
-    except Exception as e:
-        print(f"Docker connection failed: {e}")
-        
-    try:
-        conn = mysql.connector.connect(
-            host="127.0.0.1",
-            user="seiseki",
-            password="seiseki-mitai",
-            database="seiseki",
-            connection_timeout=3
-        )
-        print("Connected to MySQL (Localhost)")
-        return conn
-    except Exception as e:
-        print(f"Localhost connection failed: {e}")
-        raise e
-
 def load_kenkyushitu_url():
     """kenkyushitu/.envからURLを読み込む"""
     possible_paths = [
@@ -95,219 +114,296 @@ def load_kenkyushitu_url():
 
 def parse_lab_preferences(html_content):
     """レビューページのHTMLから研究室志望情報をパースする"""
+    # 問題2（希望研究室）の div.que の中の qtext から
+    # <span class="draghome ... placed inplace1">石井研</span> の形式で第1〜第6希望と自己推薦（inplace7, group2）を読む
+    return cpu_pool.run(parsers.lab_preferences, html_content)
+
+
+def extract_review_links(html_content):
+    """クイズページのHTMLからレビューリンク（review.php）を抽出する"""
     soup = BeautifulSoup(html_content, 'html.parser')
-    preferences = {}
-    
-    # 問題2（希望研究室）を探す
-    # <div id="question-...-2" class="que ddwtos..."> の中の qtext を探す
-    questions = soup.find_all('div', class_='que')
-    
-    target_qtext = None
-    for q in questions:
-        qtext_div = q.find('div', class_='qtext')
-        if qtext_div:
-            text_content = qtext_div.get_text()
-            # 希望研究室のセクションかどうかチェック
-            if '希望研究室' in text_content or '第1希望' in text_content:
-                target_qtext = qtext_div
-                break
-    
-    if not target_qtext:
+    review_links = []
+    for a_tag in soup.find_all('a', href=True):
+        href = a_tag.get('href', '')
+        text = a_tag.get_text(strip=True)
+        if 'review.php' in href and ('レビュー' in text or 'Review' in text):
+            review_links.append({
+                'url': href,
+                'text': text,
+                'title': a_tag.get('title', '')
+            })
+    return review_links
+
+
+# Review pages fetched at once per student (most recent attempts first), on a shared thread pool
+# sized to the HTTP connection pool
+REVIEW_FETCH_CONCURRENCY = max(1, int(os.environ.get("REVIEW_FETCH_CONCURRENCY", "3")))
+_review_executor = ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE, thread_name_prefix="review")
+# Lab fetches that may borrow a pooled Chrome at once when the HTTP hand-off fails. Kept below the
+# pool size so /grades always has a session left (0 turns the browser fallback off)
+LAB_BROWSER_FALLBACKS = max(0, min(POOL_SIZE - 1, int(os.environ.get("LAB_BROWSER_FALLBACKS", "1"))))
+# Seconds a fallback waits for its slot and for a Chrome session before giving up
+LAB_BROWSER_CHECKOUT_TIMEOUT = float(os.environ.get("LAB_BROWSER_CHECKOUT_TIMEOUT", "10"))
+_browser_fallbacks = threading.BoundedSemaphore(LAB_BROWSER_FALLBACKS) if LAB_BROWSER_FALLBACKS else None
+
+
+class ReviewAuthError(Exception):
+    """レビューページの代わりにMoodleのログインページが返ってきた"""
+
+
+def on_moodle_login(url, html_content):
+    """Moodleのログインページ（SAML認証の前）か"""
+    return "login" in url.lower() or "Log in to the site" in html_content
+
+
+def order_review_links(review_links, base_url):
+    """レビューリンクの絶対URLを新しい受験から順に並べる（attempt= のIDが大きい方が新しい。無ければページの後ろの方）"""
+    urls = list(dict.fromkeys(urljoin(base_url, link['url']) for link in review_links))
+
+    def recency(item):
+        index, url = item
+        attempt = parse_qs(urlparse(url).query).get('attempt', [''])[0]
+        return (1, int(attempt), index) if attempt.isdigit() else (0, 0, index)
+
+    return [url for _, url in sorted(enumerate(urls), key=recency, reverse=True)]
+
+
+def scan_review_pages(fetch, review_urls, concurrency=REVIEW_FETCH_CONCURRENCY):
+    """レビューページを順に調べ、最初に研究室志望情報が見つかった結果を返す
+
+    fetch(url) は (最終的なURL, HTML) を返す。concurrency > 1 なら次の数ページを先読みする
+    （見つかった時点で、まだ始まっていない取得は取り消す）
+    """
+    started = time.monotonic()
+    futures = {}
+    submitted = 0
+    try:
+        for i, review_url in enumerate(review_urls):
+            if concurrency > 1:
+                while submitted < len(review_urls) and submitted < i + concurrency:
+                    futures[submitted] = _review_executor.submit(fetch, review_urls[submitted])
+                    submitted += 1
+                final_url, review_html = futures.pop(i).result()
+            else:
+                final_url, review_html = fetch(review_url)
+            print(f"[KENKYUSHITU] Checked review {i+1}/{len(review_urls)}: {review_url}")
+            if "login" in final_url.lower():
+                raise ReviewAuthError(f"Redirected to {final_url}")
+
+            # 研究室志望情報をパース
+            preferences = parse_lab_preferences(review_html)
+            if preferences:
+                print(f"[KENKYUSHITU] Found preferences in review {i+1} "
+                      f"({i+1} of {len(review_urls)} checked in {time.monotonic() - started:.1f}s): {preferences}")
+                return preferences
+            print(f"[KENKYUSHITU] No preferences found in review {i+1}")
         return None
-    
-    # 各希望順位の研究室名を抽出
-    # <span class="draghome ... placed inplace1">石井研</span> の形式
-    for i in range(1, 7):  # 第1希望〜第6希望
-        # class属性に "placed" と "inplace{i}" の両方を含むspanを探す
-        placed_span = target_qtext.select_one(f'span.placed.inplace{i}')
-        if placed_span:
-            lab_name = placed_span.get_text(strip=True)
-            preferences[f'第{i}希望'] = lab_name
-    
-    # 自己推薦の希望を抽出（place7, group2）
-    # <span class="draghome ... group2 placed inplace7">希望する/希望しない</span>
-    recommendation_span = target_qtext.select_one('span.placed.inplace7.group2')
-    if recommendation_span:
-        recommendation_text = recommendation_span.get_text(strip=True)
-        # "希望する" または "希望しない"
-        preferences['自己推薦'] = recommendation_text == '希望する'
-        preferences['自己推薦_raw'] = recommendation_text
-    
-    return preferences if preferences else None
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+
+def report_lab_preferences(student_id, lab_preferences_found):
+    """研究室志望情報の取得結果を出力し、見つかっていれば保存する"""
+    print("")
+    print("=" * 60)
+    if lab_preferences_found:
+        first_choice = lab_preferences_found.get('第1希望', '不明')
+        uses_recommendation = lab_preferences_found.get('自己推薦', False)
+        recommendation_str = "あり" if uses_recommendation else "なし"
+        print(f"[KENKYUSHITU] {student_id} 第1希望: {first_choice} / 自己推薦: {recommendation_str}")
+        
+        # データベースに保存
+        if student_id != "unknown":
+            save_lab_preferences(student_id, lab_preferences_found)
+    else:
+        print(f"[KENKYUSHITU] {student_id}: 研究室志望情報が見つかりませんでした")
+    print("=" * 60)
+
+
+def fetch_review_page_http(http, review_url, timeout=HTTP_TIMEOUT):
+    response = http.get(review_url, timeout=timeout)
+    return response.url, decode_response(response)
+
+
+def fetch_review_page_browser(driver, waits, review_url):
+    driver.get(review_url)
+    waits.until("lab_review", document_ready())
+    return driver.current_url, driver.page_source
 
 
-def fetch_kenkyushitu_page(driver, student_id="unknown"):
+def fetch_kenkyushitu_page(driver, student_id="unknown", deadline=None):
     """認証済みのドライバーでkenkyushitu URLにアクセスし、研究室志望情報を取得・出力"""
     kenkyushitu_url = load_kenkyushitu_url()
     if not kenkyushitu_url:
         return None
     
+    waits = WaitEngine(driver, "KENKYUSHITU")
+    meter = ResourceMeter(driver, "KENKYUSHITU")
+    meter.start()
     try:
-        # 現在のウィンドウを保存
-        original_window = driver.current_window_handle
-        
-        # 新しいタブで開く
-        driver.execute_script(f"window.open('{kenkyushitu_url}', '_blank');")
-        time.sleep(2)
-        
-        # 新しいタブに切り替え
-        windows = driver.window_handles
-        driver.switch_to.window(windows[-1])
+        apply_policy(driver)
+        driver.get(kenkyushitu_url)
         
         # ページ読み込みを待つ
-        time.sleep(3)
-        
-        # Moodleのログインページかどうかチェック
-        current_url = driver.current_url
-        html_content = driver.page_source
+        waits.until("lab_page", all_of(url_excludes(), document_ready()))
         
         # ログインページの場合、SAML認証（Waseda University Login）ボタンをクリック
-        if "login" in current_url.lower() or "Log in to the site" in html_content:
+        if on_moodle_login(driver.current_url, driver.page_source):
             try:
-                from selenium.webdriver.common.by import By
-                from selenium.webdriver.support.ui import WebDriverWait
-                from selenium.webdriver.support import expected_conditions as EC
-                
-                wait = WebDriverWait(driver, 15)
-                
-                # "Waseda University Login" ボタンを探してクリック
-                saml_login_btn = wait.until(EC.element_to_be_clickable(
-                    (By.XPATH, "//a[contains(@class, 'login-identityprovider-btn') or contains(text(), 'Waseda University Login')]")
-                ))
+                saml_login_btn = waits.until("lab_saml_button", element_present(
+                    By.XPATH, "//a[contains(@class, 'login-identityprovider-btn') or contains(text(), 'Waseda University Login')]"
+                ), required=True)
                 saml_login_btn.click()
                 
                 # SAML認証フローを待つ（Microsoft認証済みなら自動的にリダイレクト）
-                time.sleep(5)
-                
-                # Microsoft認証画面が出た場合の処理（すでにログイン済みなら不要）
-                try:
-                    # "Stay signed in?" ダイアログが出る場合
-                    stay_signed_in_no = driver.find_element(By.ID, "idBtn_Back")
-                    if stay_signed_in_no:
-                        stay_signed_in_no.click()
-                        time.sleep(2)
-                except:
-                    pass
-                
-                # 認証完了を待つ（ログインページから離れるまで）
-                for _ in range(20):
-                    current_url = driver.current_url
-                    if "login" not in current_url.lower() and "microsoftonline" not in current_url.lower():
-                        break
-                    time.sleep(1)
+                # Microsoft認証画面で "Stay signed in?" ダイアログが出た場合はそれも待つ
+                left_login = url_excludes("login", "microsoftonline")
+                stay_signed_in = element_present(By.ID, "idBtn_Back")
+                result = waits.until("lab_saml", any_of(left_login, stay_signed_in))
+                if result is not None and result is not True:
+                    result.click()
+                    # 認証完了を待つ（ログインページから離れるまで）
+                    waits.until("lab_saml", left_login)
                 
                 # 最終ページの読み込みを待つ
-                time.sleep(3)
-                
+                waits.until("lab_quiz_page", document_ready())
             except Exception as e:
                 print(f"[KENKYUSHITU] SAML authentication failed: {e}")
         
-        
         # 最終的なHTML取得
         html_content = driver.page_source
         current_url = driver.current_url
+        if on_moodle_login(current_url, html_content):
+            raise ReviewAuthError(f"Still on the Moodle login page in Chrome: {current_url}")
         
         print("=" * 60)
         print(f"[KENKYUSHITU] Quiz page URL: {current_url}")
         print("=" * 60)
         
         # HTMLからレビューリンクを抽出
-        soup = BeautifulSoup(html_content, 'html.parser')
-        review_links = []
-        
-        # レビューリンクを探す（review.phpへのリンク）
-        for a_tag in soup.find_all('a', href=True):
-            href = a_tag.get('href', '')
-            text = a_tag.get_text(strip=True)
-            if 'review.php' in href and ('レビュー' in text or 'Review' in text):
-                review_links.append({
-                    'url': href,
-                    'text': text,
-                    'title': a_tag.get('title', '')
-                })
-        
+        review_links = extract_review_links(html_content)
         if not review_links:
             print(f"[KENKYUSHITU] {student_id}: レビューリンクが見つかりませんでした")
-            print("[KENKYUSHITU] Quiz page HTML:")
-            print("=" * 60)
-            print(html_content)
-            print("=" * 60)
-            # 元のウィンドウに戻る
-            driver.close()
-            driver.switch_to.window(original_window)
             return None
         
         print(f"[KENKYUSHITU] Found {len(review_links)} review link(s):")
         for i, link in enumerate(review_links):
             print(f"  {i+1}. {link['text']} - {link['url']}")
+        review_urls = order_review_links(review_links, current_url)
         
-        # 研究室志望情報を格納
-        lab_preferences_found = None
-        
-        # 各レビューリンクにアクセスして研究室志望情報を探す
-        for i, link in enumerate(review_links):
-            review_url = link['url']
-            print(f"[KENKYUSHITU] Checking review link {i+1}: {review_url}")
-            
-            # レビューページにアクセス
-            driver.get(review_url)
-            time.sleep(3)
-            
-            # レビューページのHTML取得
-            review_html = driver.page_source
-            
-            print("=" * 60)
-            print(f"[KENKYUSHITU] Review {i+1} URL: {review_url}")
-            print("=" * 60)
-            
-            # 研究室志望情報をパース
-            preferences = parse_lab_preferences(review_html)
-            
-            if preferences:
-                lab_preferences_found = preferences
-                print(f"[KENKYUSHITU] Found preferences: {preferences}")
-                break  # 見つかったらループを抜ける
-            else:
-                print(f"[KENKYUSHITU] No preferences found in review {i+1}")
+        # レビューページはMoodleのCookieを引き継いだHTTPで並行して取得する（新しい受験から順に）
+        http = http_pool.acquire(cookies_from_driver(driver))
+        try:
+            lab_preferences_found = scan_review_pages(
+                lambda url: fetch_review_page_http(http, url, time_left(deadline, HTTP_TIMEOUT)), review_urls)
+        except (ReviewAuthError, requests.RequestException) as e:
+            # Cookies did not carry over: check the pages one by one in Chrome instead
+            print(f"[KENKYUSHITU] HTTP review fetch failed ({e}), falling back to the browser")
+            lab_preferences_found = scan_review_pages(
+                lambda url: fetch_review_page_browser(driver, waits, url), review_urls, concurrency=1)
+        finally:
+            http_pool.release(http)
         
         # 結果を出力
-        print("")
+        report_lab_preferences(student_id, lab_preferences_found)
+        return lab_preferences_found
+    finally:
+        print(waits.summary())
+        meter.finish()
+
+
+def fetch_kenkyushitu_page_http(http, student_id="unknown", kenkyushitu_url=None, deadline=None):
+    """ブラウザから引き継いだCookieでkenkyushitu URLにHTTPでアクセスし、研究室志望情報を取得する
+
+    Moodleのログインページが返ってきたら、SAML認証（Waseda University Login）のリンクとフォームを辿る。
+    それでもログインページのままならReviewAuthErrorを投げる。
+    deadline（time.monotonic()の値）があれば、各リクエストのタイムアウトを残り時間で抑える
+    """
+    kenkyushitu_url = kenkyushitu_url or load_kenkyushitu_url()
+    if not kenkyushitu_url:
+        return None
+
+    def timeout():
+        return time_left(deadline, HTTP_TIMEOUT)
+    
+    try:
+        response = follow_auto_post_forms(http, http.get(kenkyushitu_url, timeout=timeout()), timeout=timeout)
+        html_content = decode_response(response)
+        
+        # ログインページの場合、SAML認証（Waseda University Login）のリンクを辿る
+        # Microsoftのセッションは引き継ぎ済みなので、SAMLのフォームを自動送信すれば戻ってこられる
+        if on_moodle_login(response.url, html_content):
+            soup = BeautifulSoup(html_content, 'html.parser')
+            saml_link = soup.find('a', class_='login-identityprovider-btn', href=True) \
+                or soup.find('a', href=True, string=re.compile('Waseda University Login'))
+            if not saml_link:
+                raise ReviewAuthError(f"No SAML login link on {response.url}")
+            saml_url = urljoin(response.url, saml_link['href'])
+            response = follow_auto_post_forms(http, http.get(saml_url, timeout=timeout()), timeout=timeout)
+            html_content = decode_response(response)
+            if on_moodle_login(response.url, html_content):
+                raise ReviewAuthError(f"SAML hand-off over HTTP ended on {response.url}")
+        
         print("=" * 60)
-        if lab_preferences_found:
-            first_choice = lab_preferences_found.get('第1希望', '不明')
-            uses_recommendation = lab_preferences_found.get('自己推薦', False)
-            recommendation_str = "あり" if uses_recommendation else "なし"
-            print(f"[KENKYUSHITU] {student_id} 第1希望: {first_choice} / 自己推薦: {recommendation_str}")
-            
-            # データベースに保存
-            if student_id != "unknown":
-                save_lab_preferences(student_id, lab_preferences_found)
-        else:
-            print(f"[KENKYUSHITU] {student_id}: 研究室志望情報が見つかりませんでした")
+        print(f"[KENKYUSHITU] Quiz page URL: {response.url}")
         print("=" * 60)
         
-        # 元のウィンドウに戻る
-        driver.close()
-        driver.switch_to.window(original_window)
+        review_links = extract_review_links(html_content)
+        if not review_links:
+            print(f"[KENKYUSHITU] {student_id}: レビューリンクが見つかりませんでした")
+            return None
+        
+        print(f"[KENKYUSHITU] Found {len(review_links)} review link(s):")
+        for i, link in enumerate(review_links):
+            print(f"  {i+1}. {link['text']} - {link['url']}")
+        
+        lab_preferences_found = scan_review_pages(
+            lambda url: fetch_review_page_http(http, url, timeout()), order_review_links(review_links, response.url))
         
+        report_lab_preferences(student_id, lab_preferences_found)
         return lab_preferences_found
     except Exception as e:
+        # Errors go to lab_pipeline, which retries network failures
         print(f"[KENKYUSHITU] Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+        raise
+
 
+def fetch_kenkyushitu_in_browser(cookies, student_id, deadline=None):
+    """プールのChromeに引き継いだCookieを入れて、ブラウザでkenkyushituの研究室志望情報を取得する
 
-def fetch_kenkyushitu_in_background(driver, student_id):
+    同時に借りるのはLAB_BROWSER_FALLBACKS個まで。空かなければTimeoutError（待つのは期限まで）
+    """
+    wait = time_left(deadline, LAB_BROWSER_CHECKOUT_TIMEOUT)
+    if not _browser_fallbacks.acquire(timeout=wait):
+        raise TimeoutError(f"No browser fallback slot free within {wait:g}s")
     try:
-        fetch_kenkyushitu_page(driver, student_id)
-    except Exception as e:
-        print(f"[KENKYUSHITU] Background task error: {e}")
-    finally:
+        session = chrome_pool.acquire(timeout=time_left(deadline, LAB_BROWSER_CHECKOUT_TIMEOUT))
         try:
-            driver.quit()
-        except Exception:
-            pass
+            cookies_to_driver(session.driver, cookies)
+            return fetch_kenkyushitu_page(session.driver, student_id, deadline)
+        finally:
+            chrome_pool.release(session)
+    finally:
+        _browser_fallbacks.release()
+
+
+def fetch_kenkyushitu_with_cookies(cookies, student_id, browser_fallback=False, deadline=None):
+    """引き継いだCookieでkenkyushituの研究室志望情報を取得する（lab_pipelineのワーカーで実行）
+
+    HTTPでMoodleのログインを抜けられなかった場合、browser_fallbackならChromeで取得し直す
+    （LAB_BROWSER_FALLBACKSが0なら取得し直さない）
+    """
+    http = http_pool.acquire(cookies)
+    try:
+        return fetch_kenkyushitu_page_http(http, student_id, deadline=deadline)
+    except ReviewAuthError as e:
+        if not browser_fallback or _browser_fallbacks is None:
+            raise
+        print(f"[KENKYUSHITU] {student_id}: {e}; retrying the Moodle login in Chrome")
+    finally:
+        http_pool.release(http)
+    return fetch_kenkyushitu_in_browser(cookies, student_id, deadline)
 
 
 def init_db():
@@ -316,56 +412,15 @@ def init_db():
     
     for attempt in range(max_retries):
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Create gpadata table
-            # student_id is now a SHA-256 hash (64 chars)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS gpadata (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    student_id VARCHAR(64) UNIQUE,
-                    avg_gpa FLOAT,
-                    timestamp DATETIME,
-                    lab_choice_1 VARCHAR(50),
-                    lab_choice_2 VARCHAR(50),
-                    lab_choice_3 VARCHAR(50),
-                    lab_choice_4 VARCHAR(50),
-                    lab_choice_5 VARCHAR(50),
-                    lab_choice_6 VARCHAR(50),
-                    uses_recommendation BOOLEAN,
-                    lab_updated_at DATETIME
-                )
-            """)
-            
-            # Add columns if they don't exist (for existing databases)
-            alter_statements = [
-                "ALTER TABLE gpadata ADD COLUMN lab_choice_1 VARCHAR(50)",
-                "ALTER TABLE gpadata ADD COLUMN lab_choice_2 VARCHAR(50)",
-                "ALTER TABLE gpadata ADD COLUMN lab_choice_3 VARCHAR(50)",
-                "ALTER TABLE gpadata ADD COLUMN lab_choice_4 VARCHAR(50)",
-                "ALTER TABLE gpadata ADD COLUMN lab_choice_5 VARCHAR(50)",
-                "ALTER TABLE gpadata ADD COLUMN lab_choice_6 VARCHAR(50)",
-                "ALTER TABLE gpadata ADD COLUMN uses_recommendation BOOLEAN",
-                "ALTER TABLE gpadata ADD COLUMN lab_updated_at DATETIME",
-            ]
-            for stmt in alter_statements:
-                try:
-                    cursor.execute(stmt)
-                except Exception:
-                    pass  # Column already exists
-            
-            conn.commit()
-            
-            cursor.close()
-            conn.close()
+            # Only pending schema steps run; an up-to-date database costs one query
+            migrations.migrate()
             print("Database initialized successfully.")
             return
         except Exception as e:
             print(f"Database initialization attempt {attempt+1}/{max_retries} failed: {e}")
             time.sleep(retry_delay)
     
-    print("Could not initialize database after multiple attempts.")
+    raise RuntimeError("Could not initialize database after multiple attempts.")
 
 
 def save_lab_preferences(student_id: str, preferences: dict):
@@ -379,9 +434,6 @@ def save_lab_preferences(student_id: str, preferences: dict):
     timestamp_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Extract preferences
         lab_choice_1 = preferences.get('第1希望', None)
         lab_choice_2 = preferences.get('第2希望', None)
@@ -391,24 +443,26 @@ def save_lab_preferences(student_id: str, preferences: dict):
         lab_choice_6 = preferences.get('第6希望', None)
         uses_recommendation = preferences.get('自己推薦', False)
         
-        # Update existing record or insert new one
-        cursor.execute("""
-            INSERT INTO gpadata (student_id, lab_choice_1, lab_choice_2, lab_choice_3, 
-                                 lab_choice_4, lab_choice_5, lab_choice_6, 
-                                 uses_recommendation, lab_updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE 
-                lab_choice_1 = %s, lab_choice_2 = %s, lab_choice_3 = %s,
-                lab_choice_4 = %s, lab_choice_5 = %s, lab_choice_6 = %s,
-                uses_recommendation = %s, lab_updated_at = %s
-        """, (hashed_student_id, lab_choice_1, lab_choice_2, lab_choice_3,
-              lab_choice_4, lab_choice_5, lab_choice_6, uses_recommendation, timestamp_str,
-              lab_choice_1, lab_choice_2, lab_choice_3,
-              lab_choice_4, lab_choice_5, lab_choice_6, uses_recommendation, timestamp_str))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                # Update existing record or insert new one
+                cursor.execute("""
+                    INSERT INTO gpadata (student_id, lab_choice_1, lab_choice_2, lab_choice_3, 
+                                         lab_choice_4, lab_choice_5, lab_choice_6, 
+                                         uses_recommendation, lab_updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE 
+                        lab_choice_1 = %s, lab_choice_2 = %s, lab_choice_3 = %s,
+                        lab_choice_4 = %s, lab_choice_5 = %s, lab_choice_6 = %s,
+                        uses_recommendation = %s, lab_updated_at = %s
+                """, (hashed_student_id, lab_choice_1, lab_choice_2, lab_choice_3,
+                      lab_choice_4, lab_choice_5, lab_choice_6, uses_recommendation, timestamp_str,
+                      lab_choice_1, lab_choice_2, lab_choice_3,
+                      lab_choice_4, lab_choice_5, lab_choice_6, uses_recommendation, timestamp_str))
+                conn.commit()
+            finally:
+                cursor.close()
         
         print(f"[KENKYUSHITU] Lab preferences saved for {hashed_student_id[:16]}...")
         return True
@@ -438,79 +492,241 @@ async def login_form():
     </html>
     """
 
+def open_grade_page_browser(driver, waits, menu_url=MENU_URL):
+    """メニューから成績照会ウィンドウを開き、成績一覧の内容（GradePage）を返す"""
+    print(f"Navigating to Grades & Course registration menu: {menu_url}...")
+    driver.get(menu_url)
+    
+    print("Clicking '成績照会' link...")
+    # Wait for the menu page to load
+    grade_link = waits.until("menu", EC.element_to_be_clickable((By.XPATH, "//a[contains(., '成績照会')]")), required=True)
+    grade_link.click()
+    
+    # Wait for the new window to open
+    waits.until("grade_window", EC.number_of_windows_to_be(2), required=True)
+    
+    # Switch to the new window
+    windows = driver.window_handles
+    driver.switch_to.window(windows[-1])
+    # The site opened this window itself, so blocking only covers what it loads from here on
+    apply_policy(driver)
+    print(f"Switched to new window: {driver.current_url}")
+    waits.until("grade_page", all_of(url_excludes(), document_ready(), text_present("成績照会", "科目名")))
+    
+    page = extract_grade_page(driver)
+    
+    if page.on_search_page:
+        print("On search condition page. Trying to display grades...")
+        try:
+            # Look for a submit button
+            display_btn = driver.find_element(By.XPATH, "//input[@type='submit' or @value='表示']")
+            display_btn.click()
+            waits.until("grade_list", all_of(EC.staleness_of(display_btn), document_ready(), text_present("科目名")))
+            page = extract_grade_page(driver)
+        except:
+            print("Could not find display button, or already on list page.")
+    return page
+
+
+def fetch_grade_page_http(http, menu_url=MENU_URL, grade_url=GRADE_URL):
+    """引き継いだCookieでメニューと成績照会ページをHTTPで辿り、成績一覧のHTMLを返す"""
+    print(f"[HTTP] Navigating to Grades & Course registration menu: {menu_url}...")
+    response = follow_auto_post_forms(http, http.get(menu_url, timeout=HTTP_TIMEOUT))
+    
+    # 成績照会リンクの遷移先をメニューから探す（見つからなければ既知のURLを使う）
+    target_url = grade_url
+    soup = BeautifulSoup(decode_response(response), 'html.parser')
+    for a_tag in soup.find_all('a'):
+        if '成績照会' not in a_tag.get_text():
+            continue
+        href = a_tag.get('href', '')
+        onclick_url = re.search(r"open\(\s*['\"]([^'\"]+)['\"]", a_tag.get('onclick', '') + href)
+        if onclick_url:
+            target_url = urljoin(response.url, onclick_url.group(1))
+        elif href and not href.startswith(('javascript:', '#')):
+            target_url = urljoin(response.url, href)
+        break
+    
+    print(f"[HTTP] Fetching grade page: {target_url}")
+    response = follow_auto_post_forms(http, http.get(target_url, timeout=HTTP_TIMEOUT))
+    html_content = decode_response(response)
+    
+    if "成績照会" in html_content and "科目名" not in html_content:
+        print("[HTTP] On search condition page. Submitting display form...")
+        soup = BeautifulSoup(html_content, 'html.parser')
+        display_btn = soup.find('input', attrs={'type': 'submit'}) or soup.find('input', attrs={'value': '表示'})
+        form = display_btn.find_parent('form') if display_btn else soup.find('form')
+        if form:
+            extra = {display_btn['name']: display_btn.get('value', '')} if display_btn and display_btn.get('name') else None
+            response = submit_form(http, response.url, form, extra)
+            html_content = decode_response(response)
+        else:
+            print("[HTTP] Could not find display form, or already on list page.")
+    return html_content
+
+
+BUSY_MESSAGE = "サーバーが混雑しています。しばらくしてから再度お試しください。"
+
+
+def busy_response(e):
+    print(f"Scrape rejected: {e}")
+    return JSONResponse(
+        content={"status": "error", "message": BUSY_MESSAGE, "estimated_wait": round(e.estimated_wait)},
+        status_code=503,
+        headers={"Retry-After": str(math.ceil(e.estimated_wait))},
+    )
+
+
+def grades_response(payload, status_code):
+    json_content = json.dumps(payload, ensure_ascii=False)
+    return Response(content=json_content, status_code=status_code, media_type="application/json; charset=utf-8")
+
+
 @app.post("/grades")
 def get_grades(
     username: str = Form(...),
     password: str = Form(...),
     background_tasks: BackgroundTasks = None,
 ):
-    # Target URL for grades
-    grade_url = "https://gradereport-ty.waseda.jp/kyomu/epb2051.htm"
+    # Reject immediately when the queue is full instead of piling up Chrome instances
+    try:
+        ticket = scrape_scheduler.admit()
+    except QueueFullError as e:
+        return busy_response(e)
+    print(f"Scrape #{ticket.number} queued (estimated wait {ticket.estimated_wait:.0f}s)")
+    try:
+        with scrape_scheduler.run(ticket):
+            payload, status_code = scrape_grades(username, password, background_tasks)
+        return grades_response(payload, status_code)
+    except QueueTimeoutError as e:
+        print(f"Scrape #{ticket.number} gave up waiting: {e}")
+        return JSONResponse(content={"status": "error", "message": BUSY_MESSAGE}, status_code=503)
+
+
+# --- Grade Jobs (asynchronous API) ---
+
+@app.post("/grades/jobs")
+async def create_grade_job(
+    username: str = Form(...),
+    password: str = Form(...),
+):
+    """成績取得ジョブを登録し、すぐにジョブIDを返す"""
+    try:
+        ticket = scrape_scheduler.admit()
+    except QueueFullError as e:
+        return busy_response(e)
+
+    def run(job, deferred):
+        try:
+            with scrape_scheduler.run(ticket):
+                return scrape_grades(username, password, deferred, progress=job.set_phase,
+                                     on_lab_fetch=job.set_lab_fetch)
+        except QueueTimeoutError as e:
+            print(f"Scrape #{ticket.number} gave up waiting: {e}")
+            return {"status": "error", "message": BUSY_MESSAGE}, 503
+
+    job = job_store.submit(run, round(ticket.estimated_wait))
+    print(f"Scrape #{ticket.number} queued as job {job.id} (estimated wait {ticket.estimated_wait:.0f}s)")
+    return JSONResponse(
+        content={"status": "accepted", "job_id": job.id, "estimated_wait": job.estimated_wait},
+        status_code=202,
+    )
+
+
+@app.get("/grades/jobs/{job_id}")
+async def get_grade_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        return JSONResponse(content={"status": "error", "message": "Job not found"}, status_code=404)
+    return job.snapshot()
+
+
+@app.get("/grades/jobs/{job_id}/events")
+async def stream_grade_job(job_id: str):
+    """ジョブの進捗をServer-Sent Eventsで送る（phase → result → finished）"""
+    job = job_store.get(job_id)
+    if job is None:
+        return JSONResponse(content={"status": "error", "message": "Job not found"}, status_code=404)
+
+    async def event_stream():
+        index = 0
+        idle = 0.0
+        while True:
+            done = job.done
+            events = job.events_since(index)
+            index += len(events)
+            for event in events:
+                data = dict(event)
+                if event["event"] == "result":
+                    data["result"] = job.result
+                yield f"event: {event['event']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            if done and not events:
+                break
+            if events:
+                idle = 0.0
+            elif idle >= 15:
+                # Keep proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            await asyncio.sleep(0.25)
+            idle += 0.25
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def scrape_grades(username, password, background_tasks=None, progress=None, on_lab_fetch=None):
+    """ログインから成績の集計・保存までを行い、(レスポンスのdict, ステータスコード) を返す
+
+    progress: 各フェーズ（login, portal, grade_page, parse, db_write）の開始時に呼ばれるコールバック
+    on_lab_fetch: 研究室志望の取得結果（lab_pipelineのon_done）を受け取るコールバック
+    """
+    report = progress or (lambda phase: None)
     # Entry point for login (MyWaseda)
-    login_entry_url = "https://my.waseda.jp/login/login"
-    
-    options = webdriver.ChromeOptions()
-    options.add_argument("--headless=new")  # Use new headless mode for better stability
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    # options.add_argument("--remote-debugging-port=9222") # Removed to avoid port conflicts
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-setuid-sandbox")
-    options.add_argument("--disable-application-cache")
-    options.add_argument("--disable-infobars")
-    options.add_argument("--disable-notifications")
-    options.add_argument("--disable-popup-blocking")
-    options.add_argument("--mute-audio")
-    options.add_argument("--disable-software-rasterizer")
-    options.add_argument("--disable-features=VizDisplayCompositor")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    login_entry_url = LOGIN_ENTRY_URL
     
     driver = None
-    defer_driver_quit = False
+    session = None
+    http = None
+    waits = None
+    meter = None
     try:
-        # Check if running in Docker (CHROMEDRIVER_PATH set)
-        chromedriver_path = os.environ.get("CHROMEDRIVER_PATH")
-        if chromedriver_path:
-            service = Service(executable_path=chromedriver_path)
-        else:
-            # Try to find system installed chromedriver
-            import shutil
-            system_chromedriver = shutil.which("chromedriver")
-            if system_chromedriver:
-                 service = Service(executable_path=system_chromedriver)
-            else:
-                 service = Service(ChromeDriverManager().install())
-            
-        driver = webdriver.Chrome(service=service, options=options)
+        # Check out a pre-launched Chrome session from the pool
+        try:
+            session = chrome_pool.acquire()
+        except TimeoutError as e:
+            print(f"Chrome pool exhausted: {e}")
+            return {"status": "error", "message": "サーバーが混雑しています。しばらくしてから再度お試しください。"}, 503
+        driver = session.driver
+        waits = WaitEngine(driver, "GRADES")
+        meter = ResourceMeter(driver, "GRADES")
+        meter.start()
         
         # 1. Start authentication flow from MyWaseda login page
+        report("login")
         print(f"Accessing login entry point: {login_entry_url}...")
         driver.get(login_entry_url)
         
-        # Wait for page load
-        time.sleep(3)
+        # Wait until the landing page shows a Login button or has already redirected
+        login_link_xpath = "//a[contains(text(), 'Login') or contains(text(), 'ログイン')]"
+        redirected = url_contains("login.microsoftonline.com", "my.waseda.jp/portal")
+        waits.until("login_entry", all_of(document_ready(), any_of(redirected, element_present(By.XPATH, login_link_xpath))))
         
         # Check for an explicit "Login" button on the landing page
         try:
-            login_links = driver.find_elements(By.XPATH, "//a[contains(text(), 'Login') or contains(text(), 'ログイン')]")
+            login_links = [] if redirected(driver) else driver.find_elements(By.XPATH, login_link_xpath)
             if login_links:
                 print("Found Login link/button, clicking...")
                 login_links[0].click()
                 print("Clicked Login button. Waiting for navigation...")
-                time.sleep(3)
         except Exception as e:
             print(f"Check for login button failed (non-fatal): {e}")
 
-        # Wait for redirect to Microsoft Login or Portal
-        wait = WebDriverWait(driver, 20)
-        
-        try:
-            # Wait until we are either on Microsoft login or Waseda portal
-            wait.until(lambda d: "login.microsoftonline.com" in d.current_url or "my.waseda.jp/portal" in d.current_url)
-        except Exception:
-            print(f"Timeout waiting for redirect. Current URL: {driver.current_url}")
+        # Wait until we are either on Microsoft login or Waseda portal
+        waits.until("login_redirect", redirected)
         
         current_url = driver.current_url
         print(f"Current URL after entry: {current_url}")
@@ -519,87 +735,67 @@ def get_grades(
             print("Detected Microsoft Login")
             
             # Enter Email
-            email_input = wait.until(EC.presence_of_element_located((By.NAME, "loginfmt")))
+            email_input = waits.until("ms_email", EC.presence_of_element_located((By.NAME, "loginfmt")), required=True)
             email_input.clear()
             email_input.send_keys(username)
             
             # Click Next
-            next_btn = wait.until(EC.element_to_be_clickable((By.ID, "idSIButton9")))
+            next_btn = waits.until("ms_email", EC.element_to_be_clickable((By.ID, "idSIButton9")), required=True)
             next_btn.click()
             
             # Enter Password
             # Wait for password field to be visible
-            password_input = wait.until(EC.visibility_of_element_located((By.NAME, "passwd")))
+            password_input = waits.until("ms_password", EC.visibility_of_element_located((By.NAME, "passwd")), required=True)
             password_input.send_keys(password)
             
             # Click Sign in
-            signin_btn = wait.until(EC.element_to_be_clickable((By.ID, "idSIButton9")))
+            signin_btn = waits.until("ms_password", EC.element_to_be_clickable((By.ID, "idSIButton9")), required=True)
             signin_btn.click()
             
-            # Handle "Stay signed in?" (Click No)
-            try:
-                stay_signed_in_no = wait.until(EC.element_to_be_clickable((By.ID, "idBtn_Back")))
+            # Handle "Stay signed in?" (Click No), unless we already landed on the portal
+            on_portal = url_contains("my.waseda.jp/portal")
+            stay_signed_in_no = waits.until("ms_stay_signed_in", any_of(on_portal, EC.element_to_be_clickable((By.ID, "idBtn_Back"))))
+            if stay_signed_in_no is not None and stay_signed_in_no is not True:
                 stay_signed_in_no.click()
-            except:
+            elif stay_signed_in_no is None:
                 print("Stay signed in prompt did not appear or was skipped.")
-                pass
                 
             # Wait for login to complete and redirect to portal
             print("Waiting for login to complete...")
-            try:
-                wait.until(lambda d: "my.waseda.jp/portal" in d.current_url)
+            if waits.until("portal_redirect", on_portal):
                 print("Login successful, redirected to portal.")
-            except:
+            else:
                 print(f"Timed out waiting for portal redirect. Current URL: {driver.current_url}")
                 if "login.microsoftonline.com" in driver.current_url:
-                     return JSONResponse(content={"status": "error", "message": "Login incomplete. Possible 2FA required or wrong credentials.", "current_url": driver.current_url}, status_code=401)
+                     return {"status": "error", "message": "Login incomplete. Possible 2FA required or wrong credentials.", "current_url": driver.current_url}, 401
             
         elif "my.waseda.jp/portal" in current_url:
             print("Already logged in to portal.")
         
-        menu_url = "https://coursereg.waseda.jp/portal/simpleportal.php?HID_P14=JA"
-        print(f"Navigating to Grades & Course registration menu: {menu_url}...")
-        driver.get(menu_url)
-        
-        # Wait for the menu page to load
-        time.sleep(3)
-        
-        print("Clicking '成績照会' link...")
+        report("portal")
         try:
-            grade_link = wait.until(EC.element_to_be_clickable((By.XPATH, "//a[contains(., '成績照会')]")))
-            grade_link.click()
-            
-            # Wait for the new window to open
-            wait.until(EC.number_of_windows_to_be(2))
-            
-            # Switch to the new window
-            windows = driver.window_handles
-            driver.switch_to.window(windows[-1])
-            print(f"Switched to new window: {driver.current_url}")
-            time.sleep(5)
-            
-            html_content = driver.page_source
-            
-            if "成績照会" in html_content:
-                if "科目名" not in html_content:
-                    print("On search condition page. Trying to display grades...")
-                    try:
-                        # Look for a submit button
-                        display_btn = driver.find_element(By.XPATH, "//input[@type='submit' or @value='表示']")
-                        display_btn.click()
-                        time.sleep(3)
-                        html_content = driver.page_source
-                    except:
-                        print("Could not find display button, or already on list page.")
+            report("grade_page")
+            if SCRAPE_MODE == "http":
+                # Hand the authenticated cookies over to requests and return Chrome to the pool right away
+                print("Handing off session cookies to HTTP client...")
+                http = http_pool.acquire(cookies_from_driver(driver))
+                meter.finish()
+                meter = None
+                chrome_pool.release(session)
+                session = None
+                page = cpu_pool.run(extract_from_html, fetch_grade_page_http(http), "http")
+                extraction_stats.record(page)
+            else:
+                page = open_grade_page_browser(driver, waits)
             
-            print("Successfully accessed grade page.")
+            print(f"Successfully accessed grade page ({page.method}: {page.payload_bytes} bytes in {page.seconds * 1000:.0f} ms).")
             
             # Extract Student ID
             student_id = "unknown"
             
-            # Search for student ID pattern: 1[A-Z][0-9]{2}[A-Z][0-9]+
+            # Student ID pattern: 1[A-Z][0-9]{2}[A-Z][0-9]+
             # e.g. 1X24B044
-            id_match = re.search(r"(1[A-Z])(\d{2})([A-Z])\d+", html_content)
+            id_match = STUDENT_ID_PATTERN.match(page.student_id) if page.student_id else None
             
             if id_match:
                 full_id = id_match.group(0)
@@ -610,143 +806,65 @@ def get_grades(
                 print(f"Detected Student ID: {full_id}")
                 
                 if prefix != "1X" or dept != "B":
-                    return JSONResponse(content={"status": "error", "message": "総合機械工学科専用だよ"}, status_code=400)
+                    return {"status": "error", "message": "総合機械工学科専用だよ"}, 400
                 
                 # 2. Check Year: Must be 23 or 24
                 if year not in ["23", "24"]:
-                    return JSONResponse(content={"status": "error", "message": "学年が違うよ"}, status_code=400)
+                    return {"status": "error", "message": "学年が違うよ"}, 400
                 
                 student_id = full_id
             else:
                 print("Student ID not found in page content.")
 
-            grades = parse_grades(html_content)
+            report("parse")
+            grades = grades_from_rows(page.rows)
             
-            possible_paths = ["list/hisshu.csv", "../list/hisshu.csv", "/app/list/hisshu.csv"]
-            hisshu_path = None
-            for p in possible_paths:
-                if os.path.exists(p):
-                    hisshu_path = p
-                    break
-            
-            hisshu_subjects = []
-            if hisshu_path:
-                print(f"Loading hisshu.csv from: {hisshu_path}")
-                try:
-                    with open(hisshu_path, "r", encoding="utf-8") as f:
-                        reader = csv.DictReader(f)
-                        for row in reader:
-                            if "name" in row:
-                                w = row.get("重み", "1")
-                                try:
-                                    w = float(w)
-                                except:
-                                    w = 1.0
-                                hisshu_subjects.append({"name": row["name"], "weight": w})
-                except Exception as e:
-                    print(f"Failed to load hisshu.csv: {e}")
-            else:
-                print("Warning: hisshu.csv not found in any expected location.")
+            try:
+                hisshu = hisshu_catalog.current()
+                hisshu_matcher, hisshu_version = hisshu.matcher, hisshu.version
+            except Exception as e:
+                print(f"Failed to load hisshu.csv: {e}")
+                hisshu, hisshu_matcher, hisshu_version = None, HisshuMatcher([]), None
 
-            total_weighted_points = 0
-            total_weighted_credits = 0
-            
-            # Point mapping: A+=9, A=8, B=7, C=6, F=0, S=0
-            point_map = {"A+": 9, "A": 8, "B": 7, "C": 6, "F": 0, "S": 0}
-            
             print("--- Calculation Details ---")
             print(f"Parsed {len(grades)} grades.")
-            
-            # Key: hisshu_name, Value: {points: ..., w_credits: ..., grade_val: ..., subject: ..., grade: ...}
-            hisshu_best_matches = {}
 
-            for g in grades:
-                subject = g["subject"]
-                grade = g["grade"]
-                credit_str = g["credit"]
-                
-                # Exclude * or ＊ or P
-                if "＊" in grade or "*" in grade or "P" in grade:
-                    continue
-                
-                try:
-                    credit = float(credit_str)
-                except:
-                    continue
-                
-                # Check if subject is required (contains name from list)
-                matched_hisshu = None
-                for h in hisshu_subjects:
-                    if h["name"] in subject:
-                        matched_hisshu = h
-                        break
-                
-                if matched_hisshu:
-                    h_name = matched_hisshu["name"]
-                    h_weight = matched_hisshu["weight"]
-                    p = point_map.get(grade, 0)
-                    
-                    # Calculate potential contribution
-                    points = p * credit * h_weight
-                    w_credits = credit * h_weight
-                    
-                    # Check if we already have a match for this hisshu subject
-                    if h_name in hisshu_best_matches:
-                        # Compare grades. Higher point value wins.
-                        if p > hisshu_best_matches[h_name]["grade_val"]:
-                            hisshu_best_matches[h_name] = {
-                                "points": points,
-                                "w_credits": w_credits,
-                                "grade_val": p,
-                                "subject": subject,
-                                "grade": grade
-                            }
-                    else:
-                        hisshu_best_matches[h_name] = {
-                            "points": points,
-                            "w_credits": w_credits,
-                            "grade_val": p,
-                            "subject": subject,
-                            "grade": grade
-                        }
-
-            # Sum up results
-            for h_name, data in hisshu_best_matches.items():
-                total_weighted_points += data["points"]
-                total_weighted_credits += data["w_credits"]
-                print(f"Subject: {data['subject']} (Matched: {h_name}), Grade: {data['grade']} (Pt:{data['grade_val']}) -> Points: {data['points']}, W.Credits: {data['w_credits']}")
-            
-            print(f"Total Weighted Points: {total_weighted_points}")
-            print(f"Total Weighted Credits: {total_weighted_credits}")
-
-            average_score = 0
-            if total_weighted_credits > 0:
-                average_score = total_weighted_points / total_weighted_credits
+            if hisshu is not None and hisshu.text is not None:
+                # Workers compile the matcher once per hisshu.csv version from its text
+                average_score, hisshu_best_matches = cpu_pool.run(calculate_gpa_for_text, grades, hisshu.text)
+            else:
+                average_score, hisshu_best_matches = calculate_gpa(grades, hisshu_matcher)
+            for data in hisshu_best_matches.values():
+                print(f"Subject: {data['subject']} (Matched: {data['name']}), Grade: {data['grade']} (Pt:{data['grade_val']}) -> Points: {data['points']}, W.Credits: {data['w_credits']}")
             
             print(f"Calculated Average: {average_score}")
             print("---------------------------")
             
             # --- Database Operations ---
+            report("db_write")
             timestamp_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
             # Hash student_id
             hashed_student_id = hashlib.sha256(hashlib.sha512(student_id.encode()).hexdigest().encode()).hexdigest()
             
             try:
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                # 2. Save/Update GPA to 'gpadata'
-                # Use INSERT ... ON DUPLICATE KEY UPDATE
-                cursor.execute("""
-                    INSERT INTO gpadata (student_id, avg_gpa, timestamp)
-                    VALUES (%s, %s, %s)
-                    ON DUPLICATE KEY UPDATE avg_gpa = %s, timestamp = %s
-                """, (hashed_student_id, average_score, timestamp_str, average_score, timestamp_str))
-                
-                conn.commit()
-                
-                cursor.close()
-                conn.close()
+                with get_db_connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        # 2. Save/Update GPA to 'gpadata'
+                        # Use INSERT ... ON DUPLICATE KEY UPDATE
+                        cursor.execute("""
+                            INSERT INTO gpadata (student_id, avg_gpa, timestamp)
+                            VALUES (%s, %s, %s)
+                            ON DUPLICATE KEY UPDATE avg_gpa = %s, timestamp = %s
+                        """, (hashed_student_id, average_score, timestamp_str, average_score, timestamp_str))
+                        # Keep the raw grades so the GPA can be recomputed when hisshu.csv changes
+                        if hisshu is not None:
+                            grade_store.save_grades(cursor, hashed_student_id, grades, hisshu_best_matches, hisshu, timestamp_str)
+                        conn.commit()
+                    finally:
+                        cursor.close()
+                gpa_aggregate.upsert(hashed_student_id, average_score)
                 print(f"Database updated for {hashed_student_id} (Original: {student_id})")
                 
             except Exception as e:
@@ -757,74 +875,121 @@ def get_grades(
 
             # --- Kenkyushitu Page Fetch (Background) ---
             # ログイン成功後、kenkyushitu/.envのURLにもアクセス
+            # Only the cookies go to the lab-fetch queue, so Chrome / the HTTP session are released
+            # in the finally block below as soon as this response is ready. In browser mode the
+            # fetch checks out a Chrome session again if the HTTP hand-off cannot get past Moodle's login
+            cookies = cookies_from_session(http) if http is not None else cookies_from_driver(driver)
+            task = (lab_pipeline.submit, student_id, fetch_kenkyushitu_with_cookies, cookies, student_id, http is None)
             if background_tasks is not None:
-                defer_driver_quit = True
-                background_tasks.add_task(fetch_kenkyushitu_in_background, driver, student_id)
+                background_tasks.add_task(*task, on_done=on_lab_fetch)
             else:
-                defer_driver_quit = True
-                fetch_kenkyushitu_in_background(driver, student_id)
+                task[0](*task[1:], on_done=on_lab_fetch)
 
-            json_content = json.dumps({
+            result = {
                 "status": "success", 
                 "grades": grades, 
                 "student_id": student_id,
                 "average_score": f"{average_score:.2f}",
-                # "deviation_score": f"{deviation_score:.2f}",
-                # "rank": rank,
-                # "total_students": total_students,
-                # "distribution": distribution
-            }, ensure_ascii=False)
-            return Response(content=json_content, media_type="application/json; charset=utf-8")
+                "hisshu_version": hisshu_version,
+            }
+            # Rank and deviation come from the in-memory aggregate, so they cost nothing per request
+            if gpa_aggregate.loaded:
+                position = gpa_aggregate.position(average_score)
+                result.update({
+                    "deviation_score": f"{position['deviation_score']:.2f}",
+                    "rank": position["rank"],
+                    "total_students": position["total_students"],
+                    "distribution": gpa_aggregate.summary()["distribution"],
+                })
+            return result, 200
             
         except Exception as e:
             error_msg = f"Failed to navigate via menu: {str(e)}\nTraceback: {traceback.format_exc()}"
             print(error_msg)
-            return JSONResponse(content={"status": "error", "message": error_msg, "current_url": driver.current_url}, status_code=500)
+            current_url = driver.current_url if session else None
+            return {"status": "error", "message": error_msg, "current_url": current_url}, 500
             
     except Exception as e:
         error_msg = f"Unexpected error: {str(e)}\nTraceback: {traceback.format_exc()}"
         print(error_msg)
-        return JSONResponse(content={"status": "error", "message": error_msg}, status_code=500)
+        return {"status": "error", "message": error_msg}, 500
     finally:
-        if driver and not defer_driver_quit:
-            driver.quit()
+        if waits:
+            print(waits.summary())
+        if meter:
+            meter.finish()
+        if session:
+            chrome_pool.release(session)
+        if http is not None:
+            http_pool.release(http)
 
 
-def parse_grades(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    grades = []
-    
-    # The grades are in rows with class 'operationboxf'
-    rows = soup.find_all('tr', class_='operationboxf')
-    
-    for row in rows:
-        cols = row.find_all('td')
-        if not cols:
-            continue
-        col_texts = [col.get_text(strip=True).replace('\xa0', ' ') for col in cols]
-        
-        if len(col_texts) >= 6:
-            subject = col_texts[0]
-            year = col_texts[1]
-            semester = col_texts[2]
-            credit = col_texts[3]
-            grade = col_texts[4]
-            gp = col_texts[5]
-            
-            # If year is empty, it's likely a section header
-            if not year:
-                continue
-                
-            grades.append({
-                "subject": subject,
-                "year": year,
-                "semester": semester,
-                "credit": credit,
-                "grade": grade,
-                "gp": gp
-            })
-            
-    return grades
+# --- Health ---
+
+# Components that must be up before the app can serve grade requests
+READINESS_STAGES = ("database", "chromedriver", "hisshu")
+# Seconds /readyz waits for its live database check (after startup has finished)
+READYZ_DB_TIMEOUT = float(os.environ.get("READYZ_DB_TIMEOUT", "2"))
+
+
+@app.get("/healthz")
+async def healthz():
+    """プロセスが応答できるか（起動処理の完了は待たない）"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """DB・chromedriver・必修科目リストの準備ができていて、DBが今も応答すれば200、そうでなければ503"""
+    checks = {}
+    for stage in READINESS_STAGES:
+        state, error = startup_report.status(stage)
+        checks[stage] = {"status": state, **({"error": error} if error else {})}
+    ready = all(check["status"] == "ok" for check in checks.values())
+    if ready:
+        # Startup only proves the database was reachable once; check it is still answering
+        try:
+            await asyncio.wait_for(run_db(ping_db, timeout=READYZ_DB_TIMEOUT), READYZ_DB_TIMEOUT)
+            checks["database_ping"] = {"status": "ok"}
+        except Exception as e:
+            error = str(e) or f"no response within {READYZ_DB_TIMEOUT:g}s"
+            checks["database_ping"] = {"status": "failed", "error": error}
+            ready = False
+    return JSONResponse(
+        content={"status": "ready" if ready else "not_ready", "checks": checks},
+        status_code=200 if ready else 503,
+    )
+
+# --- Metrics ---
+
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "startup": startup_report.snapshot(),
+        "scheduler": scrape_scheduler.stats(),
+        "jobs": job_store.stats(),
+        "chrome_pool": chrome_pool.stats(),
+        "db_pool": db_pool.stats(),
+        "http_pool": http_pool.stats(),
+        "waits": wait_stats.snapshot(),
+        "resources": resource_stats.snapshot(),
+        "rank_index": rank_index.stats(),
+        "hisshu": hisshu_catalog.stats(),
+        "extraction": extraction_stats.snapshot(),
+        "cpu_pool": cpu_pool.stats(),
+        "lab_pipeline": lab_pipeline.stats(),
+    }
+
+
+@app.get("/stats")
+async def get_stats(avg_gpa: Optional[float] = None):
+    """GPAの分布（平均・標準偏差・ヒストグラム）。avg_gpaを指定するとその点数の順位と偏差値も返す"""
+    if not gpa_aggregate.loaded:
+        return JSONResponse(content={"status": "error", "message": "Statistics are not available"}, status_code=503)
+    result = {"status": "success", **gpa_aggregate.summary()}
+    if avg_gpa is not None:
+        result.update(gpa_aggregate.position(avg_gpa))
+    return result
 
 # --- Admin Endpoints ---
 
@@ -848,6 +1013,55 @@ async def admin_login(data: AdminLogin):
     else:
         return JSONResponse(content={"status": "error", "message": "Invalid credentials"}, status_code=401)
 
+def fetch_admin_rows():
+    with get_db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT student_id, avg_gpa, timestamp FROM gpadata")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    
+    # Convert datetime to string
+    for row in rows:
+        if isinstance(row['timestamp'], datetime.datetime):
+            row['timestamp'] = row['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
+        if row['avg_gpa'] is not None:
+            position = gpa_aggregate.position(row['avg_gpa'])
+            row['rank'] = position['rank']
+            row['deviation'] = position['deviation_score']
+    return rows
+
+
+def delete_student_row(student_id):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM gpadata WHERE student_id = %s", (student_id,))
+            conn.commit()
+        finally:
+            cursor.close()
+    gpa_aggregate.remove(student_id)
+
+
+def update_student_gpa(student_id, avg_gpa):
+    timestamp_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE gpadata SET avg_gpa = %s, timestamp = %s WHERE student_id = %s",
+                           (avg_gpa, timestamp_str, student_id))
+            updated = cursor.rowcount
+            conn.commit()
+        finally:
+            cursor.close()
+    if updated:
+        gpa_aggregate.upsert(student_id, avg_gpa)
+
+
+# The admin endpoints are async, so their blocking queries go through run_db
+# to keep the event loop free for other clients.
+
 @app.get("/admin/data")
 async def get_admin_data(request: Request):
     token = request.headers.get("X-Admin-Token")
@@ -855,18 +1069,7 @@ async def get_admin_data(request: Request):
          return JSONResponse(content={"status": "error", "message": "Unauthorized"}, status_code=401)
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT student_id, avg_gpa, timestamp FROM gpadata")
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        # Convert datetime to string
-        for row in rows:
-            if isinstance(row['timestamp'], datetime.datetime):
-                row['timestamp'] = row['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-        
+        rows = await run_db(fetch_admin_rows)
         return {"status": "success", "data": rows}
     except Exception as e:
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
@@ -874,6 +1077,30 @@ async def get_admin_data(request: Request):
 class UpdateGPA(BaseModel):
     avg_gpa: float
 
+class WeightProfile(BaseModel):
+    name: Optional[str] = None
+    weights: Dict[str, float] = {}
+
+class SimulationRequest(BaseModel):
+    profiles: List[WeightProfile]
+    refresh: bool = False
+
+@app.post("/admin/simulate")
+async def simulate_weights(data: SimulationRequest, request: Request):
+    """hisshu.csvの重みを変えた場合の分布・順位の変動を試算する（gpadataは変更しない）"""
+    token = request.headers.get("X-Admin-Token")
+    if not verify_token(token):
+         return JSONResponse(content={"status": "error", "message": "Unauthorized"}, status_code=401)
+
+    try:
+        profiles = [p.dict() for p in data.profiles]
+        result = await run_db(simulator.run, profiles, data.refresh)
+        return {"status": "success", **result}
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+
 @app.delete("/admin/data/{student_id}")
 async def delete_student_data(student_id: str, request: Request):
     token = request.headers.get("X-Admin-Token")
@@ -881,16 +1108,24 @@ async def delete_student_data(student_id: str, request: Request):
          return JSONResponse(content={"status": "error", "message": "Unauthorized"}, status_code=401)
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM gpadata WHERE student_id = %s", (student_id,))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await run_db(delete_student_row, student_id)
         return {"status": "success", "message": f"Deleted {student_id}"}
     except Exception as e:
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
 
+@app.post("/admin/stats/rebuild")
+async def rebuild_stats(request: Request):
+    """統計と順位インデックスをgpadataから読み直す（DBを直接編集した後など）"""
+    token = request.headers.get("X-Admin-Token")
+    if not verify_token(token):
+         return JSONResponse(content={"status": "error", "message": "Unauthorized"}, status_code=401)
+
+    try:
+        await run_db(gpa_aggregate.load_from_db)
+        return {"status": "success", "rank_index": rank_index.stats()}
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+
 @app.put("/admin/data/{student_id}")
 async def update_student_data(student_id: str, data: UpdateGPA, request: Request):
     token = request.headers.get("X-Admin-Token")
@@ -898,13 +1133,7 @@ async def update_student_data(student_id: str, data: UpdateGPA, request: Request
          return JSONResponse(content={"status": "error", "message": "Unauthorized"}, status_code=401)
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        timestamp_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute("UPDATE gpadata SET avg_gpa = %s, timestamp = %s WHERE student_id = %s", (data.avg_gpa, timestamp_str, student_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
+        await run_db(update_student_gpa, student_id, data.avg_gpa)
         return {"status": "success", "message": f"Updated {student_id}"}
     except Exception as e:
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
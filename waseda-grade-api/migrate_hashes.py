@@ -1,89 +1,152 @@
-import mysql.connector
+from db import get_db_connection
+import argparse
 import hashlib
+import json
 import os
 import time
 
-def get_db_connection():
-    # Try connecting to 'mysql' host (docker) first, then localhost
+BATCH_SIZE = int(os.environ.get("MIGRATE_BATCH_SIZE", "1000"))
+CHECKPOINT_PATH = os.environ.get("MIGRATE_CHECKPOINT", ".migrate_hashes.checkpoint")
+
+
+def is_hashed(student_id):
+    # Simple heuristic: 64 hex characters
+    if len(student_id) != 64:
+        return False
     try:
-        conn = mysql.connector.connect(
-            host="mysql",
-            user="seiseki",
-            password="seiseki-mitai",
-            database="seiseki",
-            connection_timeout=3
-        )
-        print("Connected to MySQL (Docker)")
-        return conn
-    except Exception as e:
-        pass
-        
+        int(student_id, 16)
+        return True
+    except ValueError:
+        return False
+
+
+def load_checkpoint(path):
     try:
-        conn = mysql.connector.connect(
-            host="127.0.0.1",
-            user="seiseki",
-            password="seiseki-mitai",
-            database="seiseki",
-            connection_timeout=3
-        )
-        print("Connected to MySQL (Localhost)")
-        return conn
-    except Exception as e:
-        print(f"Connection failed: {e}")
-        raise e
-
-def migrate():
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, state):
+    # Write then rename so an interruption never leaves a half-written checkpoint
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def migrate_batch(cursor, rows):
+    """1バッチ分をまとめてハッシュ化する。(更新件数, 既存のハッシュと重複して削除した件数) を返す"""
+    pending = {row_id: hashlib.sha256(sid.encode()).hexdigest() for row_id, sid in rows if not is_hashed(sid)}
+    if not pending:
+        return 0, 0
+
+    hashes = list(pending.values())
+    placeholders = ", ".join(["%s"] * len(hashes))
+    cursor.execute(f"SELECT student_id FROM gpadata WHERE student_id IN ({placeholders})", hashes)
+    existing = {r[0] for r in cursor.fetchall()}
+
+    # Already migrated elsewhere: keep the hashed row, drop the old unhashed one
+    duplicates = [row_id for row_id, hashed in pending.items() if hashed in existing]
+    updates = [(row_id, hashed) for row_id, hashed in pending.items() if hashed not in existing]
+
+    if duplicates:
+        placeholders = ", ".join(["%s"] * len(duplicates))
+        cursor.execute(f"DELETE FROM gpadata WHERE id IN ({placeholders})", duplicates)
+    if updates:
+        cases = " ".join(["WHEN %s THEN %s"] * len(updates))
+        placeholders = ", ".join(["%s"] * len(updates))
+        params = [v for pair in updates for v in pair] + [row_id for row_id, _ in updates]
+        cursor.execute(f"UPDATE gpadata SET student_id = CASE id {cases} END WHERE id IN ({placeholders})", params)
+    return len(updates), len(duplicates)
+
+
+def migrate(batch_size=BATCH_SIZE, checkpoint_path=CHECKPOINT_PATH, restart=False, dry_run=False, sample_batches=5):
+    """gpadataのstudent_idをidの順にバッチ毎にハッシュ化する（中断しても続きから再開できる）
+
+    dry_run=Trueなら最初のsample_batchesバッチをロールバックするトランザクション内で実行し、全体の所要時間を見積もる
+    """
     conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor()
 
-    try:
-        cursor.execute("ALTER TABLE gpadata MODIFY COLUMN student_id VARCHAR(64)")
-        conn.commit()
-        print("Altered student_id column to VARCHAR(64)")
-    except Exception as e:
-        print(f"Column alteration skipped or failed (might already be 64): {e}")
-
-    print("Fetching all records...")
-    cursor.execute("SELECT * FROM gpadata")
-    rows = cursor.fetchall()
-
-    print(f"Found {len(rows)} records.")
-
-    for row in rows:
-        original_id = row['student_id']
-        
-        # Check if already hashed (simple heuristic: len 64 and hex)
-        if len(original_id) == 64:
-            try:
-                int(original_id, 16)
-                # It's likely a hash, skip
-                continue
-            except ValueError:
-                pass
-        
-        # Calculate hash
-        hashed_id = hashlib.sha256(original_id.encode()).hexdigest()
-        
-        print(f"Migrating {original_id} -> {hashed_id}")
-        
+    if not dry_run:
         try:
-            # Try to update
-            cursor.execute("UPDATE gpadata SET student_id = %s WHERE id = %s", (hashed_id, row['id']))
+            cursor.execute("ALTER TABLE gpadata MODIFY COLUMN student_id VARCHAR(64)")
             conn.commit()
-        except mysql.connector.errors.IntegrityError as e:
-            # Duplicate entry?
-            if e.errno == 1062: # Duplicate entry
-                print(f"Hash {hashed_id} already exists. Deleting old unhashed record {row['id']}...")
-                cursor.execute("DELETE FROM gpadata WHERE id = %s", (row['id'],))
-                conn.commit()
-            else:
-                print(f"Error updating {original_id}: {e}")
+            print("Altered student_id column to VARCHAR(64)")
         except Exception as e:
-             print(f"Error updating {original_id}: {e}")
+            print(f"Column alteration skipped or failed (might already be 64): {e}")
+
+    state = None if (restart or dry_run) else load_checkpoint(checkpoint_path)
+    if state:
+        print(f"Resuming after id {state['last_id']} ({state['updated']} updated, {state['merged']} merged so far)")
+    else:
+        state = {"last_id": 0, "scanned": 0, "updated": 0, "merged": 0}
+
+    cursor.execute("SELECT COUNT(*) FROM gpadata WHERE id > %s", (state["last_id"],))
+    remaining = cursor.fetchone()[0]
+    print(f"{remaining} records to scan in batches of {batch_size}.")
+
+    started = time.perf_counter()
+    scanned = 0
+    batches = 0
+    try:
+        while True:
+            cursor.execute("SELECT id, student_id FROM gpadata WHERE id > %s ORDER BY id LIMIT %s",
+                           (state["last_id"], batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            updated, merged = migrate_batch(cursor, rows)
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+            # The checkpoint is written after the commit; redoing a batch is harmless
+            # because already-hashed IDs are skipped
+            state["last_id"] = rows[-1][0]
+            state["scanned"] += len(rows)
+            state["updated"] += updated
+            state["merged"] += merged
+            if not dry_run:
+                save_checkpoint(checkpoint_path, state)
+
+            scanned += len(rows)
+            batches += 1
+            elapsed = time.perf_counter() - started
+            print(f"Batch {batches}: up to id {state['last_id']}, {scanned}/{remaining} rows "
+                  f"({scanned / elapsed:,.0f} rows/s), {updated} updated, {merged} merged")
+            if dry_run and batches >= sample_batches:
+                break
+    except KeyboardInterrupt:
+        conn.rollback()
+        print(f"Interrupted. Run again to resume after id {state['last_id']}.")
+        return state
+    finally:
+        cursor.close()
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    rate = scanned / elapsed if elapsed > 0 else 0.0
+    if dry_run:
+        estimate = remaining / rate if rate else 0.0
+        print(f"Dry run: {scanned} rows in {elapsed:.2f}s ({rate:,.0f} rows/s, rolled back). "
+              f"Estimated time for {remaining} rows: {estimate:.1f}s")
+        return state
 
-    cursor.close()
-    conn.close()
-    print("Migration completed.")
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"Migration completed: {state['scanned']} rows scanned, {state['updated']} updated, "
+          f"{state['merged']} merged into existing hashes in {elapsed:.1f}s ({rate:,.0f} rows/s).")
+    return state
 
 if __name__ == "__main__":
-    migrate()
+    parser = argparse.ArgumentParser(description="Hash student IDs in gpadata (resumable)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="run a few batches, roll them back and estimate the total time")
+    parser.add_argument("--sample-batches", type=int, default=5)
+    args = parser.parse_args()
+    migrate(args.batch_size, args.checkpoint, args.restart, args.dry_run, args.sample_batches)
@@ -0,0 +1,147 @@
+import argparse
+import datetime
+import time
+
+import grade_store
+from db import get_db_connection
+
+LAB_CHOICE_COLUMNS = [f"lab_choice_{i}" for i in range(1, 7)]
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def _index_exists(cursor, table, index):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (table, index),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def add_column(table, column, definition):
+    def step(cursor):
+        if not _column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def add_index(table, index, columns):
+    def step(cursor):
+        if not _index_exists(cursor, table, index):
+            cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+    return step
+
+
+# (version, description, steps). Steps are SQL strings or callables taking a cursor.
+# MySQL commits DDL implicitly, so every step must be safe to re-run after a partial failure.
+MIGRATIONS = [
+    (1, "create gpadata", [
+        """
+        CREATE TABLE IF NOT EXISTS gpadata (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            student_id VARCHAR(64) UNIQUE,
+            avg_gpa FLOAT,
+            timestamp DATETIME
+        )
+        """,
+    ]),
+    (2, "lab preference columns", [
+        *[add_column("gpadata", column, "VARCHAR(50)") for column in LAB_CHOICE_COLUMNS],
+        add_column("gpadata", "uses_recommendation", "BOOLEAN"),
+        add_column("gpadata", "lab_updated_at", "DATETIME"),
+    ]),
+    (3, "raw grade store", list(grade_store.SCHEMA)),
+    (4, "indexes for ranking, lab demand and incremental recalc", [
+        add_index("gpadata", "idx_gpadata_avg_gpa", "avg_gpa"),
+        *[add_index("gpadata", f"idx_gpadata_{column}", column) for column in LAB_CHOICE_COLUMNS],
+        add_index("gradedata", "idx_gradedata_hisshu_version", "hisshu_version"),
+    ]),
+]
+
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(255),
+        applied_at DATETIME,
+        duration_ms INT
+    )
+"""
+
+
+def current_version(cursor):
+    cursor.execute(SCHEMA_VERSION_DDL)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn=None):
+    """未適用のマイグレーションだけを順に適用する。適用したバージョンの一覧を返す"""
+    own = conn is None
+    conn = conn or get_db_connection()
+    cursor = conn.cursor()
+    applied = []
+    # Serialize concurrent boots (e.g. several workers) so each step runs once
+    cursor.execute("SELECT GET_LOCK('seiseki_schema_migrations', 60)")
+    cursor.fetchone()
+    try:
+        version = current_version(cursor)
+        for number, description, steps in MIGRATIONS:
+            if number <= version:
+                continue
+            started = time.perf_counter()
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, applied_at, duration_ms) VALUES (%s, %s, %s, %s)",
+                (number, description, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), duration_ms),
+            )
+            conn.commit()
+            print(f"[MIGRATE] Applied {number}: {description} ({duration_ms} ms)")
+            applied.append(number)
+        if not applied:
+            print(f"[MIGRATE] Schema is up to date (version {version})")
+        return applied
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK('seiseki_schema_migrations')")
+        cursor.fetchone()
+        cursor.close()
+        if own:
+            conn.close()
+
+
+def status():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        version = current_version(cursor)
+        cursor.execute("SELECT version, description, applied_at, duration_ms FROM schema_version ORDER BY version")
+        for number, description, applied_at, duration_ms in cursor.fetchall():
+            print(f"  {number}: {description} (applied {applied_at}, {duration_ms} ms)")
+        pending = [m for m in MIGRATIONS if m[0] > version]
+        for number, description, _ in pending:
+            print(f"  {number}: {description} (pending)")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--status", action="store_true", help="list applied and pending migrations")
+    args = parser.parse_args()
+    if args.status:
+        status()
+    else:
+        migrate()
@@ -0,0 +1,154 @@
+import os
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional; BeautifulSoup's html.parser is always available
+    lxml = None
+
+# "lxml": build only the parts we read with lxml (libxml2) / "bs4": BeautifulSoup + SoupStrainer
+HTML_PARSER = os.environ.get("HTML_PARSER", "lxml").lower()
+
+LAB_CHOICES = 6
+
+
+def lab_preferences_from_texts(placed, recommendation):
+    """placed（第i希望 -> 研究室名）と自己推薦の文字列から志望情報を作る"""
+    preferences = {f'第{i}希望': name for i, name in sorted(placed.items())}
+    if recommendation is not None:
+        # "希望する" または "希望しない"
+        preferences['自己推薦'] = recommendation == '希望する'
+        preferences['自己推薦_raw'] = recommendation
+    return preferences or None
+
+
+def _is_lab_question(text):
+    # 希望研究室のセクションかどうかチェック
+    return '希望研究室' in text or '第1希望' in text
+
+
+def _class_token(name):
+    # While parsing, the strainer sees the raw class attribute ("que ddwtos complete"),
+    # so match the name as one whitespace-separated token
+    return re.compile(rf"(^|\s){re.escape(name)}(\s|$)")
+
+
+class Bs4Parser:
+    """BeautifulSoup（html.parser）。SoupStrainerで必要な要素だけを木にする"""
+
+    name = "bs4"
+    GRADE_ROWS = SoupStrainer('tr', class_=_class_token('operationboxf'))
+    QUESTIONS = SoupStrainer('div', class_=_class_token('que'))
+
+    def grade_rows(self, html_content):
+        soup = BeautifulSoup(html_content, 'html.parser', parse_only=self.GRADE_ROWS)
+        rows = []
+        for row in soup.find_all('tr', class_='operationboxf'):
+            cols = row.find_all('td')
+            if cols:
+                rows.append([col.get_text(strip=True) for col in cols])
+        return rows
+
+    def lab_preferences(self, html_content):
+        soup = BeautifulSoup(html_content, 'html.parser', parse_only=self.QUESTIONS)
+        for q in soup.find_all('div', class_='que'):
+            qtext = q.find('div', class_='qtext')
+            if qtext and _is_lab_question(qtext.get_text()):
+                break
+        else:
+            return None
+        placed = {}
+        for i in range(1, LAB_CHOICES + 1):
+            span = qtext.select_one(f'span.placed.inplace{i}')
+            if span:
+                placed[i] = span.get_text(strip=True)
+        recommendation = qtext.select_one('span.placed.inplace7.group2')
+        return lab_preferences_from_texts(placed, recommendation.get_text(strip=True) if recommendation else None)
+
+
+def _has_class(*names):
+    return " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {n} ')" for n in names)
+
+
+def _lxml_text(element, strip=False):
+    """BeautifulSoupのget_text()と同じ文字列（コメント・script・styleの中身は含めない）"""
+    parts = []
+    stack = [element]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            parts.append(node)
+            continue
+        # Comments and processing instructions have a non-string tag
+        if isinstance(node.tag, str) and node.tag not in ("script", "style"):
+            if node.text:
+                parts.append(node.text)
+            for child in reversed(node):
+                if child.tail:
+                    stack.append(child.tail)
+                stack.append(child)
+    if strip:
+        return "".join(p.strip() for p in parts)
+    return "".join(parts)
+
+
+class LxmlParser:
+    """lxml（libxml2）。XPathで目的の要素だけを取り出す"""
+
+    name = "lxml"
+    GRADE_ROWS = f"//tr[{_has_class('operationboxf')}]"
+    QTEXTS = f"//div[{_has_class('que')}]"
+    QTEXT = f".//div[{_has_class('qtext')}]"
+
+    def _parse(self, html_content):
+        # Bytes with an explicit encoding, so a <meta charset> or XML declaration is never re-applied
+        parser = lxml.html.HTMLParser(encoding="utf-8")
+        return lxml.html.document_fromstring(html_content.encode("utf-8"), parser=parser)
+
+    def grade_rows(self, html_content):
+        rows = []
+        for row in self._parse(html_content).xpath(self.GRADE_ROWS):
+            cols = row.xpath(".//td")
+            if cols:
+                rows.append([_lxml_text(col, strip=True) for col in cols])
+        return rows
+
+    def lab_preferences(self, html_content):
+        for q in self._parse(html_content).xpath(self.QTEXTS):
+            found = q.xpath(self.QTEXT)
+            if found and _is_lab_question(_lxml_text(found[0])):
+                qtext = found[0]
+                break
+        else:
+            return None
+        placed = {}
+        for i in range(1, LAB_CHOICES + 1):
+            span = qtext.xpath(f".//span[{_has_class('placed', f'inplace{i}')}]")
+            if span:
+                placed[i] = _lxml_text(span[0], strip=True)
+        recommendation = qtext.xpath(f".//span[{_has_class('placed', 'inplace7', 'group2')}]")
+        return lab_preferences_from_texts(placed, _lxml_text(recommendation[0], strip=True) if recommendation else None)
+
+
+PARSERS = {"bs4": Bs4Parser}
+if lxml is not None:
+    PARSERS["lxml"] = LxmlParser
+
+
+def get_parser(name=None):
+    name = (name or HTML_PARSER).lower()
+    if name not in PARSERS:
+        fallback = "lxml" if "lxml" in PARSERS else "bs4"
+        print(f"[PARSER] HTML parser '{name}' is not available, using {fallback}")
+        name = fallback
+    return PARSERS[name]()
+
+
+html_parser = get_parser()
+
+
+def lab_preferences(html_content):
+    """html_parserで研究室志望を取り出す（cpu_poolのワーカーから呼べるトップレベル関数）"""
+    return html_parser.lab_preferences(html_content)
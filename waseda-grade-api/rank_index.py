@@ -0,0 +1,75 @@
+import bisect
+import threading
+import time
+from array import array
+
+
+class RankIndex:
+    """avg_gpaを昇順に並べた配列。順位・パーセンタイルを二分探索で求める"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sorted = array("d")
+        self._scores = {}
+        self.rebuilds = 0
+        self.last_rebuild_seconds = None
+
+    def __len__(self):
+        return len(self._scores)
+
+    def load(self, rows):
+        """(student_id, avg_gpa) の一覧から作り直す"""
+        started = time.perf_counter()
+        scores = {student_id: float(score) for student_id, score in rows if score is not None}
+        ordered = array("d", sorted(scores.values()))
+        with self._lock:
+            self._scores = scores
+            self._sorted = ordered
+            self.rebuilds += 1
+            self.last_rebuild_seconds = time.perf_counter() - started
+
+    def _remove_value(self, score):
+        i = bisect.bisect_left(self._sorted, score)
+        del self._sorted[i]
+
+    def upsert(self, student_id, score):
+        """点数を更新して、前の点数（無ければNone）を返す"""
+        with self._lock:
+            old = self._scores.pop(student_id, None)
+            if old is not None:
+                self._remove_value(old)
+            if score is not None:
+                score = float(score)
+                self._scores[student_id] = score
+                bisect.insort(self._sorted, score)
+            return old
+
+    def remove(self, student_id):
+        return self.upsert(student_id, None)
+
+    def get(self, student_id):
+        with self._lock:
+            return self._scores.get(student_id)
+
+    def rank(self, score):
+        """scoreより高い人数+1（同点は同順位）"""
+        with self._lock:
+            return len(self._sorted) - bisect.bisect_right(self._sorted, score) + 1
+
+    def percentile(self, score):
+        """score以下の人の割合（%）"""
+        with self._lock:
+            n = len(self._sorted)
+            return 100.0 * bisect.bisect_right(self._sorted, score) / n if n else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._sorted),
+                "rebuilds": self.rebuilds,
+                "last_rebuild_seconds": round(self.last_rebuild_seconds, 4)
+                if self.last_rebuild_seconds is not None else None,
+            }
+
+
+rank_index = RankIndex()
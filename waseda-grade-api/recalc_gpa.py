@@ -1,194 +1,258 @@
 import mysql.connector
-import csv
-import os
+from db import get_db_connection
+from hisshu import HisshuSnapshot, hisshu_catalog
+from gpa import batch_gpa, calculate_gpa, grade_matrix, weight_vector
+import grade_store
+import argparse
 import hashlib
 import datetime
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-def get_db_connection():
-    # Try connecting to 'mysql' host (docker) first, then localhost
-    try:
-        conn = mysql.connector.connect(
-            host="mysql",
-            user="seiseki",
-            password="seiseki-mitai",
-            database="seiseki",
-            connection_timeout=3
-        )
-        print("Connected to MySQL (Docker)")
-        return conn
-    except Exception as e:
-        pass
-        
+# Students per compute chunk / write transaction, and rows pulled from the server per fetch
+CHUNK_STUDENTS = int(os.environ.get("RECALC_CHUNK_STUDENTS", "2000"))
+FETCH_SIZE = int(os.environ.get("RECALC_FETCH_SIZE", "5000"))
+
+UPSERT_GPA = """
+    INSERT INTO gpadata (student_id, avg_gpa, timestamp)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE avg_gpa = VALUES(avg_gpa), timestamp = VALUES(timestamp)
+"""
+
+_worker_hisshu = None
+
+
+def _init_worker(hisshu_text):
+    # Each worker process compiles the hisshu matcher once
+    global _worker_hisshu
+    _worker_hisshu = HisshuSnapshot.from_text(hisshu_text)
+
+
+def compute_chunk(chunk, hisshu=None):
+    """[(student_id, 成績リスト)] の平均点をまとめて計算し [(ハッシュ済みID, 平均点)] を返す"""
+    hisshu = hisshu or _worker_hisshu
+    points, credits = grade_matrix([grades for _, grades in chunk], hisshu.matcher)
+    averages = batch_gpa(points, credits, weight_vector(hisshu.matcher)).tolist()
+    # Assuming raw IDs in userdata, as it was for raw data storage
+    return [(hashlib.sha256(student_id.encode()).hexdigest(), avg) for (student_id, _), avg in zip(chunk, averages)]
+
+
+def stream_students(cursor, counter):
+    """student_id順の行を読みながら、1人分ずつ (student_id, 成績リスト) にまとめる"""
+    def rows():
+        while True:
+            batch = cursor.fetchmany(FETCH_SIZE)
+            if not batch:
+                return
+            counter.rows += len(batch)
+            yield from batch
+    for student_id, group in itertools.groupby(rows(), key=lambda r: r[0]):
+        yield student_id, [{"subject": s, "grade": g, "credit": c} for _, s, g, c in group]
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Throughput:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.students = 0
+
+    def report(self, label="Progress"):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        print(f"{label}: {self.students} students, {self.rows} rows in {elapsed:.1f}s "
+              f"({self.rows / elapsed:,.0f} rows/s, {self.students / elapsed:,.0f} students/s)")
+
+
+def write_gpas(conn, cursor, results, timestamp_str):
+    """1チャンク分をexecutemanyで書き込んで1回だけcommitする"""
+    cursor.executemany(UPSERT_GPA, [(sid, avg, timestamp_str) for sid, avg in results])
+    conn.commit()
+
+
+def recalc(workers=0):
+    """userdataを読みながら全員のGPAを再計算する（workers>0ならプロセスプールで計算）"""
+    # Load hisshu subjects and compile the matcher once for all students
     try:
-        conn = mysql.connector.connect(
-            host="127.0.0.1",
-            user="seiseki",
-            password="seiseki-mitai",
-            database="seiseki",
-            connection_timeout=3
-        )
-        print("Connected to MySQL (Localhost)")
-        return conn
-    except Exception as e:
-        print(f"Connection failed: {e}")
-        raise e
-
-def load_hisshu():
-    possible_paths = ["list/hisshu.csv", "../list/hisshu.csv", "/app/list/hisshu.csv"]
-    hisshu_path = None
-    for p in possible_paths:
-        if os.path.exists(p):
-            hisshu_path = p
-            break
-    
-    hisshu_subjects = []
-    if hisshu_path:
-        print(f"Loading hisshu.csv from: {hisshu_path}")
+        hisshu = hisshu_catalog.current()
+    except FileNotFoundError as e:
+        print(f"Warning: {e}")
+        return
+    print(f"Using hisshu list version {hisshu.version} ({len(hisshu.subjects)} subjects)")
+
+    # The read side streams an unbuffered result, so writes need their own connection
+    with get_db_connection() as read_conn, get_db_connection() as write_conn:
+        read_cursor = read_conn.cursor(buffered=False)
+        write_cursor = write_conn.cursor()
         try:
-            with open(hisshu_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if "name" in row:
-                        w = row.get("重み", "1")
-                        try:
-                            w = float(w)
-                        except:
-                            w = 1.0
-                        hisshu_subjects.append({"name": row["name"], "weight": w})
-        except Exception as e:
-            print(f"Failed to load hisshu.csv: {e}")
-    else:
-        print("Warning: hisshu.csv not found in any expected location.")
-    return hisshu_subjects
-
-def calculate_gpa(grades, hisshu_subjects):
-    point_map = {"A+": 9, "A": 8, "B": 7, "C": 6, "F": 0, "S": 0}
-    hisshu_best_matches = {}
-    
-    total_weighted_points = 0
-    total_weighted_credits = 0
-
-    for g in grades:
-        subject = g["subject"]
-        grade = g["grade"]
-        credit_str = g["credit"]
-        
-        # Exclude * or ＊ or P
-        if "＊" in grade or "*" in grade or "P" in grade:
-            continue
-        
+            _recalc(read_cursor, write_conn, write_cursor, hisshu, workers)
+        finally:
+            read_cursor.close()
+            write_cursor.close()
+
+
+def _recalc(read_cursor, write_conn, write_cursor, hisshu, workers):
+    timestamp_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    progress = Throughput()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(hisshu.text,)) if workers else None
+
+    try:
+        print("Streaming records from userdata...")
         try:
-            credit = float(credit_str)
-        except:
-            continue
-        
-        # Check if subject is required (contains name from list)
-        matched_hisshu = None
-        for h in hisshu_subjects:
-            if h["name"] in subject:
-                matched_hisshu = h
-                break
-        
-        if matched_hisshu:
-            h_name = matched_hisshu["name"]
-            h_weight = matched_hisshu["weight"]
-            p = point_map.get(grade, 0)
-            
-            # Calculate potential contribution
-            points = p * credit * h_weight
-            w_credits = credit * h_weight
-            
-            # Check if we already have a match for this hisshu subject
-            if h_name in hisshu_best_matches:
-                # Compare grades. Higher point value wins.
-                if p > hisshu_best_matches[h_name]["grade_val"]:
-                    hisshu_best_matches[h_name] = {
-                        "points": points,
-                        "w_credits": w_credits,
-                        "grade_val": p,
-                        "subject": subject,
-                        "grade": grade
-                    }
-            else:
-                hisshu_best_matches[h_name] = {
-                    "points": points,
-                    "w_credits": w_credits,
-                    "grade_val": p,
-                    "subject": subject,
-                    "grade": grade
-                }
-
-    # Sum up results
-    for h_name, data in hisshu_best_matches.items():
-        total_weighted_points += data["points"]
-        total_weighted_credits += data["w_credits"]
-    
-    average_score = 0
-    if total_weighted_credits > 0:
-        average_score = total_weighted_points / total_weighted_credits
-        
-    return average_score
-
-def recalc():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    # Load hisshu subjects
-    hisshu_subjects = load_hisshu()
-    
-    print("Fetching all records from userdata...")
+            read_cursor.execute("SELECT student_id, subject, grade, credit FROM userdata ORDER BY student_id")
+        except mysql.connector.Error as e:
+            print(f"Error fetching userdata: {e}")
+            print("Make sure the 'userdata' table exists and has data.")
+            return
+
+        chunks = chunked(stream_students(read_cursor, progress), CHUNK_STUDENTS)
+        if pool is None:
+            for chunk in chunks:
+                write_gpas(write_conn, write_cursor, compute_chunk(chunk, hisshu), timestamp_str)
+                progress.students += len(chunk)
+                progress.report()
+        else:
+            # Keep a bounded number of chunks in flight so memory stays flat
+            pending = set()
+            for chunk in chunks:
+                pending.add(pool.submit(compute_chunk, chunk))
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results = future.result()
+                        write_gpas(write_conn, write_cursor, results, timestamp_str)
+                        progress.students += len(results)
+                    progress.report()
+            for future in pending:
+                results = future.result()
+                write_gpas(write_conn, write_cursor, results, timestamp_str)
+                progress.students += len(results)
+
+        if progress.rows == 0:
+            print("No data found in userdata table.")
+            return
+        progress.report("Recalculation completed")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def recalc_incremental(full=False):
+    """gradedataの成績から、hisshu.csvの変更で結果が変わりうる学生だけを再計算する"""
     try:
-        cursor.execute("SELECT * FROM userdata")
-        rows = cursor.fetchall()
-    except mysql.connector.Error as e:
-        print(f"Error fetching userdata: {e}")
-        print("Make sure the 'userdata' table exists and has data.")
+        hisshu = hisshu_catalog.current()
+    except FileNotFoundError as e:
+        print(f"Warning: {e}")
         return
+    print(f"Using hisshu list version {hisshu.version} ({len(hisshu.subjects)} subjects)")
+
+    with get_db_connection() as read_conn, get_db_connection() as conn:
+        read_cursor = read_conn.cursor(buffered=False)
+        cursor = conn.cursor()
+        try:
+            recomputed, current, unaffected, rewritten = _recalc_incremental(read_cursor, conn, cursor, hisshu, full)
+        finally:
+            read_cursor.close()
+            cursor.close()
+    print(f"Recomputed {recomputed} students, skipped {current + unaffected + rewritten} "
+          f"({current} already on version {hisshu.version}, {unaffected} unaffected by the change, "
+          f"{rewritten} rewritten by the server during the scan).")
+    if recomputed:
+        print("Run 'make rebuild-stats' so the running backend picks up the new GPAs.")
+    return {"recomputed": recomputed, "skipped": current + unaffected + rewritten}
 
-    if not rows:
-        print("No data found in userdata table.")
-        return
 
-    # Group by student_id
-    students = {}
-    for row in rows:
-        sid = row['student_id']
-        if sid not in students:
-            students[sid] = []
-        students[sid].append(row)
-    
-    print(f"Found {len(students)} unique students.")
-    
+def lock_unchanged(cursor, recomputed):
+    """読んだ時からhisshu_versionが変わっていない行だけを残す（行はcommitまでロックされる）
+
+    recomputed: (student_id, 読んだ時のhisshu_version, ...) のリスト
+    """
+    placeholders = ", ".join(["%s"] * len(recomputed))
+    cursor.execute(f"SELECT student_id, hisshu_version FROM gradedata WHERE student_id IN ({placeholders}) FOR UPDATE",
+                   [row[0] for row in recomputed])
+    versions = dict(cursor.fetchall())
+    return [row for row in recomputed if row[0] in versions and versions[row[0]] == row[1]]
+
+
+def _recalc_incremental(read_cursor, conn, cursor, hisshu, full):
     timestamp_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    for student_id, grades in students.items():
-        print(f"Processing student: {student_id}")
-        
-        # Calculate GPA
-        avg_gpa = calculate_gpa(grades, hisshu_subjects)
-        print(f"  -> Calculated GPA: {avg_gpa}")
-        
-        # Hash student_id
-        # Check if it's already hashed? Assuming userdata has raw IDs as per request context.
-        # But if userdata has mixed, we might double hash. 
-        # Assuming raw IDs for now as 'userdata' was for raw data storage.
-        hashed_id = hashlib.sha256(student_id.encode()).hexdigest()
-        
-        # Update gpadata
-        try:
-            cursor.execute("""
-                INSERT INTO gpadata (student_id, avg_gpa, timestamp)
-                VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE avg_gpa = %s, timestamp = %s
-            """, (hashed_id, avg_gpa, timestamp_str, avg_gpa, timestamp_str))
-            conn.commit()
-            print(f"  -> Saved to gpadata as {hashed_id}")
-        except Exception as e:
-            print(f"  -> Error saving to gpadata: {e}")
-
-    cursor.close()
-    conn.close()
-    print("Recalculation completed.")
+    cursor.execute(
+        "INSERT IGNORE INTO hisshu_versions (version, content, created_at) VALUES (%s, %s, %s)",
+        (hisshu.version, hisshu.text, timestamp_str),
+    )
+
+    if full:
+        current = 0
+        read_cursor.execute("SELECT student_id, grades, matched, hisshu_version FROM gradedata ORDER BY student_id")
+    else:
+        cursor.execute("SELECT COUNT(*) FROM gradedata WHERE hisshu_version = %s", (hisshu.version,))
+        current = cursor.fetchone()[0]
+        read_cursor.execute(
+            "SELECT student_id, grades, matched, hisshu_version FROM gradedata "
+            "WHERE hisshu_version IS NULL OR hisshu_version <> %s ORDER BY student_id",
+            (hisshu.version,),
+        )
+
+    # Old hisshu version -> HisshuChange (None if that version was never recorded)
+    changes = {}
+    recomputed = unaffected = rewritten = 0
+    progress = Throughput()
+    while True:
+        rows = read_cursor.fetchmany(CHUNK_STUDENTS)
+        if not rows:
+            break
+        progress.rows += len(rows)
+        changed, unchanged = [], []
+        for student_id, blob, matched, version in rows:
+            if not full:
+                if version not in changes:
+                    old = grade_store.load_hisshu_version(cursor, version) if version else None
+                    changes[version] = grade_store.HisshuChange(old, hisshu) if old else None
+                change = changes[version]
+                if change is not None and not change.affects(matched, blob):
+                    unchanged.append((hisshu.version, student_id, version))
+                    continue
+
+            avg_gpa, matches = calculate_gpa(grade_store.decode_grades(blob), hisshu.matcher)
+            changed.append((student_id, version, avg_gpa, grade_store.encode_matched(matches)))
+        if changed:
+            # A row the server rewrote since it was read already has a fresh GPA; only write the others
+            fresh = lock_unchanged(cursor, changed)
+            rewritten += len(changed) - len(fresh)
+            if fresh:
+                cursor.executemany(
+                    "UPDATE gradedata SET matched = %s, hisshu_version = %s WHERE student_id = %s AND hisshu_version <=> %s",
+                    [(matched, hisshu.version, student_id, version) for student_id, version, _, matched in fresh])
+                cursor.executemany(UPSERT_GPA, [(student_id, avg_gpa, timestamp_str) for student_id, _, avg_gpa, _ in fresh])
+            recomputed += len(fresh)
+        if unchanged:
+            # Students the change could not affect keep their GPA; just mark the ones this scan classified
+            # as up to date (a row the server rewrote since it was read no longer has the old version)
+            cursor.executemany(
+                "UPDATE gradedata SET hisshu_version = %s WHERE student_id = %s AND hisshu_version = %s", unchanged)
+        conn.commit()
+        unaffected += len(unchanged)
+        progress.students += len(rows)
+
+    conn.commit()
+    progress.report("Recalculation completed")
+    return recomputed, current, unaffected, rewritten
 
 if __name__ == "__main__":
-    recalc()
+    parser = argparse.ArgumentParser(description="Recalculate GPAs after hisshu.csv changes")
+    parser.add_argument("--full", action="store_true", help="recompute every student in gradedata")
+    parser.add_argument("--userdata", action="store_true", help="recompute everyone from the legacy userdata table")
+    parser.add_argument("--workers", type=int, default=0, help="compute --userdata chunks in this many processes")
+    args = parser.parse_args()
+    if args.userdata:
+        recalc(workers=args.workers)
+    else:
+        recalc_incremental(full=args.full)
@@ -0,0 +1,208 @@
+import functools
+import json
+import os
+import re
+import threading
+
+# "enforce": block matching requests via CDP
+# "measure": block nothing, but report what the policy would have saved
+# "off": neither
+BLOCK_MODE = os.environ.get("RESOURCE_BLOCK_MODE", "enforce").lower()
+
+# File extensions per CDP resource type. Network.setBlockedURLs matches URLs only,
+# so resource types are translated into file-extension patterns.
+RESOURCE_TYPE_EXTENSIONS = {
+    "Image": ["png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "bmp"],
+    "Font": ["woff", "woff2", "ttf", "otf", "eot"],
+    "Media": ["mp4", "webm", "mp3", "ogg", "wav", "m4a"],
+}
+
+
+def _extension_patterns(extension):
+    # Anchored to the end of the path, so "/icons/" or "?format=svgz" do not match
+    return [f"*.{extension}", f"*.{extension}?*"]
+
+
+RESOURCE_TYPE_PATTERNS = {
+    resource_type: [p for ext in extensions for p in _extension_patterns(ext)]
+    for resource_type, extensions in RESOURCE_TYPE_EXTENSIONS.items()
+}
+TRACKER_PATTERNS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*connect.facebook.net*",
+    "*clarity.ms*",
+    "*hotjar.com*",
+    "*browser.events.data.microsoft.com*",
+]
+
+
+@functools.lru_cache(maxsize=256)
+def _wildcard_regex(pattern):
+    # Same rules as Network.setBlockedURLs: only "*" is a wildcard ("?" is the literal query separator)
+    return re.compile(".*".join(re.escape(part) for part in pattern.split("*")), re.DOTALL)
+
+
+def _wildcard_match(url, pattern):
+    return _wildcard_regex(pattern).fullmatch(url) is not None
+
+
+def _env_list(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return list(default)
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+class ResourcePolicy:
+    """ブロックするリソースの種類・URLパターンと、例外にするURLパターン"""
+
+    def __init__(self, mode=BLOCK_MODE, resource_types=None, deny_patterns=None, allow_patterns=None):
+        self.mode = mode
+        self.resource_types = resource_types if resource_types is not None else _env_list(
+            "RESOURCE_BLOCK_TYPES", ["Image", "Font", "Media"])
+        self.deny_patterns = deny_patterns if deny_patterns is not None else _env_list(
+            "RESOURCE_BLOCK_URLS", TRACKER_PATTERNS)
+        self.allow_patterns = allow_patterns if allow_patterns is not None else _env_list(
+            "RESOURCE_ALLOW_URLS", [])
+
+    @property
+    def enabled(self):
+        return self.mode in ("enforce", "measure")
+
+    @property
+    def metering(self):
+        """スクレイピング毎の通信量を計測するか（Chromeのパフォーマンスログが要るのでmeasureの時だけ）"""
+        return self.mode == "measure"
+
+    def blocked_url_patterns(self):
+        """CDPに渡すパターン一覧（allowに含まれるパターンは除く）"""
+        patterns = []
+        for resource_type in self.resource_types:
+            patterns.extend(RESOURCE_TYPE_PATTERNS.get(resource_type, []))
+        patterns.extend(self.deny_patterns)
+        return [p for p in dict.fromkeys(patterns) if p not in self.allow_patterns]
+
+    def would_block(self, url):
+        if any(_wildcard_match(url, p) for p in self.allow_patterns):
+            return False
+        return any(_wildcard_match(url, p) for p in self.blocked_url_patterns())
+
+
+policy = ResourcePolicy()
+
+
+def configure_options(options):
+    """計測用にパフォーマンスログ（Networkイベント）を有効にする（measureの時だけ）"""
+    if policy.metering:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+
+def apply_policy(driver):
+    """現在のタブにブロックリストを設定する（新しいタブ・ウィンドウには個別に呼ぶ）"""
+    if policy.mode != "enforce":
+        return
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": policy.blocked_url_patterns()})
+    except Exception as e:
+        print(f"[BLOCK] Could not apply resource blocking: {e}")
+
+
+class ResourceStats:
+    """スクレイピング毎の通信量をモード別に集計する（/metrics用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, report):
+        with self._lock:
+            t = self._totals.setdefault(report["mode"], {
+                "scrapes": 0, "requests": 0, "bytes": 0, "blocked_requests": 0,
+                "blockable_requests": 0, "blockable_bytes": 0,
+            })
+            t["scrapes"] += 1
+            for key in ("requests", "bytes", "blocked_requests", "blockable_requests", "blockable_bytes"):
+                t[key] += report[key]
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for mode, t in self._totals.items():
+                n = t["scrapes"]
+                result[mode] = {
+                    **t,
+                    "avg_requests_per_scrape": round(t["requests"] / n, 1),
+                    "avg_bytes_per_scrape": round(t["bytes"] / n),
+                    "avg_requests_saved_per_scrape": round((t["blocked_requests"] + t["blockable_requests"]) / n, 1),
+                    "avg_bytes_saved_per_scrape": round(t["blockable_bytes"] / n),
+                }
+            return {"policy": {"mode": policy.mode, "patterns": policy.blocked_url_patterns()}, "modes": result}
+
+
+resource_stats = ResourceStats()
+
+
+class ResourceMeter:
+    """パフォーマンスログから、1回のスクレイピングのリクエスト数・転送量・ブロック数を集計する"""
+
+    def __init__(self, driver, label="SCRAPE"):
+        self.driver = driver
+        self.label = label
+        self._requests = {}
+        self._bytes = {}
+        self._blocked = 0
+
+    def _drain(self):
+        try:
+            entries = self.driver.get_log("performance")
+        except Exception:
+            return
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, ValueError):
+                continue
+            method = message.get("method")
+            params = message.get("params", {})
+            if method == "Network.requestWillBeSent":
+                self._requests[params["requestId"]] = (params["request"]["url"], params.get("type", "Other"))
+            elif method == "Network.loadingFinished":
+                self._bytes[params["requestId"]] = params.get("encodedDataLength", 0)
+            elif method == "Network.loadingFailed" and params.get("blockedReason"):
+                self._blocked += 1
+
+    def start(self):
+        """前回の利用分のログを捨てる"""
+        if policy.metering:
+            self._drain()
+            self._requests, self._bytes, self._blocked = {}, {}, 0
+
+    def finish(self):
+        if not policy.metering:
+            return None
+        self._drain()
+        report = {
+            "mode": policy.mode,
+            "requests": len(self._requests),
+            "bytes": int(sum(self._bytes.values())),
+            "blocked_requests": self._blocked,
+            "blockable_requests": 0,
+            "blockable_bytes": 0,
+            "by_type": {},
+        }
+        for request_id, (url, resource_type) in self._requests.items():
+            size = int(self._bytes.get(request_id, 0))
+            by_type = report["by_type"].setdefault(resource_type, {"requests": 0, "bytes": 0})
+            by_type["requests"] += 1
+            by_type["bytes"] += size
+            if policy.mode == "measure" and policy.would_block(url):
+                report["blockable_requests"] += 1
+                report["blockable_bytes"] += size
+        resource_stats.record(report)
+        print(f"[{self.label}] Network: {report['requests']} requests, {report['bytes']} bytes, "
+              f"blocked {report['blocked_requests']}, would block {report['blockable_requests']} "
+              f"({report['blockable_bytes']} bytes)")
+        return report
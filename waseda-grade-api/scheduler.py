@@ -0,0 +1,178 @@
+import itertools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from browser_pool import POOL_SIZE
+
+# Scheduler configuration (override with environment variables)
+MAX_CONCURRENCY = max(1, int(os.environ.get("SCRAPE_MAX_CONCURRENCY", str(POOL_SIZE))))
+QUEUE_SIZE = max(0, int(os.environ.get("SCRAPE_QUEUE_SIZE", "20")))
+QUEUE_TIMEOUT = float(os.environ.get("SCRAPE_QUEUE_TIMEOUT", "300"))
+# Adapt the concurrency cap to free memory (one scrape ~ one headless Chrome)
+ADAPTIVE = os.environ.get("SCRAPE_ADAPTIVE", "1") not in ("0", "false", "no")
+MEMORY_PER_JOB_MB = float(os.environ.get("SCRAPE_MEMORY_PER_JOB_MB", "350"))
+MEMORY_RESERVE_MB = float(os.environ.get("SCRAPE_MEMORY_RESERVE_MB", "256"))
+# Initial guess for how long one scrape takes, refined as jobs finish
+INITIAL_JOB_SECONDS = float(os.environ.get("SCRAPE_INITIAL_JOB_SECONDS", "30"))
+
+
+class QueueFullError(Exception):
+    """待ち行列が満杯で受け付けられない"""
+
+    def __init__(self, estimated_wait):
+        super().__init__(f"Scrape queue is full (estimated wait {estimated_wait:.0f}s)")
+        self.estimated_wait = estimated_wait
+
+
+class QueueTimeoutError(Exception):
+    """待ち行列で待ちすぎた"""
+
+
+def available_memory_mb():
+    """/proc/meminfo の MemAvailable（MB）。取得できなければNone"""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class Ticket:
+    def __init__(self, number, estimated_wait):
+        self.number = number
+        self.enqueued_at = time.monotonic()
+        self.estimated_wait = estimated_wait
+
+
+class ScrapeScheduler:
+    """同時実行数の上限と有限のFIFO待ち行列でスクレイピングの受け付けを制御する"""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, queue_size=QUEUE_SIZE, queue_timeout=QUEUE_TIMEOUT,
+                 adaptive=ADAPTIVE, memory_per_job_mb=MEMORY_PER_JOB_MB, memory_reserve_mb=MEMORY_RESERVE_MB):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.memory_per_job_mb = memory_per_job_mb
+        self.memory_reserve_mb = memory_reserve_mb
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._running = 0
+        self._numbers = itertools.count(1)
+        self._avg_job_seconds = INITIAL_JOB_SECONDS
+        self._limit = max_concurrency
+        self._limit_checked_at = 0.0
+        self._counters = {"admitted": 0, "rejected": 0, "timed_out": 0, "completed": 0}
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    def current_limit(self):
+        """現在の同時実行数の上限（空きメモリに応じて下げる）"""
+        if not self.adaptive:
+            return self.max_concurrency
+        now = time.monotonic()
+        if now - self._limit_checked_at >= 1.0:
+            self._limit_checked_at = now
+            free_mb = available_memory_mb()
+            if free_mb is None:
+                self._limit = self.max_concurrency
+            else:
+                # Memory of running jobs is already used, so only new jobs need to fit into what is left
+                extra = int(max(0.0, free_mb - self.memory_reserve_mb) // self.memory_per_job_mb)
+                self._limit = max(1, min(self.max_concurrency, self._running + extra))
+        return self._limit
+
+    def _estimate_wait(self, position):
+        """position番目（0始まり）に並んだ場合の推定待ち時間（秒）"""
+        limit = self.current_limit()
+        busy = self._running >= limit
+        rounds = math.ceil((position + (1 if busy else 0)) / limit)
+        return rounds * self._avg_job_seconds
+
+    def admit(self):
+        """待ち行列に並ぶ。満杯ならすぐにQueueFullErrorを投げる"""
+        with self._cond:
+            # Every ticket passes through the queue, including ones about to take a free slot,
+            # so the queue may hold queue_size waiting tickets plus one per free slot
+            free = max(0, self.current_limit() - self._running)
+            if len(self._queue) >= self.queue_size + free:
+                self._counters["rejected"] += 1
+                raise QueueFullError(self._estimate_wait(len(self._queue)))
+            ticket = Ticket(next(self._numbers), self._estimate_wait(len(self._queue)))
+            self._queue.append(ticket)
+            self._counters["admitted"] += 1
+            return ticket
+
+    def _wait_turn(self, ticket):
+        deadline = ticket.enqueued_at + self.queue_timeout
+        with self._cond:
+            try:
+                while self._queue[0] is not ticket or self._running >= self.current_limit():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timed_out"] += 1
+                        raise QueueTimeoutError(f"Waited more than {self.queue_timeout:g}s in the scrape queue")
+                    # Re-check periodically so the memory-based limit can grow again
+                    self._cond.wait(min(remaining, 1.0))
+            except BaseException:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+                raise
+            self._queue.popleft()
+            self._running += 1
+            waited = time.monotonic() - ticket.enqueued_at
+            self._queue_wait_total += waited
+            self._queue_wait_max = max(self._queue_wait_max, waited)
+            self._cond.notify_all()
+        return waited
+
+    def _finish(self, started):
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._running -= 1
+            self._counters["completed"] += 1
+            # Exponential moving average of job duration for wait estimates
+            self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
+            self._cond.notify_all()
+
+    @contextmanager
+    def run(self, ticket):
+        """順番が来るまで待ってから実行枠を確保する"""
+        self._wait_turn(ticket)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._finish(started)
+
+    @contextmanager
+    def slot(self):
+        with self.run(self.admit()):
+            yield
+
+    def stats(self):
+        with self._cond:
+            started = self._counters["completed"] + self._running
+            return {
+                "max_concurrency": self.max_concurrency,
+                "current_limit": self.current_limit(),
+                "running": self._running,
+                "queued": len(self._queue),
+                "queue_size": self.queue_size,
+                "available_memory_mb": round(available_memory_mb() or 0) if self.adaptive else None,
+                **self._counters,
+                "avg_job_seconds": round(self._avg_job_seconds, 2),
+                "estimated_wait_seconds": round(self._estimate_wait(len(self._queue)), 1),
+                "queue_wait_seconds_avg": round(self._queue_wait_total / started, 3) if started else 0.0,
+                "queue_wait_seconds_max": round(self._queue_wait_max, 3),
+            }
+
+
+scrape_scheduler = ScrapeScheduler()
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+import grade_store
+from db import get_db_connection
+from gpa import grade_matrix, weight_vector
+from hisshu import hisshu_catalog
+from stats import DISPLAY_STEP, MAX_SCORE
+
+# Grade matrices are rebuilt from gradedata after this many seconds (or when hisshu.csv changes)
+SIMULATION_CACHE_TTL = float(os.environ.get("SIMULATION_CACHE_TTL", "300"))
+# gradedata rows decoded per fetch while building the matrices
+LOAD_FETCH_SIZE = 1000
+
+
+class Cohort:
+    """全学生の必修科目の (点数, 単位数) 行列。重みに依らないので、どの重みの試算にも使い回せる"""
+
+    def __init__(self, student_ids, points, credits, hisshu):
+        self.student_ids = student_ids
+        self.points = points
+        self.credits = credits
+        self.hisshu = hisshu
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_grades(cls, students, hisshu):
+        """{student_id: [grade dict]} から作る"""
+        student_ids = list(students)
+        points, credits = grade_matrix([students[sid] for sid in student_ids], hisshu.matcher)
+        return cls(student_ids, points, credits, hisshu)
+
+
+def _ranks(scores):
+    """各学生の順位（高い順、同点は同順位）"""
+    ordered = np.sort(scores)
+    return len(scores) - np.searchsorted(ordered, scores, side="right") + 1
+
+
+def _histogram(scores):
+    bins = int(round(MAX_SCORE / DISPLAY_STEP)) + 1
+    index = np.clip(np.floor(scores / DISPLAY_STEP + 1e-9).astype(np.int64), 0, bins - 1)
+    counts = np.bincount(index, minlength=bins)
+    return [{"score": f"{i * DISPLAY_STEP:.1f}", "count": int(c)} for i, c in enumerate(counts)]
+
+
+def _summary(scores):
+    return {
+        "mean": float(scores.mean()) if len(scores) else 0.0,
+        # Population stdev, as on the admin page
+        "stdev": float(scores.std()) if len(scores) else 0.0,
+        "distribution": _histogram(scores),
+    }
+
+
+def profile_weights(hisshu, overrides):
+    """現在の重みに、必修科目名→重みの上書きを当てはめたベクトル"""
+    weights = weight_vector(hisshu.matcher)
+    names = [h["name"] for h in hisshu.subjects]
+    unknown = [name for name in overrides if name not in names]
+    if unknown:
+        raise ValueError(f"Unknown hisshu subjects: {', '.join(unknown)}")
+    for name, weight in overrides.items():
+        weights[names.index(name)] = float(weight)
+    return weights
+
+
+def simulate(cohort, profiles):
+    """重みの案毎に、分布・ヒストグラムと現在の重みからの順位の変動を求める
+
+    profiles は [{"name": ..., "weights": {必修科目名: 重み}}]（指定しない科目は現在の重み）
+    """
+    hisshu = cohort.hisshu
+    matrix = np.stack([weight_vector(hisshu.matcher)] +
+                      [profile_weights(hisshu, p.get("weights", {})) for p in profiles])
+    # One matrix product per term covers the baseline and every profile: (students x subjects) @ (subjects x profiles)
+    totals = cohort.credits @ matrix.T
+    sums = (cohort.points * cohort.credits) @ matrix.T
+    scores = np.divide(sums, totals, out=np.zeros_like(sums), where=totals > 0)
+
+    baseline = scores[:, 0]
+    baseline_ranks = _ranks(baseline)
+    results = []
+    for k, profile in enumerate(profiles, start=1):
+        shift = baseline_ranks - _ranks(scores[:, k])  # positive = moved up
+        moved = np.abs(shift)
+        results.append({
+            "name": profile.get("name") or f"profile {k}",
+            **_summary(scores[:, k]),
+            "rank_shift": {
+                "students_moved": int(np.count_nonzero(shift)),
+                "mean_abs": float(moved.mean()) if len(moved) else 0.0,
+                "p90_abs": float(np.percentile(moved, 90)) if len(moved) else 0.0,
+                "max_up": int(shift.max()) if len(shift) else 0,
+                "max_down": int(-shift.min()) if len(shift) else 0,
+            },
+        })
+    return {
+        "total_students": len(cohort.student_ids),
+        "hisshu_version": hisshu.version,
+        "baseline": _summary(baseline),
+        "profiles": results,
+    }
+
+
+class CohortSimulator:
+    """gradedataの成績から作った行列をキャッシュして、重みの試算に使う（gpadataには書き込まない）"""
+
+    def __init__(self, ttl=SIMULATION_CACHE_TTL):
+        self.ttl = ttl
+        self._cohort = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        hisshu = hisshu_catalog.current()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT student_id, grades FROM gradedata")
+            students = {}
+            while True:
+                rows = cursor.fetchmany(LOAD_FETCH_SIZE)
+                if not rows:
+                    break
+                for student_id, blob in rows:
+                    students[student_id] = grade_store.decode_grades(blob)
+            cursor.close()
+        finally:
+            conn.close()
+        cohort = Cohort.from_grades(students, hisshu)
+        print(f"[SIMULATE] Built grade matrix for {len(cohort.student_ids)} students (hisshu {hisshu.version})")
+        return cohort
+
+    def cohort(self, refresh=False):
+        with self._lock:
+            cohort = self._cohort
+            stale = (cohort is None or refresh or time.monotonic() - cohort.built_at > self.ttl
+                     or cohort.hisshu.version != hisshu_catalog.version)
+            if stale:
+                self._cohort = cohort = self._load()
+            return cohort
+
+    def run(self, profiles, refresh=False):
+        started = time.perf_counter()
+        result = simulate(self.cohort(refresh), profiles)
+        result["elapsed_seconds"] = round(time.perf_counter() - started, 4)
+        return result
+
+
+simulator = CohortSimulator()
@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+
+# Launch and quit one throwaway Chrome during startup to fill the OS page cache
+WARMUP_CHROME = os.environ.get("WARMUP_CHROME", "0") not in ("0", "false", "no")
+
+
+class StartupReport:
+    """起動処理をステージ毎に実行し、所要時間を記録する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = []
+        self._threads = []
+        self._started = time.monotonic()
+        self.ready_seconds = None
+
+    def run(self, name, func):
+        """funcを実行して所要時間を記録する。失敗しても起動は続ける"""
+        started = time.monotonic()
+        try:
+            func()
+            ok, error = True, None
+        except Exception as e:
+            ok, error = False, str(e)
+            print(f"WARNING: Startup stage '{name}' failed: {e}")
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.stages.append({"stage": name, "seconds": round(elapsed, 3), "ok": ok, "error": error})
+        return ok
+
+    def run_in_background(self, chains, on_done=None):
+        """ステージの列をそれぞれ別スレッドで順に実行する（列同士は並行）。全て終わったらon_doneを呼ぶ"""
+        self._started = time.monotonic()
+        remaining = [len(chains)]
+
+        def run_chain(stages):
+            for name, func in stages:
+                self.run(name, func)
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+                if last:
+                    self.ready_seconds = round(time.monotonic() - self._started, 3)
+            if last and on_done:
+                on_done()
+
+        for i, stages in enumerate(chains):
+            thread = threading.Thread(target=run_chain, args=(stages,), name=f"startup-{i}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def finished(self):
+        with self._lock:
+            return self.ready_seconds is not None
+
+    def status(self, name):
+        """ステージの状態: "pending"（未完了）/ "ok" / "failed"（エラーも返す）"""
+        with self._lock:
+            for s in self.stages:
+                if s["stage"] == name:
+                    return ("ok", None) if s["ok"] else ("failed", s["error"])
+        return "pending", None
+
+    def total_seconds(self):
+        with self._lock:
+            return round(sum(s["seconds"] for s in self.stages), 3)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": list(self.stages),
+                "total_seconds": round(sum(s["seconds"] for s in self.stages), 3),
+                "ready_seconds": self.ready_seconds,
+            }
+
+    def summary(self):
+        with self._lock:
+            stages = ", ".join(f"{s['stage']}={s['seconds']:.2f}s{'' if s['ok'] else '(failed)'}" for s in self.stages)
+            ready = f"finished after {self.ready_seconds:.2f}s, " if self.ready_seconds is not None else ""
+        return f"[STARTUP] {ready}{self.total_seconds():.2f}s total: {stages}"
+
+
+startup_report = StartupReport()
@@ -0,0 +1,108 @@
+import math
+import threading
+
+from db import get_db_connection
+from rank_index import RankIndex, rank_index
+
+# Histogram shown to users: 0.2-wide bins from 0.0 to 9.0 (same as the admin page)
+MAX_SCORE = 9.0
+DISPLAY_STEP = 0.2
+
+
+def _bin(value, step, count):
+    # The small epsilon keeps e.g. 7.6 / 0.2 = 37.99999... in bin 38
+    return min(max(int(math.floor(value / step + 1e-9)), 0), count - 1)
+
+
+class GpaAggregate:
+    """gpadataのavg_gpaの件数・平均・標準偏差・ヒストグラムを書き込み毎に更新する（順位はRankIndex）"""
+
+    def __init__(self, max_score=MAX_SCORE, display_step=DISPLAY_STEP, index=None):
+        self.display_step = display_step
+        self._display_bins = int(round(max_score / display_step)) + 1
+        self.index = index if index is not None else RankIndex()
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._display = [0] * self._display_bins
+        self.loaded = False
+
+    def _add(self, score, sign):
+        self._sum += sign * score
+        self._sumsq += sign * score * score
+        self._display[_bin(score, self.display_step, self._display_bins)] += sign
+
+    def load(self, rows):
+        """(student_id, avg_gpa) の一覧から作り直す"""
+        rows = list(rows)
+        with self._lock:
+            self._clear()
+            self.index.load(rows)
+            for student_id, score in rows:
+                if score is not None:
+                    self._add(float(score), 1)
+            self.loaded = True
+
+    def load_from_db(self):
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT student_id, avg_gpa FROM gpadata WHERE avg_gpa IS NOT NULL")
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        self.load(rows)
+        print(f"[STATS] Loaded {len(rows)} scores")
+
+    def upsert(self, student_id, score):
+        with self._lock:
+            old = self.index.upsert(student_id, score)
+            if old is not None:
+                self._add(old, -1)
+            if score is not None:
+                self._add(float(score), 1)
+
+    def remove(self, student_id):
+        self.upsert(student_id, None)
+
+    def _moments(self):
+        n = len(self.index)
+        if n == 0:
+            return 0, 0.0, 0.0
+        mean = self._sum / n
+        # Population variance, as on the admin page
+        variance = max(0.0, self._sumsq / n - mean * mean)
+        return n, mean, math.sqrt(variance)
+
+    def position(self, score):
+        """scoreの順位（同点は同順位）・パーセンタイルと偏差値"""
+        with self._lock:
+            n, mean, stdev = self._moments()
+            deviation = 50 + 10 * (score - mean) / stdev if stdev > 0 else 50.0
+            return {
+                "rank": self.index.rank(score),
+                "percentile": self.index.percentile(score),
+                "total_students": n,
+                "deviation_score": deviation,
+            }
+
+    def summary(self):
+        with self._lock:
+            n, mean, stdev = self._moments()
+            display = list(self._display)
+        return {
+            "total": n,
+            "mean": mean,
+            "stdev": stdev,
+            "distribution": [
+                {"score": f"{i * self.display_step:.1f}", "count": c}
+                for i, c in enumerate(display)
+            ],
+        }
+
+
+gpa_aggregate = GpaAggregate(index=rank_index)
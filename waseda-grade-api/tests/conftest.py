@@ -0,0 +1,117 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# Tests import the backend modules the same way main.py does, and reuse the benchmarks' reference implementations
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(API_DIR, "benchmarks"))
+sys.path.insert(0, API_DIR)
+
+FIXTURES_DIR = os.path.join(API_DIR, "benchmarks", "fixtures")
+
+
+def pytest_addoption(parser):
+    parser.addoption("--run-benchmarks", action="store_true", help="also run tests marked benchmark (wall-clock bounds)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: timing-sensitive test, skipped unless --run-benchmarks is given")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Wall-clock bounds depend on the machine, so they stay out of the default run (and CI)
+    if config.getoption("--run-benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="timing-sensitive; run with --run-benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def fixture_html():
+    """benchmarks/fixtures/ のページを読む関数"""
+    def read(name):
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+            return f.read()
+    return read
+
+
+@pytest.fixture
+def golden():
+    with open(os.path.join(FIXTURES_DIR, "golden.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class LocalRequest:
+    def __init__(self, method, path, query, form, cookie):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.form = form
+        self.cookie = cookie
+
+
+class LocalServer:
+    def __init__(self, server):
+        self.url = f"http://127.0.0.1:{server.server_address[1]}"
+        self.requests = server.requests
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """server.app(request) が返す (ステータス, 本文[, ヘッダー]) を送る"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        request = LocalRequest(
+            method,
+            url.path,
+            {k: v[0] for k, v in parse_qs(url.query).items()},
+            {k: v[0] for k, v in parse_qs(body).items()},
+            self.headers.get("Cookie", ""),
+        )
+        self.server.requests.append(request)
+        status, text, *rest = self.server.app(request)
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (rest[0] if rest else {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+@pytest.fixture
+def local_server():
+    """app(request) で応答するHTTPサーバーをローカルで起動する関数。テストの終わりに止める"""
+    servers = []
+
+    def start(app):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        server.app = app
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return LocalServer(server)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
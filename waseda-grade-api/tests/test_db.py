@@ -0,0 +1,40 @@
+import pytest
+
+from db import DatabasePool
+
+
+class FakeConnection:
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class FakeMySQLPool:
+    def get_connection(self):
+        return FakeConnection()
+
+
+def open_pool(size):
+    pool = DatabasePool(size=size, hosts=["test"], checkout_timeout=0.05)
+    pool._pool = FakeMySQLPool()
+    return pool
+
+
+def test_with_block_returns_the_connection_on_error():
+    pool = open_pool(size=1)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            with pool.get_connection():
+                raise RuntimeError("query failed")
+    assert pool.stats()["in_use"] == 0
+    with pool.get_connection():
+        assert pool.stats()["in_use"] == 1
+
+
+def test_unreturned_connection_exhausts_the_pool():
+    pool = open_pool(size=1)
+    pool.get_connection()
+    with pytest.raises(TimeoutError):
+        pool.get_connection()
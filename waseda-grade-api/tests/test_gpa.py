@@ -0,0 +1,83 @@
+"""GPA計算と必修科目の照合が、以前の実装（入れ子ループ）と同じ結果になることを確認する"""
+import random
+
+import pytest
+
+from bench_gpa_engine import HISSHU_CSV, reference_gpa, synthetic_cohort
+from gpa import batch_gpa, calculate_gpa, grade_matrix, weight_vector
+from hisshu import HisshuCatalog, HisshuMatcher, normalize
+
+
+@pytest.fixture(scope="module")
+def hisshu():
+    return HisshuCatalog(paths=[HISSHU_CSV]).current()
+
+
+def reference_match_index(subjects, subject):
+    """以前の照合（hisshu.csvの上から順に `name in subject`）。全角・半角は揃えてから比べる"""
+    for i, h in enumerate(subjects):
+        if normalize(h["name"]) in normalize(subject):
+            return i
+    return -1
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_scalar_and_batch_match_reference(hisshu, seed):
+    students = synthetic_cohort(500, hisshu.subjects, random.Random(seed))
+    scalar = [calculate_gpa(grades, hisshu.matcher)[0] for grades in students]
+    points, credits = grade_matrix(students, hisshu.matcher)
+    batch = batch_gpa(points, credits, weight_vector(hisshu.matcher)).tolist()
+
+    for grades, sca, bat in zip(students, scalar, batch):
+        assert sca == reference_gpa(grades, hisshu.subjects)
+        assert bat == pytest.approx(sca, abs=1e-9)
+
+
+def test_best_grade_wins_for_retakes(hisshu):
+    name = hisshu.subjects[0]["name"]
+    grades = [
+        {"subject": name, "grade": "F", "credit": "2"},
+        {"subject": name, "grade": "A", "credit": "2"},
+        {"subject": name, "grade": "＊", "credit": "2"},
+    ]
+    average, matches = calculate_gpa(grades, hisshu.matcher)
+    assert average == 8
+    assert [m["grade"] for m in matches.values()] == ["A"]
+
+
+def test_no_hisshu_subjects_gives_zero(hisshu):
+    students = [[{"subject": "一般教養科目", "grade": "A+", "credit": "2"}], []]
+    assert [calculate_gpa(g, hisshu.matcher)[0] for g in students] == [0, 0]
+    points, credits = grade_matrix(students, hisshu.matcher)
+    assert batch_gpa(points, credits, weight_vector(hisshu.matcher)).tolist() == [0.0, 0.0]
+
+
+@pytest.mark.parametrize("subject", [
+    "数学A1（線形代数）　総合機械(1)",  # half-width on the grade page, full-width in hisshu.csv
+    "数学Ａ１（線形代数）　総合機械(1)",
+    "ｴﾝｼﾞﾆｱﾘﾝｸﾞﾒｶﾆｸｽ",
+    "理工学基礎実験１Ａ 01",
+    "Communication Strategies 2",
+    "機械力学",
+    "",
+])
+def test_matcher_matches_nested_loop_on_real_list(hisshu, subject):
+    assert hisshu.matcher.match_index(subject) == reference_match_index(hisshu.subjects, subject)
+
+
+def test_matcher_matches_nested_loop_on_overlapping_names():
+    # Names that are prefixes, suffixes and substrings of each other, in an order where the first listed must win
+    subjects = [{"name": n, "weight": 1.0} for n in ["演習B", "数学A1", "数学A", "学A", "A1", "ab", "bab", "b"]]
+    matcher = HisshuMatcher(subjects)
+    rng = random.Random(0)
+    alphabet = "数学演習AB1ab　"
+    for _ in range(3000):
+        subject = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+        assert matcher.match_index(subject) == reference_match_index(subjects, subject), subject
+
+
+def test_matcher_cache_does_not_change_results(hisshu):
+    subjects = [f"{h['name']} {i}" for i, h in enumerate(hisshu.subjects)] * 2
+    first = [hisshu.matcher.match_index(s) for s in subjects]
+    assert first == [hisshu.matcher.match_index(s) for s in subjects]
+    assert first == [reference_match_index(hisshu.subjects, s) for s in subjects]
@@ -0,0 +1,84 @@
+"""HTTPモード（ログイン後をrequestsで辿る経路）を、ローカルのフィクスチャサーバーに対して通しで確認する
+
+メニュー → SAMLの自動送信フォーム → 成績照会（検索条件）→ 表示 → 成績一覧 の順にサーバーを辿り、
+fetch_grade_page_http と extract_from_html の結果が golden.json と一致することを見る。
+"""
+import pytest
+
+from extraction import extract_from_html, grades_from_rows
+from http_session import http_pool
+from main import fetch_grade_page_http
+
+SESSION_COOKIE = "portal_session=ok"
+
+# The portal answers the first visit with the form a browser would auto-submit by JavaScript
+SAML_HANDOFF = """<html><body onload="document.forms[0].submit()">
+<form method="post" action="/saml/acs">
+  <input type="hidden" name="SAMLResponse" value="PHNhbWw+">
+  <input type="hidden" name="RelayState" value="/portal/menu">
+  <noscript><input type="submit" value="Continue"></noscript>
+</form>
+</body></html>"""
+
+MENU = """<html><head><meta charset="utf-8"></head><body>
+<a href="/portal/other">お知らせ</a>
+<a href="javascript:void(0)" onclick="window.open('/kyomu/epb2051.htm', 'grade')">成績照会</a>
+</body></html>"""
+
+LOGIN = "<html><body>login</body></html>"
+
+
+@pytest.fixture
+def portal(local_server, fixture_html):
+    def app(request):
+        logged_in = SESSION_COOKIE in request.cookie
+        if request.method == "GET" and request.path == "/portal/menu":
+            return 200, MENU if logged_in else SAML_HANDOFF
+        if request.method == "GET" and request.path == "/kyomu/epb2051.htm" and logged_in:
+            return 200, fixture_html("grades_search.html")
+        if request.method == "POST" and request.path == "/saml/acs" and request.form.get("SAMLResponse"):
+            return 200, MENU, {"Set-Cookie": f"{SESSION_COOKIE}; Path=/"}
+        if request.method == "POST" and request.path == "/kyomu/epb2051.htm" and logged_in and request.form.get("HID_P8"):
+            return 200, fixture_html("grades_list.html")
+        return 403, LOGIN
+
+    return local_server(app)
+
+
+@pytest.fixture
+def http():
+    session = http_pool.acquire()
+    try:
+        yield session
+    finally:
+        http_pool.release(session)
+
+
+def test_grade_page_through_saml_handoff(portal, http, golden):
+    html_content = fetch_grade_page_http(http, menu_url=f"{portal.url}/portal/menu", grade_url=f"{portal.url}/unused")
+    page = extract_from_html(html_content, "http")
+
+    assert page.list_found
+    assert not page.on_search_page
+    assert grades_from_rows(page.rows) == golden["grades_list.html"]["grades"]
+
+    assert [(r.method, r.path) for r in portal.requests] == [
+        ("GET", "/portal/menu"),
+        ("POST", "/saml/acs"),
+        # The grade link is taken from the menu's window.open(), not the fallback grade_url
+        ("GET", "/kyomu/epb2051.htm"),
+        ("POST", "/kyomu/epb2051.htm"),
+    ]
+    # The auto-post form is submitted with its hidden fields, the display form with the search conditions
+    assert portal.requests[1].form == {"SAMLResponse": "PHNhbWw+", "RelayState": "/portal/menu"}
+    assert portal.requests[3].form == {"nendo": "2024", "HID_P8": "1X24B044"}
+
+
+def test_grade_page_falls_back_to_known_url(portal, http):
+    # Already logged in and the menu has no grade link: the configured grade URL is used
+    http.cookies.set("portal_session", "ok")
+    html_content = fetch_grade_page_http(
+        http, menu_url=f"{portal.url}/portal/other", grade_url=f"{portal.url}/kyomu/epb2051.htm")
+
+    assert extract_from_html(html_content, "http").list_found
+    assert [r.path for r in portal.requests] == ["/portal/other", "/kyomu/epb2051.htm", "/kyomu/epb2051.htm"]
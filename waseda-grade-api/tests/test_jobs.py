@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobStore
+from lab_pipeline import LabPipeline
+
+
+def events(job):
+    return [(e["event"], e.get("phase") or e.get("status") or e.get("state")) for e in job.events]
+
+
+def wait_done(job):
+    for _ in range(200):
+        if job.done:
+            return
+        time.sleep(0.01)
+    pytest.fail("job did not finish")
+
+
+def test_job_finishes_after_lab_fetch_outcome():
+    pipeline = LabPipeline(concurrency=1, retries=0)
+    release = threading.Event()
+
+    def run(job, deferred):
+        job.set_phase("login")
+        deferred.add_task(pipeline.submit, "1X24B044", lambda deadline: release.wait(), on_done=job.set_lab_fetch)
+        return {"status": "success"}, 200
+
+    job = JobStore().submit(run)
+    time.sleep(0.1)
+    # The result is out while the lab fetch is still running
+    assert job.result == {"status": "success"}
+    assert not job.done
+    assert job.snapshot()["phase"] == "lab_fetch"
+    assert job.snapshot()["lab_fetch"] == "pending"
+
+    release.set()
+    wait_done(job)
+    pipeline.shutdown()
+    assert job.lab_fetch == "succeeded"
+    assert events(job) == [
+        ("queued", None), ("phase", "login"), ("result", "succeeded"),
+        ("phase", "lab_fetch"), ("lab_fetch", "succeeded"), ("finished", "succeeded"),
+    ]
+
+
+def test_lab_fetch_failure_is_reported_on_the_job():
+    pipeline = LabPipeline(concurrency=1, retries=0)
+
+    def broken(deadline):
+        raise ValueError("no lab question")
+
+    def run(job, deferred):
+        deferred.add_task(pipeline.submit, "1X24B044", broken, on_done=job.set_lab_fetch)
+        return {"status": "success"}, 200
+
+    job = JobStore().submit(run)
+    wait_done(job)
+    pipeline.shutdown()
+    # The grades were returned, so the job itself still succeeded
+    assert job.state == "succeeded"
+    assert job.lab_fetch == "failed"
+    assert pipeline.stats()["failed"] == 1
+
+
+def test_job_without_lab_fetch_finishes_with_result():
+    job = JobStore().submit(lambda job, deferred: ({"status": "error"}, 401))
+    wait_done(job)
+    assert job.lab_fetch is None
+    assert events(job)[-2:] == [("result", "failed"), ("finished", "failed")]
+
+
+def test_unknown_phase_is_rejected():
+    job = JobStore().submit(lambda job, deferred: job.set_phase("lab_tab"))
+    wait_done(job)
+    assert job.status_code == 500
@@ -0,0 +1,164 @@
+"""研究室志望の取得（Cookieを引き継いだHTTPでのMoodleのSAML認証と、Chromeへのフォールバック）を
+ローカルのフィクスチャサーバーに対して確認する"""
+import threading
+
+import pytest
+
+import main
+from http_session import cookies_to_driver
+
+MOODLE_COOKIE = "MoodleSession=ok"
+IDP_COOKIE = "idp=signed-in"
+
+MOODLE_LOGIN = """<html><body><h2>Log in to the site</h2>
+<a class="btn login-identityprovider-btn" href="/auth/saml2/login.php?wants=/mod/quiz/view.php">Waseda University Login</a>
+</body></html>"""
+
+SAML_HANDOFF = """<html><body onload="document.forms[0].submit()">
+<form method="post" action="/auth/saml2/sp/saml2-acs.php"><input type="hidden" name="SAMLResponse" value="PHNhbWw+"></form>
+</body></html>"""
+
+QUIZ = """<html><body>
+<a href="/mod/quiz/review.php?attempt=101&amp;cmid=5">レビュー</a>
+<a href="/mod/quiz/review.php?attempt=205&amp;cmid=5">レビュー</a>
+</body></html>"""
+
+
+def redirect(location, headers=None):
+    return 303, "", {"Location": location, **(headers or {})}
+
+
+class Moodle:
+    def __init__(self, fixture_html):
+        self.fixture_html = fixture_html
+        # Whether the identity provider accepts the handed-off session (False: sends the user back to the login)
+        self.idp_accepts = True
+        self.saved = []
+        self.server = None
+
+    @property
+    def paths_seen(self):
+        return [r.path for r in self.server.requests]
+
+    def __call__(self, request):
+        if request.method == "POST":
+            if request.path == "/auth/saml2/sp/saml2-acs.php":
+                return redirect("/mod/quiz/view.php", {"Set-Cookie": f"{MOODLE_COOKIE}; Path=/"})
+            return 404, "not found"
+        if MOODLE_COOKIE not in request.cookie:
+            if request.path == "/auth/saml2/login.php" and IDP_COOKIE in request.cookie and self.idp_accepts:
+                return 200, SAML_HANDOFF
+            if request.path == "/login/index.php":
+                return 200, MOODLE_LOGIN
+            return redirect("/login/index.php")
+        if request.path == "/mod/quiz/view.php":
+            return 200, QUIZ
+        if request.path == "/mod/quiz/review.php":
+            # The newest attempt has the lab question
+            return 200, self.fixture_html("review_lab.html" if request.query["attempt"] == "205" else "review_no_lab.html")
+        return 404, "not found"
+
+
+@pytest.fixture
+def moodle(local_server, fixture_html, monkeypatch):
+    site = Moodle(fixture_html)
+    site.server = local_server(site)
+    monkeypatch.setattr(main, "load_kenkyushitu_url", lambda: f"{site.server.url}/mod/quiz/view.php?id=5")
+    monkeypatch.setattr(main, "save_lab_preferences",
+                        lambda student_id, preferences: site.saved.append((student_id, preferences)))
+    return site
+
+
+def handed_off_cookies():
+    # What cookies_from_driver exports after the Microsoft / portal login: the identity provider session
+    return [{"name": "idp", "value": "signed-in", "domain": "127.0.0.1", "path": "/", "secure": False,
+             "httpOnly": True, "expires": -1, "sameSite": "Lax"}]
+
+
+def test_saml_handoff_over_http(moodle, golden):
+    preferences = main.fetch_kenkyushitu_with_cookies(handed_off_cookies(), "1X24B044")
+
+    assert preferences == golden["review_lab.html"]["lab_preferences"]
+    assert moodle.saved == [("1X24B044", preferences)]
+    # Login page -> SAML link -> auto-posted assertion -> quiz page -> newest review first
+    assert moodle.paths_seen[:5] == [
+        "/mod/quiz/view.php", "/login/index.php", "/auth/saml2/login.php",
+        "/auth/saml2/sp/saml2-acs.php", "/mod/quiz/view.php",
+    ]
+    assert moodle.paths_seen[5] == "/mod/quiz/review.php"
+
+
+def test_failed_handoff_raises_without_browser_fallback(moodle):
+    moodle.idp_accepts = False
+    with pytest.raises(main.ReviewAuthError):
+        main.fetch_kenkyushitu_with_cookies(handed_off_cookies(), "1X24B044")
+    assert moodle.saved == []
+
+
+def test_failed_handoff_falls_back_to_chrome(moodle, monkeypatch):
+    moodle.idp_accepts = False
+    calls = []
+
+    def in_browser(cookies, student_id, deadline):
+        calls.append((cookies, student_id))
+        return {"第1希望": "石井研"}
+
+    monkeypatch.setattr(main, "fetch_kenkyushitu_in_browser", in_browser)
+    assert main.fetch_kenkyushitu_with_cookies(handed_off_cookies(), "1X24B044", browser_fallback=True) == {"第1希望": "石井研"}
+    assert calls == [(handed_off_cookies(), "1X24B044")]
+
+
+def test_no_browser_fallback_when_disabled(moodle, monkeypatch):
+    # LAB_BROWSER_FALLBACKS=0 (or a one-Chrome pool): the failed hand-off is reported instead
+    moodle.idp_accepts = False
+    monkeypatch.setattr(main, "_browser_fallbacks", None)
+    monkeypatch.setattr(main, "fetch_kenkyushitu_in_browser", lambda *args: pytest.fail("fell back to Chrome"))
+    with pytest.raises(main.ReviewAuthError):
+        main.fetch_kenkyushitu_with_cookies(handed_off_cookies(), "1X24B044", browser_fallback=True)
+
+
+def test_browser_fallbacks_leave_chrome_for_grades(monkeypatch):
+    # With every fallback slot taken, another fallback gives up without waiting on the Chrome pool
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(main, "_browser_fallbacks", slots)
+    monkeypatch.setattr(main, "LAB_BROWSER_CHECKOUT_TIMEOUT", 0.05)
+    monkeypatch.setattr(main.chrome_pool, "acquire", lambda timeout=None: pytest.fail("took a Chrome session"))
+    with pytest.raises(TimeoutError):
+        main.fetch_kenkyushitu_in_browser(handed_off_cookies(), "1X24B044")
+    assert main.POOL_SIZE > main.LAB_BROWSER_FALLBACKS
+
+
+def test_network_errors_are_not_sent_to_chrome(monkeypatch):
+    # Retrying network errors is lab_pipeline's job; only a refused login goes to the browser
+    monkeypatch.setattr(main, "load_kenkyushitu_url", lambda: "http://127.0.0.1:9/mod/quiz/view.php")
+    monkeypatch.setattr(main, "fetch_kenkyushitu_in_browser", lambda *args: pytest.fail("fell back to Chrome"))
+    with pytest.raises(main.requests.RequestException):
+        main.fetch_kenkyushitu_with_cookies(handed_off_cookies(), "1X24B044", browser_fallback=True)
+
+
+class FakeDriver:
+    def __init__(self):
+        self.commands = []
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.commands.append((cmd, params))
+
+
+def test_cookies_to_driver_sets_every_domain_through_cdp():
+    driver = FakeDriver()
+    cookies = handed_off_cookies() + [
+        {"name": "ESTSAUTH", "value": "x", "domain": ".login.microsoftonline.com", "path": "/", "secure": True,
+         "httpOnly": True, "expires": 1900000000.5, "size": 9, "session": False},
+        {"name": "JSESSIONID", "value": "y", "domain": "coursereg.waseda.jp", "path": "/portal", "expiry": 1900000000},
+    ]
+    cookies_to_driver(driver, cookies)
+
+    assert driver.commands == [("Network.setCookies", {"cookies": [
+        {"name": "idp", "value": "signed-in", "domain": "127.0.0.1", "path": "/", "secure": False, "httpOnly": True,
+         "sameSite": "Lax"},
+        {"name": "ESTSAUTH", "value": "x", "domain": ".login.microsoftonline.com", "path": "/", "secure": True,
+         "httpOnly": True, "expires": 1900000000.5},
+        {"name": "JSESSIONID", "value": "y", "domain": "coursereg.waseda.jp", "path": "/portal", "secure": False,
+         "httpOnly": False, "expires": 1900000000},
+    ]})]
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import main
+from lab_pipeline import DeadlineExceeded, LabPipeline, time_left
+
+
+def run_one(pipeline, func):
+    outcomes = []
+    pipeline.submit("1X24B044", func, on_done=outcomes.append)
+    for _ in range(200):
+        if outcomes:
+            break
+        time.sleep(0.01)
+    pipeline.shutdown()
+    return outcomes
+
+
+def test_network_errors_are_retried():
+    attempts = []
+
+    def flaky(deadline):
+        attempts.append(deadline)
+        if len(attempts) < 3:
+            raise requests.ConnectionError("reset")
+
+    pipeline = LabPipeline(concurrency=1, retries=2, retry_delay=0.01)
+    assert run_one(pipeline, flaky) == ["succeeded"]
+    assert pipeline.stats()["retries"] == 2
+    # Every attempt gets the same job deadline
+    assert len(set(attempts)) == 1
+
+
+def test_pool_exhaustion_is_not_retried():
+    attempts = []
+
+    def busy(deadline):
+        attempts.append(1)
+        raise TimeoutError("No Chrome session available within 10s")
+
+    pipeline = LabPipeline(concurrency=1, retries=2, retry_delay=0.01)
+    assert run_one(pipeline, busy) == ["failed"]
+    assert len(attempts) == 1
+    assert pipeline.stats()["retries"] == 0
+
+
+def test_deadline_passing_inside_an_attempt_expires_the_job():
+    def slow(deadline):
+        time.sleep(0.1)
+        time_left(deadline, 20)
+
+    pipeline = LabPipeline(concurrency=1, deadline=0.05, retries=2, retry_delay=0.01)
+    assert run_one(pipeline, slow) == ["expired"]
+    assert pipeline.stats()["retries"] == 0
+
+
+def test_time_left_caps_waits_at_the_deadline():
+    assert time_left(None, 20) == 20
+    assert time_left(time.monotonic() + 60, 20) == 20
+    assert time_left(time.monotonic() + 1, 20) <= 1
+    with pytest.raises(DeadlineExceeded):
+        time_left(time.monotonic() - 1, 20)
+
+
+def test_browser_fallback_waits_no_longer_than_the_deadline(monkeypatch):
+    timeouts = []
+
+    def acquire(timeout=None):
+        timeouts.append(timeout)
+        raise TimeoutError("No Chrome session available")
+
+    monkeypatch.setattr(main, "_browser_fallbacks", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(main.chrome_pool, "acquire", acquire)
+    with pytest.raises(TimeoutError):
+        main.fetch_kenkyushitu_in_browser([], "1X24B044", deadline=time.monotonic() + 0.5)
+    assert timeouts and timeouts[0] <= 0.5
@@ -0,0 +1,130 @@
+"""migrate_hashes をsqlite（%s を ? に置き換える薄いアダプター経由）に対して実行する"""
+import hashlib
+import sqlite3
+
+import pytest
+
+import migrate_hashes
+
+
+def sha(student_id):
+    return hashlib.sha256(student_id.encode()).hexdigest()
+
+
+class Cursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        return self._cursor.execute(query.replace("%s", "?"), tuple(params))
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    """migrate() が閉じても同じデータベースを使い続けられるように、closeでは閉じない"""
+
+    def __init__(self, db):
+        self._db = db
+
+    def cursor(self):
+        return Cursor(self._db.cursor())
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE gpadata (id INTEGER PRIMARY KEY, student_id VARCHAR(64) UNIQUE, avg_gpa FLOAT)")
+    rows = [(f"1X24B{i:03d}", 6 + i / 100) for i in range(1, 26)]
+    # Already hashed elsewhere: the unhashed 1X24B003 / 1X24B020 rows are duplicates of these
+    rows += [(sha("1X24B003"), 9.0), (sha("1X24B020"), 9.5)]
+    conn.executemany("INSERT INTO gpadata (student_id, avg_gpa) VALUES (?, ?)", rows)
+    conn.commit()
+    monkeypatch.setattr(migrate_hashes, "get_db_connection", lambda: Connection(conn))
+    yield conn
+    conn.close()
+
+
+def table(conn):
+    return dict(conn.execute("SELECT student_id, avg_gpa FROM gpadata").fetchall())
+
+
+def expected():
+    result = {sha(f"1X24B{i:03d}"): 6 + i / 100 for i in range(1, 26)}
+    # The existing hashed row wins over the unhashed duplicate
+    result[sha("1X24B003")] = 9.0
+    result[sha("1X24B020")] = 9.5
+    return result
+
+
+def test_migrates_in_batches_and_merges_duplicates(db, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint")
+    state = migrate_hashes.migrate(batch_size=4, checkpoint_path=checkpoint)
+
+    assert table(db) == expected()
+    assert (state["scanned"], state["updated"], state["merged"]) == (27, 23, 2)
+    assert not (tmp_path / "checkpoint").exists()
+
+    # A second run finds nothing left to do
+    state = migrate_hashes.migrate(batch_size=4, checkpoint_path=checkpoint)
+    assert (state["updated"], state["merged"]) == (0, 0)
+
+
+def test_resumes_from_checkpoint_after_interrupt(db, tmp_path, monkeypatch):
+    checkpoint = str(tmp_path / "checkpoint")
+    real_batch = migrate_hashes.migrate_batch
+    calls = []
+
+    def interrupted_batch(cursor, rows):
+        calls.append(rows[0][0])
+        if len(calls) == 3:
+            # Ctrl-C in the middle of the third batch, after some of its statements ran
+            real_batch(cursor, rows)
+            raise KeyboardInterrupt
+        return real_batch(cursor, rows)
+
+    monkeypatch.setattr(migrate_hashes, "migrate_batch", interrupted_batch)
+    state = migrate_hashes.migrate(batch_size=4, checkpoint_path=checkpoint)
+    assert state["last_id"] == 8
+    # The interrupted batch was rolled back
+    assert db.execute("SELECT student_id FROM gpadata WHERE id = 9").fetchone()[0] == "1X24B009"
+    assert migrate_hashes.load_checkpoint(checkpoint)["last_id"] == 8
+
+    monkeypatch.setattr(migrate_hashes, "migrate_batch", real_batch)
+    calls.clear()
+    state = migrate_hashes.migrate(batch_size=4, checkpoint_path=checkpoint)
+    assert table(db) == expected()
+    assert (state["scanned"], state["updated"], state["merged"]) == (27, 23, 2)
+
+
+def test_restart_ignores_checkpoint(db, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint")
+    migrate_hashes.save_checkpoint(checkpoint, {"last_id": 20, "scanned": 20, "updated": 0, "merged": 0})
+    migrate_hashes.migrate(batch_size=4, checkpoint_path=checkpoint, restart=True)
+    assert table(db) == expected()
+
+
+def test_dry_run_rolls_back(db, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint")
+    before = table(db)
+    state = migrate_hashes.migrate(batch_size=4, checkpoint_path=checkpoint, dry_run=True, sample_batches=2)
+
+    assert state["scanned"] == 8
+    assert table(db) == before
+    assert not (tmp_path / "checkpoint").exists()
@@ -0,0 +1,36 @@
+"""parsers.py の全てのバックエンドが、benchmarks/fixtures/ のページについて golden.json
+（以前の、html.parserでページ全体を解析する実装の出力）と同じ結果を返すことを確認する"""
+import json
+
+import pytest
+
+from bench_parsers import GOLDEN_PATH, backend_outputs, load_fixtures, reference_outputs
+from parsers import PARSERS
+
+FIXTURES = load_fixtures()
+
+with open(GOLDEN_PATH, encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+
+def test_every_fixture_has_golden_output():
+    assert sorted(FIXTURES) == sorted(GOLDEN)
+
+
+@pytest.mark.parametrize("backend", sorted(PARSERS))
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_backend_matches_golden(backend, name):
+    # Round-trip through JSON so the comparison matches what golden.json can hold
+    actual = json.loads(json.dumps(backend_outputs(PARSERS[backend](), FIXTURES[name]), ensure_ascii=False))
+    assert actual == GOLDEN[name]
+
+
+@pytest.mark.parametrize("name", sorted(FIXTURES))
+def test_golden_is_reference_output(name):
+    # golden.json must be what the reference parsers produce, so it cannot drift from a hand edit
+    assert json.loads(json.dumps(reference_outputs(FIXTURES[name]), ensure_ascii=False)) == GOLDEN[name]
+
+
+def test_lxml_and_strainer_backends_are_available():
+    # lxml is in requirements.txt, so CI always compares both backends
+    assert set(PARSERS) == {"bs4", "lxml"}
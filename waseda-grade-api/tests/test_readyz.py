@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import main
+
+
+@pytest.fixture
+def started(monkeypatch):
+    monkeypatch.setattr(main.startup_report, "status", lambda stage: ("ok", None))
+    monkeypatch.setattr(main, "READYZ_DB_TIMEOUT", 0.2)
+
+
+async def get_readyz():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get("/readyz")
+
+
+def test_ready_when_database_answers(started, monkeypatch):
+    monkeypatch.setattr(main, "ping_db", lambda timeout: None)
+    response = asyncio.run(get_readyz())
+    assert response.status_code == 200
+    assert response.json()["checks"]["database_ping"] == {"status": "ok"}
+
+
+def test_not_ready_when_database_is_down(started, monkeypatch):
+    def ping(timeout):
+        raise ConnectionError("Can't connect to MySQL server")
+
+    monkeypatch.setattr(main, "ping_db", ping)
+    response = asyncio.run(get_readyz())
+    assert response.status_code == 503
+    assert response.json()["checks"]["database_ping"] == {"status": "failed", "error": "Can't connect to MySQL server"}
+
+
+def test_not_ready_when_database_hangs(started, monkeypatch):
+    monkeypatch.setattr(main, "ping_db", lambda timeout: time.sleep(1))
+    started_at = time.monotonic()
+    response = asyncio.run(get_readyz())
+    assert time.monotonic() - started_at < 1
+    assert response.status_code == 503
+    assert response.json()["checks"]["database_ping"]["status"] == "failed"
+
+
+def test_startup_stages_come_first(monkeypatch):
+    monkeypatch.setattr(main.startup_report, "status", lambda stage: ("pending", None))
+    monkeypatch.setattr(main, "ping_db", lambda timeout: pytest.fail("pinged before startup finished"))
+    response = asyncio.run(get_readyz())
+    assert response.status_code == 503
+    assert "database_ping" not in response.json()["checks"]
@@ -0,0 +1,89 @@
+"""recalc_gpa の差分再計算を、sqlite（MySQLの構文を置き換える薄いアダプター経由）に対して実行する"""
+import re
+import sqlite3
+
+import pytest
+
+import grade_store
+import recalc_gpa
+from hisshu import HisshuSnapshot
+
+OLD = HisshuSnapshot.from_text("name,重み\n線形代数,1\n")
+NEW = HisshuSnapshot.from_text("name,重み\n線形代数,1\n微分積分,2\n")
+
+
+def to_sqlite(query):
+    query = query.replace("%s", "?").replace("INSERT IGNORE", "INSERT OR IGNORE")
+    query = query.replace(" FOR UPDATE", "").replace("<=>", "IS")
+    query = query.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT(student_id) DO UPDATE SET")
+    return re.sub(r"VALUES\((\w+)\)", r"excluded.\1", query)
+
+
+class Cursor:
+    def __init__(self, db, after_fetch=None):
+        self._cursor = db.cursor()
+        self._after_fetch = after_fetch
+
+    def execute(self, query, params=()):
+        self._cursor.execute(to_sqlite(query), tuple(params))
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(to_sqlite(query), rows)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        rows = self._cursor.fetchmany(size)
+        if rows and self._after_fetch:
+            self._after_fetch()
+        return rows
+
+
+def grades(*subjects):
+    return grade_store.encode_grades([{"subject": s, "grade": "A", "credit": 2} for s in subjects])
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE gpadata (student_id VARCHAR(64) PRIMARY KEY, avg_gpa FLOAT, timestamp DATETIME)")
+    conn.execute("CREATE TABLE gradedata (student_id VARCHAR(64) PRIMARY KEY, grades BLOB, matched TEXT, "
+                 "hisshu_version VARCHAR(16), updated_at DATETIME)")
+    conn.execute("CREATE TABLE hisshu_versions (version VARCHAR(16) PRIMARY KEY, content TEXT, created_at DATETIME)")
+    conn.execute("INSERT INTO hisshu_versions VALUES (?, ?, NULL)", (OLD.version, OLD.text))
+    conn.executemany("INSERT INTO gradedata VALUES (?, ?, ?, ?, NULL)", [
+        ("a", grades("線形代数", "微分積分"), "線形代数", OLD.version),
+        ("b", grades("線形代数", "微分積分"), "線形代数", OLD.version),
+        ("c", grades("線形代数"), "線形代数", None),
+    ])
+    conn.executemany("INSERT INTO gpadata VALUES (?, 1.0, NULL)", [("a",), ("b",), ("c",)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def run(db, after_fetch=None):
+    return recalc_gpa._recalc_incremental(Cursor(db, after_fetch), db, Cursor(db), NEW, full=False)
+
+
+def test_recomputes_rows_on_old_versions(db):
+    assert run(db) == (3, 0, 0, 0)
+    assert db.execute("SELECT COUNT(*) FROM gradedata WHERE hisshu_version = ?", (NEW.version,)).fetchone() == (3,)
+    assert db.execute("SELECT matched FROM gradedata WHERE student_id = 'a'").fetchone() == ("線形代数\n微分積分",)
+    assert dict(db.execute("SELECT student_id, avg_gpa FROM gpadata")) == {"a": 8.0, "b": 8.0, "c": 8.0}
+
+
+def test_rows_rewritten_during_the_scan_keep_the_servers_result(db):
+    def server_saves_b():
+        # The server saved new grades for b (and its GPA) after this scan had read the row
+        db.execute("UPDATE gradedata SET grades = ?, hisshu_version = ? WHERE student_id = 'b'",
+                   (grades("線形代数"), NEW.version))
+        db.execute("UPDATE gpadata SET avg_gpa = 3.5 WHERE student_id = 'b'")
+
+    assert run(db, server_saves_b) == (2, 0, 0, 1)
+    assert dict(db.execute("SELECT student_id, avg_gpa FROM gpadata")) == {"a": 8.0, "b": 3.5, "c": 8.0}
+    assert db.execute("SELECT matched FROM gradedata WHERE student_id = 'b'").fetchone() == ("線形代数",)
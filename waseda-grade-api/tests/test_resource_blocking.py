@@ -0,0 +1,43 @@
+import pytest
+
+import resource_blocking
+from resource_blocking import ResourcePolicy
+
+
+@pytest.fixture
+def policy():
+    return ResourcePolicy(mode="enforce", resource_types=["Image", "Font"], deny_patterns=["*clarity.ms*"],
+                          allow_patterns=["https://cdn.example/keep.png"])
+
+
+@pytest.mark.parametrize("url, blocked", [
+    ("https://x.example/logo.png", True),
+    ("https://x.example/logo.png?v=3", True),
+    ("https://x.example/font.woff2", True),
+    ("https://x.example/favicon.ico", True),
+    ("https://www.clarity.ms/tag/abc", True),
+    # Extension patterns are anchored, so these only contain the substring
+    ("https://x.example/icons/menu.js", False),
+    ("https://x.example/a.svgz", False),
+    ("https://x.example/view?format=png", False),
+    ("https://x.example/pngs/index.html", False),
+    ("https://cdn.example/keep.png", False),
+])
+def test_would_block(policy, url, blocked):
+    assert policy.would_block(url) is blocked
+
+
+class FakeOptions:
+    def __init__(self):
+        self.capabilities = {}
+
+    def set_capability(self, name, value):
+        self.capabilities[name] = value
+
+
+@pytest.mark.parametrize("mode, logged", [("enforce", False), ("measure", True), ("off", False)])
+def test_performance_log_only_when_measuring(monkeypatch, mode, logged):
+    monkeypatch.setattr(resource_blocking.policy, "mode", mode)
+    options = FakeOptions()
+    resource_blocking.configure_options(options)
+    assert ("goog:loggingPrefs" in options.capabilities) is logged
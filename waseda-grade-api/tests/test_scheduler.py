@@ -0,0 +1,31 @@
+import pytest
+
+from scheduler import QueueFullError, ScrapeScheduler
+
+
+def admit_all(scheduler, attempts):
+    tickets = []
+    for _ in range(attempts):
+        try:
+            tickets.append(scheduler.admit())
+        except QueueFullError:
+            pass
+    return tickets
+
+
+def test_queue_is_bounded_before_jobs_start():
+    # Tickets that have not reached a slot yet still count, so a burst cannot grow the queue past the limit
+    scheduler = ScrapeScheduler(max_concurrency=2, queue_size=3, adaptive=False)
+    assert len(admit_all(scheduler, 20)) == 2 + 3
+    assert scheduler.stats()["rejected"] == 15
+
+
+def test_no_queue_admits_only_free_slots():
+    scheduler = ScrapeScheduler(max_concurrency=1, queue_size=0, adaptive=False)
+    ticket = scheduler.admit()
+    with pytest.raises(QueueFullError):
+        scheduler.admit()
+    with scheduler.run(ticket):
+        with pytest.raises(QueueFullError):
+            scheduler.admit()
+    assert scheduler.admit() is not None
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+
+from selenium.common.exceptions import (
+    JavascriptException, NoSuchElementException, StaleElementReferenceException, TimeoutException,
+)
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Default timeout budget (seconds) for each step of the scrape flow.
+# Override with WAIT_BUDGETS="login_entry=10,grade_page=20"
+DEFAULT_BUDGETS = {
+    "login_entry": 10,
+    "login_redirect": 20,
+    "ms_email": 20,
+    "ms_password": 20,
+    "ms_stay_signed_in": 10,
+    "portal_redirect": 20,
+    "menu": 20,
+    "grade_window": 20,
+    "grade_page": 20,
+    "grade_list": 15,
+    "lab_page": 15,
+    "lab_saml_button": 15,
+    "lab_saml": 20,
+    "lab_quiz_page": 10,
+    "lab_review": 10,
+}
+DEFAULT_POLL = 0.2
+# Exceptions that just mean "the page is still changing" while polling
+IGNORED_EXCEPTIONS = (NoSuchElementException, StaleElementReferenceException, JavascriptException)
+
+
+def _load_budgets():
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in os.environ.get("WAIT_BUDGETS", "").split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        try:
+            budgets[name.strip()] = float(value)
+        except ValueError:
+            print(f"[WAIT] Ignoring invalid budget: {item}")
+    return budgets
+
+
+BUDGETS = _load_budgets()
+
+
+# --- Predicates (callables taking the driver, returning a truthy value when satisfied) ---
+
+def url_contains(*fragments):
+    return lambda d: any(f in d.current_url for f in fragments)
+
+
+def url_excludes(*fragments):
+    def _check(d):
+        url = d.current_url.lower()
+        return url != "about:blank" and not any(f in url for f in fragments)
+    return _check
+
+
+def document_ready():
+    return lambda d: d.execute_script("return document.readyState") == "complete"
+
+
+def element_present(by, value):
+    def _check(d):
+        elements = d.find_elements(by, value)
+        return elements[0] if elements else False
+    return _check
+
+
+def text_present(*texts):
+    """ページ本文にいずれかの文字列が含まれているか"""
+    # Check in the page so each poll returns a boolean instead of the whole body text
+    script = "const t = document.body ? document.body.innerText : ''; return arguments[0].some((s) => t.includes(s));"
+    return lambda d: bool(d.execute_script(script, list(texts)))
+
+
+def all_of(*predicates):
+    def _check(d):
+        result = True
+        for p in predicates:
+            result = p(d)
+            if not result:
+                return False
+        return result
+    return _check
+
+
+def any_of(*predicates):
+    def _check(d):
+        for p in predicates:
+            result = p(d)
+            if result:
+                return result
+        return False
+    return _check
+
+
+# --- Aggregated statistics across scrapes (exposed via /metrics) ---
+
+class WaitStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._steps = {}
+
+    def record(self, step, elapsed, ok):
+        with self._lock:
+            s = self._steps.setdefault(step, {"count": 0, "timeouts": 0, "total": 0.0, "max": 0.0})
+            s["count"] += 1
+            s["total"] += elapsed
+            s["max"] = max(s["max"], elapsed)
+            if not ok:
+                s["timeouts"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                step: {
+                    "count": s["count"],
+                    "timeouts": s["timeouts"],
+                    "avg_seconds": round(s["total"] / s["count"], 3),
+                    "max_seconds": round(s["max"], 3),
+                }
+                for step, s in self._steps.items()
+            }
+
+
+wait_stats = WaitStats()
+
+
+class WaitEngine:
+    """ページが期待した状態になった時点で次に進む待機レイヤー（ステップ毎に待ち時間を記録）"""
+
+    def __init__(self, driver, label="SCRAPE", budgets=None):
+        self.driver = driver
+        self.label = label
+        self.budgets = budgets or BUDGETS
+        self.records = []
+
+    def until(self, step, condition, timeout=None, required=False):
+        """conditionが真になるまで待つ。タイムアウト時はrequiredならTimeoutException、そうでなければNoneを返す"""
+        budget = timeout if timeout is not None else self.budgets.get(step, 10)
+        started = time.monotonic()
+        try:
+            result = WebDriverWait(
+                self.driver, budget, poll_frequency=DEFAULT_POLL, ignored_exceptions=IGNORED_EXCEPTIONS
+            ).until(condition)
+            ok = True
+        except TimeoutException:
+            result = None
+            ok = False
+        elapsed = time.monotonic() - started
+        self.records.append({"step": step, "seconds": round(elapsed, 3), "budget": budget, "ok": ok})
+        wait_stats.record(step, elapsed, ok)
+        if not ok:
+            print(f"[{self.label}] Wait '{step}' timed out after {budget}s (URL: {self.driver.current_url})")
+            if required:
+                raise TimeoutException(f"Wait '{step}' timed out after {budget}s")
+        return result
+
+    def total_seconds(self):
+        return round(sum(r["seconds"] for r in self.records), 3)
+
+    def summary(self):
+        steps = ", ".join(f"{r['step']}={r['seconds']:.2f}s{'' if r['ok'] else '(timeout)'}" for r in self.records)
+        return f"[{self.label}] Waited {self.total_seconds():.2f}s total: {steps}"